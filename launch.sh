@@ -1,50 +1,116 @@
 #!/bin/bash
 
-KITTY="/usr/local/kitty/kitty/launcher/kitty"
+KITTY=${KITTY:-"/usr/local/kitty/kitty/launcher/kitty"}
 
-DEBUG=0
-LOG_RPC=0
-LAUNCHED=1
-USE_RIGOL=1
-USE_PIPWMM=1
-SHOW_CAMERA=1
-CAMERA_DEVICE=4
-PIPWM_PORT=34962
-CAMERA_PORT=33761
-TEXTUAL_PORT=33962
-CONFIG_FILE="window.conf"
-TEXTUAL_TITLE="TextWindow"
-CAMERA_TITLE="CameraWindow"
-CAMERA_CMD="python -m tgutui camera_window"
-TEXTUAL_CMD="python -m tgutui textual_window"
+# Every setting can be overridden from the environment, such as SIM_CAMERA=1 ./launch.sh
+DEBUG=${DEBUG:-0}
+LOG_RPC=${LOG_RPC:-0}
+LOG_RATE=${LOG_RATE:-20}
+LOG_QUEUE=${LOG_QUEUE:-10000}
+LAUNCHED=${LAUNCHED:-1}
+USE_RIGOL=${USE_RIGOL:-1}
+USE_PIPWM=${USE_PIPWM:-1}
+HOST_MEASURE=${HOST_MEASURE:-0}
+SHOW_CAMERA=${SHOW_CAMERA:-1}
+BACKGROUND=${BACKGROUND:-"camera"}
+SCREEN_INTERVAL_MS=${SCREEN_INTERVAL_MS:-1000}
+CAMERA_DEVICE=${CAMERA_DEVICE:-4}
+CAMERA_DEVICES=${CAMERA_DEVICES:-""}
+STREAM_PORT=${STREAM_PORT:-0}
+PIPWM_PORT=${PIPWM_PORT:-34962}
+CAMERA_PORT=${CAMERA_PORT:-33761}
+TEXTUAL_PORT=${TEXTUAL_PORT:-33962}
+CONFIG_FILE=${CONFIG_FILE:-"window.conf"}
+INSTRUMENTS_FILE=${INSTRUMENTS_FILE:-"instruments.json"}
+RECORD_DIR=${RECORD_DIR:-""}
+RECORD_ROWS=${RECORD_ROWS:-1000000}
+RECORD_ROLL_S=${RECORD_ROLL_S:-3600}
+VIDEO_DIR=${VIDEO_DIR:-"$HOME/tgutui_video"}
+VIDEO_QUEUE=${VIDEO_QUEUE:-30}
+SWEEP_INTERVAL_MS=${SWEEP_INTERVAL_MS:-20}
+CAPTURE_DIR=${CAPTURE_DIR:-"$HOME/tgutui_capture"}
+REPLAY_DIR=${REPLAY_DIR:-""}
+REPLAY_VIDEO=${REPLAY_VIDEO:-""}
+REPLAY_SPEED=${REPLAY_SPEED:-1}
+# Both windows replay from this wall time in ms, a few seconds ahead so both have started
+REPLAY_WALL=${REPLAY_WALL:-$(( $(date +%s) * 1000 + 3000 ))}
+SIM_CAMERA=${SIM_CAMERA:-0}
+SIM_SCOPE_PORT=${SIM_SCOPE_PORT:-5555}
+SIM_LATENCY_MS=${SIM_LATENCY_MS:-0}
+SIM_JITTER_MS=${SIM_JITTER_MS:-0}
+HEADLESS_OUTPUT=${HEADLESS_OUTPUT:-""}
+HEADLESS_FLUSH_MS=${HEADLESS_FLUSH_MS:-100}
+HEADLESS_QUEUE=${HEADLESS_QUEUE:-10000}
+HEADLESS_INTERVAL_MS=${HEADLESS_INTERVAL_MS:-1}
+HEADLESS_CAMERA=${HEADLESS_CAMERA:-0}
+TRACE=${TRACE:-0}
+BENCH_FILE=${BENCH_FILE:-"bench.json"}
+BENCH_SECONDS=${BENCH_SECONDS:-3}
+BENCH_TOLERANCE_PCT=${BENCH_TOLERANCE_PCT:-10}
+TEXTUAL_TITLE=${TEXTUAL_TITLE:-"TextWindow"}
+CAMERA_TITLE=${CAMERA_TITLE:-"CameraWindow"}
+CAMERA_CMD=${CAMERA_CMD:-"python -m tgutui camera_window"}
+TEXTUAL_CMD=${TEXTUAL_CMD:-"python -m tgutui textual_window"}
 
-RIGOL_IP="127.0.0.1"
 RIGOLFILE="$HOME/rigolip.txt"
-if test -f "$RIGOLFILE"; then
+if test -z "$RIGOL_IP" && test -f "$RIGOLFILE"; then
     RIGOL_IP=`cat $RIGOLFILE`
 fi
+RIGOL_IP=${RIGOL_IP:-"127.0.0.1"}
 
-PIPWM_IP="127.0.0.1"
 PIPWMFILE="$HOME/pipwmip.txt"
-if test -f "$PIPWMFILE"; then
+if test -z "$PIPWM_IP" && test -f "$PIPWMFILE"; then
     PIPWM_IP=`cat $PIPWMFILE`
 fi
+PIPWM_IP=${PIPWM_IP:-"127.0.0.1"}
 
 export CAMERA_CMD=$CAMERA_CMD
 export TEXTUAL_CMD=$TEXTUAL_CMD
 export TEXTUAL_TITLE=$TEXTUAL_TITLE
 export CAMERA_DEVICE=$CAMERA_DEVICE
+export CAMERA_DEVICES=$CAMERA_DEVICES
+export STREAM_PORT=$STREAM_PORT
 export CAMERA_TITLE=$CAMERA_TITLE
 export TEXTUAL_PORT=$TEXTUAL_PORT
 export CAMERA_PORT=$CAMERA_PORT
 export SHOW_CAMERA=$SHOW_CAMERA
+export BACKGROUND=$BACKGROUND
+export SCREEN_INTERVAL_MS=$SCREEN_INTERVAL_MS
 export USE_RIGOL=$USE_RIGOL
+export HOST_MEASURE=$HOST_MEASURE
 export RIGOL_IP=$RIGOL_IP
 export PIPWM_PORT=$PIPWM_PORT
 export USE_PIPWM=$USE_PIPWM
 export PIPWM_IP=$PIPWM_IP
 export LAUNCHED=$LAUNCHED
+export INSTRUMENTS_FILE=$INSTRUMENTS_FILE
+export RECORD_DIR=$RECORD_DIR
+export RECORD_ROWS=$RECORD_ROWS
+export RECORD_ROLL_S=$RECORD_ROLL_S
+export VIDEO_DIR=$VIDEO_DIR
+export VIDEO_QUEUE=$VIDEO_QUEUE
+export SWEEP_INTERVAL_MS=$SWEEP_INTERVAL_MS
+export CAPTURE_DIR=$CAPTURE_DIR
+export REPLAY_DIR=$REPLAY_DIR
+export REPLAY_VIDEO=$REPLAY_VIDEO
+export REPLAY_SPEED=$REPLAY_SPEED
+export REPLAY_WALL=$REPLAY_WALL
+export SIM_CAMERA=$SIM_CAMERA
+export SIM_SCOPE_PORT=$SIM_SCOPE_PORT
+export SIM_LATENCY_MS=$SIM_LATENCY_MS
+export SIM_JITTER_MS=$SIM_JITTER_MS
+export HEADLESS_OUTPUT=$HEADLESS_OUTPUT
+export HEADLESS_FLUSH_MS=$HEADLESS_FLUSH_MS
+export HEADLESS_QUEUE=$HEADLESS_QUEUE
+export HEADLESS_INTERVAL_MS=$HEADLESS_INTERVAL_MS
+export HEADLESS_CAMERA=$HEADLESS_CAMERA
+export TRACE=$TRACE
+export BENCH_FILE=$BENCH_FILE
+export BENCH_SECONDS=$BENCH_SECONDS
+export BENCH_TOLERANCE_PCT=$BENCH_TOLERANCE_PCT
 export LOG_RPC=$LOG_RPC
+export LOG_RATE=$LOG_RATE
+export LOG_QUEUE=$LOG_QUEUE
 export DEBUG=$DEBUG
 
 HOLD=""
@@ -0,0 +1,64 @@
+"""
+Measure the call latency of the PiPwm JSON-RPC server.
+
+Run it on the Pi zero against the local server to see the server's own
+cost, or from the PC to include the Wi-Fi round trip
+
+    python bench.py [host] [port] [calls] [clients]
+"""
+
+import sys
+import time
+import statistics
+from threading import Thread
+from jsonrpclib import Server
+
+
+def bench(address: str, method: str, args: tuple, calls: int) -> list[float]:
+    server = Server(address)
+    times = []
+    for _ in range(calls):
+        began = time.perf_counter()
+        getattr(server, method)(*args)
+        times.append((time.perf_counter() - began) * 1000)
+    return times
+
+
+def report(name: str, times: list[float], elapsed: float):
+    times = sorted(times)
+    p50 = times[len(times) // 2]
+    p99 = times[min(int(len(times) * 0.99), len(times) - 1)]
+    print(
+        f"{name:<10} calls {len(times):>5} "
+        f"mean {statistics.mean(times):7.2f}ms p50 {p50:7.2f}ms p99 {p99:7.2f}ms "
+        f"max {times[-1]:7.2f}ms {len(times) / elapsed:7.1f}/s"
+    )
+
+
+def concurrent(address: str, method: str, args: tuple, calls: int, clients: int):
+    results: list[list[float]] = [[] for _ in range(clients)]
+
+    def run(index: int):
+        results[index] = bench(address, method, args, calls)
+
+    threads = [Thread(target=run, args=(index,)) for index in range(clients)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report(f"{method} x{clients}", [t for result in results for t in result], time.perf_counter() - began)
+
+
+if __name__ == "__main__":
+    host = sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1"
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 34962
+    calls = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    clients = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+    address = f"http://{host}:{port}"
+
+    state = Server(address).get_state()
+    for method, args in [("get_state", ()), ("set", (state["freq"], state["duty"]))]:
+        began = time.perf_counter()
+        report(method, bench(address, method, args, calls), time.perf_counter() - began)
+    concurrent(address, "get_state", (), calls, clients)
@@ -6,51 +6,279 @@ also have to be set in the /boot/config.txt file.
 
 It is a simple JSON-RPC server that listens for duty cycle changes 
 and updates the PWM signal accordingly.
+
+A whole profile can also be sent in one call with run_profile and run
+on the Pi against its own clock, for example
+
+    {"type": "ramp", "target": "freq", "start": 1, "stop": 100, "step": 0.5, "interval": 0.01}
+    {"type": "steps", "points": [{"freq": 10, "duty": 50, "hold": 0.5}, {"duty": 20, "hold": 1}]}
+    {"type": "sequence", "points": [...], "repeat": 0}
+
+Frequencies are in KHz like change_frequency, a sequence repeats the
+points repeat times or until stop_profile when repeat is 0.
+profile_status reports the progress and how late each setpoint was applied.
+
+Requests are served on a thread each. set changes the frequency and duty
+together without the PWM dropping to zero in between, and get_state
+returns the current settings so a client can resync after a restart.
 """
 
+import os
+import math
 import time
-from threading import Thread
+import logging
+from socketserver import ThreadingMixIn
+from threading import Thread, Event, Lock
 from rpi_hardware_pwm import HardwarePWM
 from jsonrpclib.SimpleJSONRPCServer import SimpleJSONRPCServer
 
+
+class ThreadedJSONRPCServer(ThreadingMixIn, SimpleJSONRPCServer):
+    daemon_threads = True
+
+
+class RateLimit(logging.Filter):
+    """ Let each log call site through at most once per interval, counting what was dropped """
+
+    def __init__(self, interval: float = 1.0):
+        super().__init__()
+        self._interval = interval
+        self._last: dict[tuple, float] = {}
+        self._dropped: dict[tuple, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        if now - self._last.get(key, 0.0) < self._interval:
+            self._dropped[key] = self._dropped.get(key, 0) + 1
+            return False
+        self._last[key] = now
+        dropped = self._dropped.pop(key, 0)
+        if dropped:
+            record.msg = f"{record.msg} ({dropped} similar suppressed)"
+        return True
+
+def check(freq: float | None, duty: float | None):
+    """ Raise ValueError for a setting the PWM can not output, None leaves it unchanged """
+    if freq is not None and freq <= 0:
+        raise ValueError("Frequency must be greater than 0")
+    if duty is not None and not 0 <= duty <= 100:
+        raise ValueError("Duty cycle must be between 0 and 100")
+
+
+class Profile:
+    def __init__(self, profile: dict):
+        self.kind = profile.get("type", "steps")
+        self.repeat = int(profile.get("repeat", 1)) if self.kind == "sequence" else 1
+        self.points: list[tuple[float, float | None, float | None]] = []
+        if self.kind == "ramp":
+            target = profile.get("target", "freq")
+            start, stop = float(profile["start"]), float(profile["stop"])
+            step = float(profile.get("step", 1))
+            if step <= 0:
+                raise ValueError("Ramp step must be greater than 0")
+            interval = float(profile.get("interval", 0.1))
+            sign = 1 if stop >= start else -1
+            # Floored so the last point never goes past stop, the epsilon keeps an exact stop
+            count = math.floor(abs(stop - start) / step + 1e-9) + 1
+            for index in range(count):
+                value = start + sign * index * step
+                freq = value if target == "freq" else None
+                duty = value if target == "duty" else None
+                self.points.append((index * interval, freq, duty))
+            self.duration = count * interval
+        else:
+            offset = 0.0
+            for point in profile.get("points", []):
+                self.points.append((offset, point.get("freq"), point.get("duty")))
+                offset += float(point.get("hold", 0.1))
+            self.duration = offset
+        if not self.points:
+            raise ValueError("Profile has no points")
+        for _, freq, duty in self.points:
+            check(freq, duty)
+        if self.repeat == 0 and self.duration <= 0:
+            raise ValueError("A repeating sequence must hold its points for some time")
+
+    @property
+    def total(self) -> int:
+        return len(self.points) * self.repeat if self.repeat else -1
+
+
 class PiPwm: 
+    # The sysfs directory of the PWM channel rpi_hardware_pwm exports
+    PWM_DIR = "/sys/class/pwm/pwmchip{chip}/pwm{channel}"
+
     def __init__(self):
         self._port = 34962
         self._ip = '0.0.0.0'
         self._running = False
         self._server: SimpleJSONRPCServer = None
         self._pwm = HardwarePWM(pwm_channel=0, hz=1000, chip=0)
+        self._pwm_dir = PiPwm.PWM_DIR.format(chip=0, channel=0)
+        self._freq = 1.0
+        self._duty = 10.0
+        # Guards the PWM output and which profile is running, requests are served on a thread each
+        self._lock = Lock()
         self._thread: Thread = None
+        self._profile_thread: Thread = None
+        self._profile_stop = Event()
+        self._status: dict = {"running": False}
     
     def start(self):
-        self._server = SimpleJSONRPCServer(
+        self._server = ThreadedJSONRPCServer(
             (self._ip, self._port),
-            logRequests=True,
+            logRequests=False,
         )
         self._thread = Thread(target=self._server.serve_forever, daemon=True)
         self._server.register_function(self.change_duty)
         self._server.register_function(self.change_frequency)
+        self._server.register_function(self.set)
+        self._server.register_function(self.get_state)
+        self._server.register_function(self.run_profile)
+        self._server.register_function(self.stop_profile)
+        self._server.register_function(self.profile_status)
         self._server.register_function(self.stop)
         self._running = True
         self._thread.start()
-        self._pwm.start(10)
+        self._pwm.start(self._duty)
+
+    def _write(self, name: str, value: int):
+        """ Write one attribute of the PWM channel """
+        with open(os.path.join(self._pwm_dir, name), "w") as f:
+            f.write(str(value))
+
+    def _set(self, freq: float, duty: float):
+        """
+        Change the frequency in KHz and the duty cycle together, called with the lock held.
+        The duty cycle can never be longer than the period, so whichever of the two shrinks
+        is written first and the output never drops to zero in between.
+        """
+        old_period = int(1e9 / (self._freq * 1000))
+        period = int(1e9 / (freq * 1000))
+        duty_ns = int(period * duty / 100)
+        if period >= old_period:
+            self._write("period", period)
+            self._write("duty_cycle", duty_ns)
+        else:
+            self._write("duty_cycle", duty_ns)
+            self._write("period", period)
+        self._freq = freq
+        self._duty = duty
+
+    def set(self, freq: float, duty: float) -> dict:
+        """ Change the frequency in KHz and the duty cycle together """
+        check(freq, duty)
+        with self._lock:
+            self._set(freq, duty)
+        logging.info(f"Set {freq}KHz {duty}%")
+        return self.get_state()
+
+    def get_state(self) -> dict:
+        return {
+            "freq": self._freq,
+            "duty": self._duty,
+            "running": self._running,
+            "profile": self._status.get("running", False),
+        }
 
     def change_duty(self, duty: int):
-        print(f"Changing duty cycle to {duty}")
-        self._pwm.change_duty_cycle(duty)
+        self.set(self._freq, duty)
 
     def change_frequency(self, freq: int):
-        print(f"Changing duty frequency to {freq * 1000}Hertz")
-        self._pwm.change_frequency(freq*1000)
+        self.set(freq, self._duty)
+
+    def _apply(self, stop: Event, freq: float | None, duty: float | None) -> bool:
+        """ Apply a profile setpoint unless its profile was stopped, return False if it was """
+        freq = self._freq if freq is None else freq
+        duty = self._duty if duty is None else duty
+        check(freq, duty)
+        with self._lock:
+            if stop.is_set():
+                return False
+            self._set(freq, duty)
+        return True
+
+    def _run_profile(self, profile: Profile, stop: Event, status: dict):
+        started = time.perf_counter()
+        late_total = 0.0
+        passes = 0
+        try:
+            while not stop.is_set():
+                for offset, freq, duty in profile.points:
+                    # Every setpoint is due at a fixed offset from the start so delays never accumulate
+                    due = started + offset
+                    delay = due - time.perf_counter()
+                    if delay > 0 and stop.wait(delay):
+                        break
+                    if not self._apply(stop, freq, duty):
+                        break
+                    late = time.perf_counter() - due
+                    late_total += late
+                    status["index"] += 1
+                    status["late_mean_ms"] = late_total / status["index"] * 1000
+                    status["late_max_ms"] = max(status["late_max_ms"], late * 1000)
+                    status["elapsed"] = time.perf_counter() - status["began"]
+                passes += 1
+                if profile.repeat and passes >= profile.repeat:
+                    break
+                started += profile.duration
+        except Exception as e:
+            status["error"] = str(e)
+            logging.error(f"Profile failed {e}")
+        status["elapsed"] = time.perf_counter() - status["began"]
+        status["running"] = False
+        logging.info(f"Profile finished {status}")
+
+    def run_profile(self, profile: dict) -> dict:
+        profile = Profile(profile)
+        stop = Event()
+        with self._lock:
+            previous = self._stop_profile()
+            self._profile_stop = stop
+            self._status = {
+                "running": True,
+                "kind": profile.kind,
+                "index": 0,
+                "total": profile.total,
+                "elapsed": 0.0,
+                "late_mean_ms": 0.0,
+                "late_max_ms": 0.0,
+                "began": time.perf_counter(),
+            }
+            self._profile_thread = Thread(target=self._run_profile, args=(profile, stop, self._status), daemon=True)
+            self._profile_thread.start()
+        logging.info(f"Running {profile.kind} profile of {len(profile.points)} points")
+        # The previous profile no longer writes once its event is set under the lock
+        if previous:
+            previous.join()
+        return self.profile_status()
+
+    def _stop_profile(self) -> Thread | None:
+        """ Stop the running profile, called with the lock held, return its thread to join """
+        self._profile_stop.set()
+        thread, self._profile_thread = self._profile_thread, None
+        return thread
+
+    def stop_profile(self) -> dict:
+        with self._lock:
+            thread = self._stop_profile()
+        if thread:
+            thread.join()
+        return self.profile_status()
+
+    def profile_status(self) -> dict:
+        return {k: v for k, v in self._status.items() if k != "began"}
 
     def stop(self):
+        self.stop_profile()
         self._running = False
         self._server.shutdown()
         time.sleep(0.2)
         self._thread.join()
 
     def run(self):
-        print("Listening for duty cycle changes...")
+        logging.info("Listening for duty cycle changes...")
         while self._running:
             time.sleep(1)
 
@@ -63,6 +291,9 @@ class PiPwm:
 
 
 if __name__ == "__main__":
+    handler = logging.StreamHandler()
+    handler.addFilter(RateLimit())
+    logging.basicConfig(level=logging.INFO, handlers=[handler], format="%(asctime)s %(message)s")
     try:
         with PiPwm() as p:
             p.run()
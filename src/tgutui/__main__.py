@@ -1,26 +1,110 @@
-""" This file starts either the3 Textual or Camera window """
+"""
+This file starts either the Textual or Camera window, a characterisation sweep,
+the simulators, headless acquisition or the benchmarks. Each role imports only what it needs.
+"""
 
 import sys
 import logging
 from tgutui.kit import Kit
-from tgutui.camera_window import CameraWindow
-from tgutui.textual_window import TextualWindow
+
+
+def camera_window():
+    from tgutui.camera_window import CameraWindow
+    Kit.create_log(file="camera_window.log")
+    with CameraWindow() as window:
+        window.display()
+
+
+def textual_window():
+    from tgutui.textual_window import TextualWindow
+    Kit.create_log(file="textual_window.log")
+    window = TextualWindow()
+    try:
+        window.run()
+    except (KeyboardInterrupt, Exception) as e:
+        logging.error(f"{e}")
+        window.stop()
+        window.exit()
+    if not Kit.DEBUG:
+        Kit.close_window()
+
+
+def sweep():
+    from tgutui.registry import Registry
+    from tgutui.sweep import Sweep, grid
+    Kit.create_log(file="sweep.log")
+    registry = Registry.load(Kit.INSTRUMENTS_FILE)
+    if not registry.pwms or not registry.scopes:
+        logging.error("A sweep needs a PWM and a scope")
+        sys.exit(1)
+    run = Sweep(
+        registry.pwms[0],
+        registry.scopes[0],
+        freqs=grid(Kit.SWEEP_FREQS),
+        duties=grid(Kit.SWEEP_DUTIES),
+        path=Kit.SWEEP_FILE,
+        window=Kit.SWEEP_WINDOW,
+        threshold=Kit.SWEEP_TOLERANCE_PCT / 100,
+    )
+    registry.start()
+    try:
+        run.run()
+    except KeyboardInterrupt:
+        run.cancelled = True
+    finally:
+        registry.stop()
+    if run.cancelled:
+        sys.exit(1)
+
+
+def sim():
+    from tgutui import sim
+    Kit.create_log(file="sim.log")
+    sim.serve(
+        pwm_port=Kit.PIPWM_PORT,
+        scope_port=Kit.SIM_SCOPE_PORT,
+        latency=Kit.SIM_LATENCY_MS / 1000,
+        jitter=Kit.SIM_JITTER_MS / 1000,
+    )
+
+
+def headless():
+    from tgutui.headless import Headless
+    from tgutui.registry import Registry
+    Kit.create_log(file="headless.log")
+    registry = Registry.load(Kit.INSTRUMENTS_FILE)
+    # Nothing waits on a display so the scopes poll as fast as HEADLESS_INTERVAL_MS allows
+    for scope in registry.scopes:
+        scope.interval = max(Kit.HEADLESS_INTERVAL_MS, 1) / 1000
+    camera = None
+    if Kit.HEADLESS_CAMERA:
+        from tgutui.camera import Camera
+        capture = None
+        if Kit.SIM_CAMERA:
+            from tgutui.sim import Delay, SimCapture
+            capture = SimCapture(delay=Delay(Kit.SIM_LATENCY_MS / 1000, Kit.SIM_JITTER_MS / 1000))
+        camera = Camera(capture)
+    Headless(registry, camera).run()
+
+
+def bench():
+    from tgutui import bench
+    Kit.create_log(file="bench.log")
+    sys.exit(bench.main(sys.argv))
+
+
+ROLES = {
+    "camera_window": camera_window,
+    "textual_window": textual_window,
+    "sweep": sweep,
+    "sim": sim,
+    "headless": headless,
+    "bench": bench,
+}
 
 
 if __name__ == "__main__":
-    if "camera_window" in sys.argv:
-        Kit.create_log(file="camera_window.log")
-        with CameraWindow() as window:
-            window.display()
-
-    if "textual_window" in sys.argv:
-        Kit.create_log(file="textual_window.log")
-        window = TextualWindow()
-        try:
-            window.run()
-        except (KeyboardInterrupt, Exception) as e:
-            logging.error(f"{e}")
-            window.stop()
-            window.exit()
-        if not Kit.DEBUG:
-            Kit.close_window()
+    Kit.parse_args(sys.argv)
+    for name, role in ROLES.items():
+        if name in sys.argv:
+            role()
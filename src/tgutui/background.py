@@ -0,0 +1,196 @@
+import os
+import math
+import functools
+import time
+import zlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable
+from threading import Thread
+
+import cv2
+import numpy as np
+
+import tgutui
+from tgutui.kit import Kit
+from tgutui.camera import Camera
+from tgutui.timing import metrics
+
+
+class Background(ABC):
+    """ A source of background images for the camera window """
+
+    # The image last returned by update
+    frame: np.ndarray | None = None
+    # Write the image to its path, off when only the stream shows it
+    save: bool = True
+
+    @abstractmethod
+    def update(self) -> str | None:
+        """
+        Return the path of a new image to show, or None if nothing changed.
+        The image is only written to the path when save is set.
+        """
+
+    def open(self):
+        """ Open the source """
+
+    def close(self):
+        """ Close the source """
+
+
+class CameraBackground(Background):
+    """ The webcam as a background source """
+
+    def __init__(self, camera: Camera) -> None:
+        self._camera = camera
+
+    def update(self) -> str | None:
+        """ Save the newest camera frame, None if no new frame came """
+        frame = self._camera.save() if self.save else self._camera.read()
+        if frame is None:
+            return None
+        self.frame = frame
+        return Camera.OUTPUT
+
+
+class ScopeBackground(Background):
+    """
+    The scope's own display as a background source.
+    The bitmap is fetched on a thread at most once per SCREEN_INTERVAL and it is only
+    decoded and written when its bytes change. fetch returns the PNG bytes, the camera
+    window asks the textual window for them so the scope keeps its one connection.
+    """
+    OUTPUT: str = f"{tgutui.__path__[0]}/scope.png"
+
+    def __init__(self, fetch: Callable[[], bytes | None], width: int = 0, height: int = 0) -> None:
+        self._fetch_screen = fetch
+        self._size = (int(width), int(height))
+        self._crc: int | None = None
+        self._fresh = threading.Event()
+        self._running = False
+        self._thread: Thread = None
+
+    def _fetch(self):
+        """ Fetch the screen until closed """
+        interval = Kit.SCREEN_INTERVAL_MS / 1000
+        while self._running:
+            started = time.time()
+            try:
+                bitmap = self._fetch_screen()
+                if bitmap:
+                    self._decode(bitmap)
+            except Exception as e:
+                logging.error(f"Scope screen: {e}")
+            time.sleep(max(interval - (time.time() - started), 0))
+
+    def _decode(self, bitmap: bytes):
+        """ Decode and save the bitmap, unless it is the one already shown """
+        crc = zlib.crc32(bitmap)
+        if crc == self._crc:
+            return
+        image = cv2.imdecode(np.frombuffer(bitmap, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            logging.warning("Unable to decode scope screen")
+            return
+        if all(self._size):
+            image = cv2.resize(image, self._size, interpolation=cv2.INTER_AREA)
+        if self.save:
+            cv2.imwrite(ScopeBackground.OUTPUT, image)
+        self.frame = image
+        self._crc = crc
+        self._fresh.set()
+
+    def update(self) -> str | None:
+        """ Return the saved screen once each time it changes """
+        if not self._fresh.wait(timeout=0.1):
+            return None
+        self._fresh.clear()
+        return ScopeBackground.OUTPUT
+
+    def open(self):
+        """ Start fetching """
+        self._running = True
+        self._thread = Thread(target=self._fetch, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """ Stop fetching """
+        self._running = False
+        if self._thread:
+            self._thread.join()
+        self._thread = None
+
+
+class TiledBackground(Background):
+    """
+    Several cameras as one background. Each camera's capture thread hands over its
+    latest frame, the frames are tiled into a canvas allocated once and written as
+    one image, so a single kitty update shows every view.
+    """
+    OUTPUT: str = f"{tgutui.__path__[0]}/tiled.png"
+
+    def __init__(self, cameras: list[Camera]) -> None:
+        self._cameras = cameras
+        self._frames: list[np.ndarray | None] = [None] * len(cameras)
+        self._counts = [0] * len(cameras)
+        self._shown = [0] * len(cameras)
+        self._fresh = threading.Event()
+        self._subscribers: list[Callable[[np.ndarray], None]] = []
+        self.columns = math.ceil(math.sqrt(len(cameras)))
+        self.rows = math.ceil(len(cameras) / self.columns)
+        self._tile = (0, 0)
+        self._canvas: np.ndarray = np.zeros((0, 0, 3), dtype=np.uint8)
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """ The width and height of the tiled image """
+        return self._canvas.shape[1], self._canvas.shape[0]
+
+    def _received(self, index: int, frame: np.ndarray):
+        """ Keep the latest frame of one camera, called on that camera's capture thread """
+        self._frames[index] = frame
+        self._counts[index] += 1
+        self._fresh.set()
+
+    def _place(self, index: int, frame: np.ndarray):
+        """ Copy a frame into its tile, resizing it only when its size differs """
+        height, width = self._tile
+        if frame.shape[:2] != (height, width):
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        row, column = divmod(index, self.columns)
+        self._canvas[row * height:(row + 1) * height, column * width:(column + 1) * width] = frame
+
+    def update(self) -> str | None:
+        """ Tile the frames that changed and save the image """
+        if not self._fresh.wait(timeout=0.1):
+            return None
+        self._fresh.clear()
+        for index, frame in enumerate(self._frames):
+            if frame is not None and self._counts[index] != self._shown[index]:
+                self._shown[index] = self._counts[index]
+                self._place(index, frame)
+        if self.save:
+            with metrics.timed("frame.encode"):
+                cv2.imwrite(TiledBackground.OUTPUT, self._canvas)
+        self.frame = self._canvas
+        return TiledBackground.OUTPUT
+
+    def open(self):
+        """ Size the canvas from the largest camera and take their frames """
+        width = max(int(camera.data.width) for camera in self._cameras)
+        height = max(int(camera.data.height) for camera in self._cameras)
+        self._tile = (height, width)
+        self._canvas = np.zeros((self.rows * height, self.columns * width, 3), dtype=np.uint8)
+        self._subscribers = [functools.partial(self._received, index) for index in range(len(self._cameras))]
+        for camera, subscriber in zip(self._cameras, self._subscribers):
+            camera.subscribers.append(subscriber)
+
+    def close(self):
+        """ Stop taking the cameras' frames """
+        for camera, subscriber in zip(self._cameras, self._subscribers):
+            camera.subscribers.remove(subscriber)
+        self._subscribers = []
+        if os.path.exists(TiledBackground.OUTPUT):
+            os.remove(TiledBackground.OUTPUT)
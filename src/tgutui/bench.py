@@ -0,0 +1,432 @@
+"""
+Benchmarks of the bench pipeline, run against the simulators so no hardware is needed
+
+    python -m tgutui bench                      runs every suite and writes BENCH_FILE
+    python -m tgutui bench compare old.json new.json
+
+A comparison flags every metric that got worse by more than BENCH_TOLERANCE_PCT.
+"""
+
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import platform
+import subprocess
+from typing import Callable
+
+from tgutui.kit import Kit
+
+# The modules that each role imports first
+ROLES = {
+    "camera_window": "tgutui.camera_window",
+    "textual_window": "tgutui.textual_window",
+    "sweep": "tgutui.sweep",
+    "sim": "tgutui.sim",
+}
+# The slow third party packages a role might pull in
+HEAVY = ["cv2", "numpy", "textual", "pyvisa", "jsonrpclib"]
+
+_IMPORT = """
+import sys, json, time
+began = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - began
+print(json.dumps({{"seconds": seconds, "heavy": [name for name in {heavy} if name in sys.modules]}}))
+"""
+
+
+def import_time(module: str) -> dict:
+    """ Import a module in a fresh interpreter, return the time it took and the heavy packages it loaded """
+    code = _IMPORT.format(module=module, heavy=HEAVY)
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_times(repeat: int = 3) -> dict[str, dict]:
+    """ Return the best import time of every role """
+    results = {}
+    for role, module in ROLES.items():
+        try:
+            runs = [import_time(module) for _ in range(repeat)]
+        except subprocess.CalledProcessError as e:
+            results[role] = {"error": e.stderr.strip().splitlines()[-1] if e.stderr else str(e)}
+            continue
+        best = min(runs, key=lambda run: run["seconds"])
+        results[role] = {"seconds": round(best["seconds"], 4), "heavy": best["heavy"]}
+    return results
+
+
+def free_port() -> int:
+    """ Return a local port that is free right now """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(times: list[float], fraction: float) -> float:
+    times = sorted(times)
+    return times[min(int(len(times) * fraction), len(times) - 1)] if times else 0.0
+
+
+class Results:
+    """ Named metrics, each with a unit and whether higher or lower is better """
+
+    def __init__(self) -> None:
+        self.metrics: dict[str, dict] = {}
+        self.errors: dict[str, str] = {}
+
+    def add(self, name: str, value: float, unit: str, better: str = "lower"):
+        self.metrics[name] = {"value": round(value, 4), "unit": unit, "better": better}
+
+    def timings(self, name: str, times: list[float]):
+        """ Add the median and 99th percentile of times in milliseconds """
+        self.add(f"{name}_p50_ms", percentile(times, 0.5), "ms")
+        self.add(f"{name}_p99_ms", percentile(times, 0.99), "ms")
+
+    def run(self, name: str, suite: Callable[["Results"], None]):
+        """ Run a suite, a failing suite is recorded and the others still run """
+        began = time.perf_counter()
+        try:
+            suite(self)
+        except Exception as e:
+            logging.exception(f"Bench: {name}")
+            self.errors[name] = f"{type(e).__name__}: {e}"
+        logging.info(f"Bench: {name} took {time.perf_counter() - began:.1f}s")
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({
+                "time": time.time(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "metrics": self.metrics,
+                "errors": self.errors,
+            }, f, indent=2)
+
+    def report(self):
+        for name, metric in self.metrics.items():
+            print(f"{name:<32} {metric['value']:>12.3f} {metric['unit']}")
+        for name, error in self.errors.items():
+            print(f"{name:<32} failed {error}")
+
+
+def bench_imports(results: Results):
+    for role, result in import_times().items():
+        if "seconds" in result:
+            results.add(f"import_{role}_ms", result["seconds"] * 1000, "ms")
+
+
+class _TimedCapture:
+    """ Times every read of a capture """
+
+    def __init__(self, capture) -> None:
+        self._capture = capture
+        self.reads: list[float] = []
+
+    def read(self):
+        began = time.perf_counter()
+        frame = self._capture.read()
+        self.reads.append((time.perf_counter() - began) * 1000)
+        return frame
+
+    def __getattr__(self, name: str):
+        return getattr(self._capture, name)
+
+
+def bench_camera(results: Results):
+    """ Frames from the synthetic camera through Camera.save to CameraKit.set_background """
+    from tgutui.kit import CameraKit
+    from tgutui.camera import Camera
+    from tgutui.background import CameraBackground
+    from tgutui.sim import SimCapture
+
+    # Far faster than a webcam so the pipeline and not the pacing is measured
+    capture = _TimedCapture(SimCapture(fps=1000))
+    camera = Camera(capture)
+    background = CameraBackground(camera)
+    kit = CameraKit()
+    saves, sets = [], []
+    camera.open()
+    try:
+        began = time.perf_counter()
+        while time.perf_counter() - began < Kit.BENCH_SECONDS:
+            start = time.perf_counter()
+            path = background.update()
+            saved = time.perf_counter()
+            if not path:
+                continue
+            kit.set_background(img_path=path)
+            saves.append((saved - start) * 1000)
+            sets.append((time.perf_counter() - saved) * 1000)
+        elapsed = time.perf_counter() - began
+    finally:
+        camera.close()
+    # The capture thread reads while the frame is written, a write includes waiting for the next frame
+    results.add("camera_fps", len(saves) / elapsed, "fps", "higher")
+    results.timings("frame_read", capture.reads)
+    results.timings("frame_write", saves)
+    results.timings("frame_set_background", sets)
+    results.timings("frame_latency", [save + set_ for save, set_ in zip(saves, sets)])
+
+
+def _viewer(port: int, delay: float, frames: list[int], stop) -> None:
+    """ Read the MJPEG stream, sleeping delay after each frame, counting frames into frames[0] """
+    with socket.create_connection(("127.0.0.1", port)) as s:
+        s.sendall(b"GET /stream.mjpg HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        stream = s.makefile("rb")
+        while not stream.readline().strip() == b"":
+            pass
+        while not stop.is_set():
+            line = stream.readline()
+            if not line:
+                return
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":")[1])
+                stream.readline()
+                stream.read(length)
+                frames[0] += 1
+                time.sleep(delay)
+
+
+def bench_stream(results: Results):
+    """ Publishing camera frames to fast viewers and one slow viewer of the local MJPEG stream """
+    from threading import Thread, Event
+    from tgutui.sim import SimCapture
+    from tgutui.stream import FrameStream
+
+    capture = SimCapture(fps=1000)
+    capture.open()
+    _, frame = capture.read()
+    stream = FrameStream(free_port())
+    stream.open()
+    stop = Event()
+    viewers = [[0] for _ in range(4)]
+    # The last viewer takes 100ms over each frame
+    threads = [
+        Thread(target=_viewer, args=(stream.address[1], 0.1 if index == 3 else 0, counts, stop), daemon=True)
+        for index, counts in enumerate(viewers)
+    ]
+    for thread in threads:
+        thread.start()
+    while stream.clients < len(viewers):
+        time.sleep(0.01)
+    times = []
+    try:
+        began = time.perf_counter()
+        while time.perf_counter() - began < Kit.BENCH_SECONDS:
+            start = time.perf_counter()
+            stream.publish(frame)
+            times.append((time.perf_counter() - start) * 1000)
+            time.sleep(max(1 / 60 - (time.perf_counter() - start), 0))
+        elapsed = time.perf_counter() - began
+    finally:
+        stop.set()
+        stream.close()
+    results.add("stream_publish_fps", len(times) / elapsed, "fps", "higher")
+    results.timings("stream_publish", times)
+    results.add("stream_viewer_fps", min(counts[0] for counts in viewers[:3]) / elapsed, "fps", "higher")
+    results.add("stream_slow_viewer_fps", viewers[3][0] / elapsed, "fps", "higher")
+
+
+def bench_rpc(results: Results):
+    """ Round trips of Rpc.request between two local servers """
+    from threading import Thread
+    from tgutui.rpc import Rpc
+
+    port = free_port()
+    server = Rpc(server=port, client=0)
+    server.register(lambda: True, "ping")
+    Thread(target=server.connect, daemon=True).start()
+    server.check_started()
+    client = Rpc(server=0, client=port)
+    times = []
+    try:
+        began = time.perf_counter()
+        while time.perf_counter() - began < Kit.BENCH_SECONDS:
+            start = time.perf_counter()
+            client.request("ping")
+            times.append((time.perf_counter() - start) * 1000)
+    finally:
+        server.disconnect()
+    results.timings("rpc_rtt", times)
+
+
+class _Sims:
+    """ A simulated Pi and scope on free ports, with the Kit pointed at them """
+
+    def __init__(self) -> None:
+        from tgutui import sim
+        signal = sim.SimSignal()
+        delay = sim.Delay(Kit.SIM_LATENCY_MS / 1000, Kit.SIM_JITTER_MS / 1000)
+        self.pwm = sim.SimPwm(signal, port=free_port(), delay=delay)
+        self.scope = sim.SimScope(signal, port=free_port(), delay=delay)
+        self.resource = f"TCPIP::127.0.0.1::{self.scope.address[1]}::SOCKET"
+
+    def __enter__(self) -> "_Sims":
+        self.pwm.start()
+        self.scope.start()
+        self._kit = (Kit.USE_RIGOL, Kit.USE_PIPWM, Kit.RIGOL_IP, Kit.PIPWM_IP, Kit.PIPWM_PORT, Kit.INSTRUMENTS_FILE)
+        Kit.USE_RIGOL, Kit.USE_PIPWM = True, True
+        Kit.RIGOL_IP, Kit.PIPWM_IP, Kit.PIPWM_PORT = self.resource, "127.0.0.1", self.pwm.address[1]
+        Kit.INSTRUMENTS_FILE = ""
+        return self
+
+    def __exit__(self, *_):
+        Kit.USE_RIGOL, Kit.USE_PIPWM, Kit.RIGOL_IP, Kit.PIPWM_IP, Kit.PIPWM_PORT, Kit.INSTRUMENTS_FILE = self._kit
+        self.pwm.stop()
+        self.scope.stop()
+
+
+def bench_rigol(results: Results):
+    """ The rate Rigol.update reaches against the simulated scope """
+    from tgutui.rigol import Rigol
+
+    with _Sims() as sims:
+        rigol = Rigol(ip=sims.resource)
+        rigol.connect()
+        try:
+            count, times = 0, []
+            began = time.perf_counter()
+            while time.perf_counter() - began < Kit.BENCH_SECONDS:
+                start = time.perf_counter()
+                rigol.update()
+                times.append((time.perf_counter() - start) * 1000)
+                count += 1
+            elapsed = time.perf_counter() - began
+        finally:
+            rigol.disconnect()
+    results.add("rigol_update_hz", count / elapsed, "Hz", "higher")
+    results.timings("rigol_update", times)
+
+
+async def _storm(app, changes: int) -> tuple[float, float]:
+    """ Drag the first duty slider changes times, return the drain time and the worst event loop lag """
+    gaps = []
+    last = time.perf_counter()
+
+    def tick():
+        nonlocal last
+        now = time.perf_counter()
+        gaps.append(now - last)
+        last = now
+
+    async with app.run_test(headless=True) as pilot:
+        await pilot.pause()
+        timer = app.set_interval(0.01, tick)
+        slider = app.pwm_panels[0].pwm_duty_slider
+        began = time.perf_counter()
+        for index in range(changes):
+            slider.value = (index % 10) * 10
+            if index % 10 == 0:
+                await asyncio.sleep(0)
+        await pilot.pause()
+        drained = time.perf_counter() - began
+        timer.stop()
+        app.stop()
+    return drained * 1000, max(gaps, default=0.01) * 1000 - 10
+
+
+def bench_ui(results: Results):
+    """ Responsiveness of the textual window while a PWM slider is dragged back and forth """
+    from tgutui.textual_window import TextualWindow
+
+    ports = (Kit.CAMERA_PORT, Kit.TEXTUAL_PORT)
+    Kit.CAMERA_PORT, Kit.TEXTUAL_PORT = free_port(), free_port()
+    try:
+        with _Sims():
+            changes = 500
+            drained, lag = asyncio.run(_storm(TextualWindow(), changes))
+    finally:
+        Kit.CAMERA_PORT, Kit.TEXTUAL_PORT = ports
+    results.add("ui_storm_ms", drained, "ms")
+    results.add("ui_storm_per_change_ms", drained / changes, "ms")
+    results.add("ui_lag_max_ms", lag, "ms")
+
+
+def bench_startup(results: Results):
+    """ Camera window construction and open with the synthetic camera and a stand-in textual window """
+    from threading import Thread
+    from tgutui.rpc import Rpc
+    from tgutui.camera_window import CameraWindow
+
+    saved = (Kit.CAMERA_PORT, Kit.TEXTUAL_PORT, Kit.SIM_CAMERA, Kit.LAUNCHED, Kit.REPLAY_VIDEO, Kit.BACKGROUND)
+    Kit.CAMERA_PORT, Kit.TEXTUAL_PORT = free_port(), free_port()
+    Kit.SIM_CAMERA, Kit.LAUNCHED, Kit.REPLAY_VIDEO, Kit.BACKGROUND = True, False, "", "camera"
+    textual = Rpc(server=Kit.CAMERA_PORT, client=Kit.TEXTUAL_PORT)
+    textual.register(lambda: True, "textual_ack")
+    textual.register(lambda key, value: None, "update_camera")
+    Thread(target=textual.connect, daemon=True).start()
+    textual.check_started()
+    try:
+        began = time.perf_counter()
+        window = CameraWindow()
+        window.open()
+        results.add("startup_camera_ms", (time.perf_counter() - began) * 1000, "ms")
+        window.close()
+    finally:
+        textual.disconnect()
+        Kit.CAMERA_PORT, Kit.TEXTUAL_PORT, Kit.SIM_CAMERA, Kit.LAUNCHED, Kit.REPLAY_VIDEO, Kit.BACKGROUND = saved
+
+
+SUITES = {
+    "imports": bench_imports,
+    "camera": bench_camera,
+    "stream": bench_stream,
+    "rpc": bench_rpc,
+    "rigol": bench_rigol,
+    "ui": bench_ui,
+    "startup": bench_startup,
+}
+
+
+def run(path: str, suites: list[str] | None = None) -> Results:
+    """ Run the suites, all of them by default, and write the results to path """
+    results = Results()
+    for name, suite in SUITES.items():
+        if not suites or name in suites:
+            results.run(name, suite)
+    results.save(path)
+    results.report()
+    return results
+
+
+def compare(old_path: str, new_path: str, tolerance: float) -> list[str]:
+    """ Print the change of every metric, return the names of those that regressed """
+    with open(old_path) as f:
+        old = json.load(f)["metrics"]
+    with open(new_path) as f:
+        new = json.load(f)["metrics"]
+    regressions = []
+    for name, metric in new.items():
+        if name not in old:
+            continue
+        before, after = old[name]["value"], metric["value"]
+        change = (after - before) / before if before else 0.0
+        worse = -change if metric["better"] == "higher" else change
+        flag = ""
+        if worse > tolerance:
+            regressions.append(name)
+            flag = "REGRESSION"
+        print(f"{name:<32} {before:>12.3f} {after:>12.3f} {metric['unit']:<4} {change * 100:+7.1f}% {flag}")
+    return regressions
+
+
+def main(argv: list[str]) -> int:
+    """ Run or compare benchmarks, return non zero when a comparison regressed """
+    if "compare" in argv:
+        index = argv.index("compare")
+        old_path, new_path = argv[index + 1], argv[index + 2]
+        regressions = compare(old_path, new_path, Kit.BENCH_TOLERANCE_PCT / 100)
+        if regressions:
+            print(f"{len(regressions)} regressions over {Kit.BENCH_TOLERANCE_PCT}%")
+        return 1 if regressions else 0
+    # Logging every request would be measured along with it
+    Kit.LOG_RPC = False
+    suites = [arg for arg in argv if arg in SUITES]
+    results = run(Kit.BENCH_FILE, suites)
+    return 1 if results.errors else 0
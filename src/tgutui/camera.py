@@ -1,18 +1,26 @@
 import os
+import time
 import logging
+import threading
+from threading import Thread
 from typing import Callable
-from dataclasses import dataclass
+from concurrent.futures import Future
+from dataclasses import dataclass, replace
 
 import cv2
+import numpy as np
 from cv2 import VideoCapture
 
 import tgutui
 from tgutui.kit import Kit
+from tgutui.video import VideoRecorder
+from tgutui.timing import tracer, metrics
 
-@dataclass
+@dataclass(frozen=True)
 class CameraData:
     """
-    This is a data class that holds all the camera data
+    A snapshot of the camera data, a new one replaces it on every change
+    so it can be read from any thread
     """
     pan: int = 0
     tilt: int = 0
@@ -22,142 +30,228 @@ class CameraData:
     height: int = 0
     auto_focus: int = 0
 
+@dataclass
+class CameraProfile:
+    """
+    The device of a camera and the size and frame rate to ask it for,
+    zero leaves the camera's own setting
+    """
+    device: int = 0
+    width: int = 0
+    height: int = 0
+    fps: int = 0
+
+    @staticmethod
+    def parse(spec: str) -> list["CameraProfile"]:
+        """ Parse "4:1920x1080@30,6:640x480,8" into one profile per camera """
+        profiles = []
+        for item in spec.split(","):
+            if not item:
+                continue
+            device, _, rest = item.partition(":")
+            size, _, fps = rest.partition("@")
+            width, _, height = size.partition("x")
+            profiles.append(CameraProfile(int(device), int(width or 0), int(height or 0), int(fps or 0)))
+        return profiles
+
+
 class Camera:
     """
-    This class is a wrapper around the OpenCV VideoCapture class
+    This class is a wrapper around the OpenCV VideoCapture class.
+    Once open the VideoCapture is only used by its capture thread, property sets are
+    queued and applied between reads, the newest value of each property winning.
     """
     OUTPUT: str = f"{tgutui.__path__[0]}/camera.png"
+    READ_TIMEOUT: float = 1.0
+    PROPERTIES: dict[str, int] = {
+        "pan": cv2.CAP_PROP_PAN,
+        "tilt": cv2.CAP_PROP_TILT,
+        "zoom": cv2.CAP_PROP_ZOOM,
+        "focus": cv2.CAP_PROP_FOCUS,
+        "width": cv2.CAP_PROP_FRAME_WIDTH,
+        "height": cv2.CAP_PROP_FRAME_HEIGHT,
+        "auto_focus": cv2.CAP_PROP_AUTOFOCUS,
+    }
 
-    def __init__(self) -> None:
-        self._locked: bool = False
-        self._cap: VideoCapture = cv2.VideoCapture()
+    def __init__(self, capture: VideoCapture | None = None, profile: CameraProfile | None = None) -> None:
+        self.profile = profile if profile else CameraProfile(device=Kit.CAMERA_DEVICE)
+        self._cap: VideoCapture = capture if capture is not None else cv2.VideoCapture()
         self._data: CameraData = CameraData()
-        self.fetch_all()
+        self._fps: float = 0
+        self._recorder: VideoRecorder | None = None
+        self._pending: dict[str, tuple[int, list[Future]]] = {}
+        self._commands = threading.Lock()
+        self._frames = threading.Condition()
+        self._frame: np.ndarray | None = None
+        self._count = 0
+        self._returned = 0
+        self._running = False
+        self._thread: Thread | None = None
+        # Called on the capture thread with every new frame, they must return quickly
+        self.subscribers: list[Callable[[np.ndarray], None]] = []
 
     @property
-    def locked(self) -> bool:
-        """ Return the locked status of the camera"""
-        return self._locked
-
-    def fetch_all(self):
-        """ Fetch all the camera data """
-        self.open()
-        self._fetch_focus()
-        self._fetch_tilt()
-        self._fetch_pan()
-        self._fetch_zoom()
-        self._fetch_width()
-        self._fetch_height()
-        self._fetch_auto_focus()
-        self.close()
+    def recorder(self) -> VideoRecorder | None:
+        """ Return the video recorder when recording """
+        return self._recorder
 
     @property
     def data(self) -> CameraData:
-        """ Return the camera data"""
+        """ Return the latest camera data"""
         return self._data
 
-    def lock(fn: Callable):
-        """ Decorator to lock the camera"""
-        def decorate(self, *args, **kwargs):
-            """ Lock the camera """
-            self._locked = True
-            rtn = fn(self, *args, **kwargs)
-            self._locked = False
-            return rtn
-        return decorate
-
-    @lock
-    def _fetch_height(self):
-        """ Fetch the height of the camera"""
-        self._data.height = self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
-
-    @lock
-    def _fetch_width(self):
-        """ Fetch the width of the camera"""
-        self._data.width = self._cap.get(cv2.CAP_PROP_FRAME_WIDTH)
-
-    @lock
-    def _fetch_pan(self):
-        """ Fetch the pan of the camera"""
-        self._data.pan = self._cap.get(cv2.CAP_PROP_PAN)
-
-    @lock
-    def _fetch_tilt(self):
-        """ Fetch the tilt of the camera"""
-        self._data.tilt = self._cap.get(cv2.CAP_PROP_TILT)
-
-    @lock
-    def _fetch_zoom(self):
-        """ Fetch the zoom of the camera"""
-        self._data.zoom = self._cap.get(cv2.CAP_PROP_ZOOM)
-
-    @lock
-    def _fetch_focus(self):
-        """ Fetch the focus of the camera"""
-        self._data.focus = self._cap.get(cv2.CAP_PROP_FOCUS)
-
-    @lock
-    def _fetch_auto_focus(self):
-        """ Fetch the auto focus of the camera"""
-        self._data.auto_focus = self._cap.get(cv2.CAP_PROP_AUTOFOCUS)
-
-    @lock
-    def set_focus(self, value: int):
+    def fetch_all(self):
+        """ Fetch all the camera data from the open camera """
+        self._data = CameraData(**{name: self._cap.get(prop) for name, prop in Camera.PROPERTIES.items()})
+        self._fps = self._cap.get(cv2.CAP_PROP_FPS)
+
+    def set(self, name: str, value: int) -> Future:
+        """ Queue a property set, replacing a value of the same property that is not applied yet """
+        future = Future()
+        with self._commands:
+            _, futures = self._pending.get(name, (value, []))
+            self._pending[name] = (value, futures + [future])
+            running = self._running
+        if not running:
+            self._apply()
+        return future
+
+    def _apply(self):
+        """ Apply the queued property sets, called between reads """
+        with self._commands:
+            pending, self._pending = self._pending, {}
+        for name, (value, futures) in pending.items():
+            metrics.count("camera.merged", len(futures) - 1)
+            try:
+                result = self._cap.set(Camera.PROPERTIES[name], value)
+                self._data = replace(self._data, **{name: value})
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future in futures:
+                future.set_result(result)
+
+    def set_focus(self, value: int) -> Future:
         """ Set the focus of the camera"""
-        self._cap.set(cv2.CAP_PROP_FOCUS, value)
-        self._data.focus = value
+        return self.set("focus", value)
 
-    @lock
-    def set_auto_focus(self, value: int):
+    def set_auto_focus(self, value: int) -> Future:
         """ Set the auto focus of the camera"""
-        self._cap.set(cv2.CAP_PROP_AUTOFOCUS, value)
-        self._data.auto_focus = value
+        return self.set("auto_focus", value)
 
-    @lock
-    def set_pan(self, value: int):
+    def set_pan(self, value: int) -> Future:
         """ Set the pan of the camera"""
-        self._cap.set(cv2.CAP_PROP_PAN, value)
-        self._data.pan = value
+        return self.set("pan", value)
 
-    @lock
-    def set_tilt(self, value: int):
+    def set_tilt(self, value: int) -> Future:
         """ Set the tilt of the camera"""
-        self._cap.set(cv2.CAP_PROP_TILT, value)
-        self._data.tilt = value
+        return self.set("tilt", value)
 
-    @lock
-    def set_zoom(self, value: int):
+    def set_zoom(self, value: int) -> Future:
         """ Set the zoom of the camera"""
-        self._cap.set(cv2.CAP_PROP_ZOOM, value)
-        self._data.zoom = value
-
-    def save(self):
-        """ Save the camera image"""
-        if self._locked:
-            return
-        ret, frame = self._cap.read()
+        return self.set("zoom", value)
+
+    def _grab(self) -> tuple[np.ndarray, float] | None:
+        """ Read the next frame and its time, return None if there is none """
+        with tracer.span("frame.read"):
+            ret, frame = self._cap.read()
         if not ret:
+            metrics.count("frames.skipped")
             logging.warning("Unable to read frame")
-            return
+            return None
+        return frame, time.time()
+
+    def _run(self):
+        """ Own the VideoCapture, applying the property sets between reads """
+        while self._running:
+            self._apply()
+            grabbed = self._grab()
+            if grabbed is None:
+                time.sleep(0.01)
+                continue
+            frame, timestamp = grabbed
+            metrics.count("frames.captured")
+            if self._recorder:
+                self._recorder.offer(frame, timestamp)
+            with self._frames:
+                self._frame = frame
+                self._count += 1
+                self._frames.notify_all()
+            for subscriber in self.subscribers:
+                subscriber(frame)
+
+    def read(self, timeout: float = READ_TIMEOUT) -> np.ndarray | None:
+        """ Wait for a frame newer than the last one returned, return None if none comes """
+        with self._frames:
+            self._frames.wait_for(lambda: self._count != self._returned or not self._running, timeout)
+            if self._count == self._returned:
+                return None
+            if self._count - self._returned > 1:
+                metrics.count("frames.dropped", self._count - self._returned - 1)
+            self._returned = self._count
+            return self._frame
+
+    def save(self) -> np.ndarray | None:
+        """ Save the camera image, return the frame or None if there was no new frame"""
+        frame = self.read()
+        if frame is None:
+            return None
         # Lots of thing can be done here if you've got the processing power
-        cv2.imwrite(Camera.OUTPUT, frame)
+        with tracer.span("frame.encode"), metrics.timed("frame.encode"):
+            cv2.imwrite(Camera.OUTPUT, frame)
+        return frame
+
+    def record(self, path: str):
+        """ Start recording the frames to a video """
+        self.stop_recording()
+        recorder = VideoRecorder(path, fps=self._fps, queue_size=Kit.VIDEO_QUEUE)
+        recorder.start()
+        self._recorder = recorder
+
+    def stop_recording(self):
+        """ Stop recording the frames """
+        recorder, self._recorder = self._recorder, None
+        if recorder:
+            recorder.stop()
 
     def open(self):
-        """ Open the camera"""
+        """ Open the camera, read its properties once and start the capture thread """
+        if not self._cap.isOpened():
+            self._open_capture()
+            self.fetch_all()
+        if not self._thread:
+            self._running = True
+            self._thread = Thread(target=self._run, name=f"camera{self.profile.device}", daemon=True)
+            self._thread.start()
+
+    def _open_capture(self):
+        """ Open the device and ask it for the profile's size and frame rate """
+        self._cap.open(index=self.profile.device)
         if not self._cap.isOpened():
-            self._cap.open(index=Kit.CAMERA_DEVICE)
-            if not self._cap.isOpened():
-                raise RuntimeError("Unable to open webcam")
+            raise RuntimeError(f"Unable to open webcam {self.profile.device}")
+        if self.profile.width and self.profile.height:
+            self._cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.profile.width)
+            self._cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.profile.height)
+        if self.profile.fps:
+            self._cap.set(cv2.CAP_PROP_FPS, self.profile.fps)
 
     def close(self):
-        """ Close the camera"""
+        """ Stop the capture thread and close the camera"""
+        self.stop_recording()
+        with self._frames:
+            self._running = False
+            self._frames.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self._apply()
         self._cap.release()
         if os.path.exists(Camera.OUTPUT):
             os.remove(Camera.OUTPUT)
 
     def __enter__(self):
-        if not self._cap.isOpened():
-            self.open()
+        self.open()
         return self
 
     def __exit__(self, *args):
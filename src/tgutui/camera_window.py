@@ -1,27 +1,40 @@
 import os
 import sys
+import base64
 import time
+import datetime
 import logging
 import traceback
-from threading import Thread
+from dataclasses import asdict
+from threading import Thread, Event
 from subprocess import CalledProcessError
+import cv2
+import numpy as np
 from rich.table import Table
 from rich.console import Console
 
 from tgutui.rpc import Rpc
-from tgutui.camera import Camera
+from tgutui.camera import Camera, CameraProfile
 from tgutui.kit import Kit, CameraKit
 from tgutui.rigol import ScopeData
+from tgutui.background import Background, CameraBackground, ScopeBackground, TiledBackground
+from tgutui.timing import Startup, tracer, metrics
 
 class CameraWindow:
     """ The camera window class that will display the camera argumented data"""
 
     CTRL_WIDTH = 400
+    READY_TIMEOUT = 10.0
 
     def __init__(self):
         super().__init__()
+        self.startup = Startup("Camera window")
         self._errors = 0
-        self.camera = Camera()
+        self.cameras = self._create_cameras()
+        self.camera = self.cameras[0]
+        # The camera the textual window's controls and the argumented data show
+        self.selected = self.camera
+        self._recording: Camera | None = None
         self.kit = CameraKit()
         self._argumented = False
         self.scope = ScopeData()
@@ -29,14 +42,36 @@ class CameraWindow:
         self.rpc = Rpc(server=Kit.TEXTUAL_PORT, client=Kit.CAMERA_PORT)
         self.rpc.register(self.remote_close, "close_window")
         self.rpc.register(self.update_camera, "update_camera")
+        self.rpc.register(self.select_camera, "select_camera")
         self.rpc.register(self.set_scope_data, "set_scope_data")
         self.rpc.register(self.update_argumented, "update_argumented")
+        self.rpc.register(self.record_video, "record_video")
+        self.rpc.register(self.textual_ready, "textual_ready")
+        self._textual_ready = Event()
         self._rpc_thread = Thread(target=self.rpc.connect, daemon=True)
         self._quit_thread = Thread(target=self._quit_delay)
-        width = int(self.camera.data.width + CameraWindow.CTRL_WIDTH)
-        self.kit.resize(height=int(self.camera.data.height), width=width)
+        self.background: Background = None
+        self.stream = None
+        if Kit.STREAM_PORT:
+            from tgutui.stream import FrameStream
+            self.stream = FrameStream(Kit.STREAM_PORT)
         if not Kit.LAUNCHED or not Kit.SHOW_CAMERA:
             self.update_argumented(True)
+        self.startup.mark("init")
+
+    @staticmethod
+    def _create_cameras() -> list[Camera]:
+        """ Create a camera for each CAMERA_DEVICES profile, or the one CAMERA_DEVICE """
+        if Kit.REPLAY_VIDEO:
+            from tgutui.replay import Clock, ReplayCamera, recorded_start
+            clock = Clock(recorded_start(), Kit.REPLAY_SPEED)
+            return [ReplayCamera(Kit.REPLAY_VIDEO, clock)]
+        profiles = CameraProfile.parse(Kit.CAMERA_DEVICES) or [CameraProfile(device=Kit.CAMERA_DEVICE)]
+        if Kit.SIM_CAMERA:
+            from tgutui.sim import Delay, SimCapture
+            delay = Delay(Kit.SIM_LATENCY_MS / 1000, Kit.SIM_JITTER_MS / 1000)
+            return [Camera(SimCapture(delay=delay), profile) for profile in profiles]
+        return [Camera(profile=profile) for profile in profiles]
 
     def update_argumented(self, state: bool):
         """ Update the argumented state of the window"""
@@ -58,21 +93,68 @@ class CameraWindow:
                 self.scope.duty = value
             case "volt":
                 self.scope.volt = value
+            case "peak":
+                self.scope.peak = value
+            case "thd":
+                self.scope.thd = value
 
-    def update_camera(self, property: str, value: str | int):
-        """ Update the camera data. This is called by the Textual Window"""
+    def update_camera(self, property: str, value: str | int, index: int = 0):
+        """ Update the data of one camera. This is called by the Textual Window"""
         # Much better to pass these as one dict/json
+        camera = self._camera(index)
+        if camera is None:
+            return
+        with tracer.span("camera.set"):
+            self._update_camera(camera, property, value)
+
+    def _camera(self, index: int) -> Camera | None:
+        """ Return the camera at index, None with an error logged if there is none """
+        if not isinstance(index, int) or not 0 <= index < len(self.cameras):
+            logging.error(f"CW: no camera {index} of {len(self.cameras)}")
+            return None
+        return self.cameras[index]
+
+    @staticmethod
+    def _update_camera(camera: Camera, property: str, value: str | int):
         match property:
             case "auto_focus":
-                self.camera.set_auto_focus(value)
+                camera.set_auto_focus(value)
             case "focus":
-                self.camera.set_focus(value)
+                camera.set_focus(value)
             case "pan":
-                self.camera.set_pan(value)
+                camera.set_pan(value)
             case "tilt":
-                self.camera.set_tilt(value)
+                camera.set_tilt(value)
             case "zoom":
-                self.camera.set_zoom(value)
+                camera.set_zoom(value)
+
+    def select_camera(self, index: int) -> dict:
+        """ Select the camera the controls change and return its data. This is called by the Textual Window"""
+        camera = self._camera(index)
+        if camera is None:
+            return {}
+        self.selected = camera
+        return asdict(camera.data)
+
+    def record_video(self, state: bool):
+        """ Start or stop recording the selected camera. This is called by the Textual Window"""
+        if self._recording:
+            self._recording.stop_recording()
+            self._recording = None
+        if not state:
+            return
+        name = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.selected.record(os.path.join(Kit.VIDEO_DIR, f"{name}.mp4"))
+        self._recording = self.selected
+
+    def _scope_screen(self) -> bytes | None:
+        """ Fetch the scope's display through the textual window, which owns the scope connection """
+        bitmap = self.rpc.request("scope_screen")
+        return base64.b64decode(bitmap) if bitmap else None
+
+    def textual_ready(self):
+        """ The textual window is listening. This is called by the Textual Window"""
+        self._textual_ready.set()
 
     def remote_close(self):
         """ Close the window remotely. This is called by the Textual Window"""
@@ -94,48 +176,74 @@ class CameraWindow:
         t.add_column("", style="blue", justify="left")
         t.add_column(" Camera", style="black", justify="right")
         t.add_column("", style="blue", justify="left")
-        t.add_row("Freq", str(self.scope.freq), "Auto", str(self.camera.data.auto_focus))
-        t.add_row("Duty", str(self.scope.duty), "Zoom", str(self.camera.data.zoom))
-        t.add_row("VAmp", str(self.scope.volt), "Focus", str(self.camera.data.focus))
-        t.add_row("VAvg", str(self.scope.vavg), "Tilt", str(self.camera.data.tilt))
-        t.add_row("", "", "Pan", str(self.camera.data.pan))
+        camera = self.selected
+        t.add_row("Freq", str(self.scope.freq), "Auto", str(camera.data.auto_focus))
+        t.add_row("Duty", str(self.scope.duty), "Zoom", str(camera.data.zoom))
+        t.add_row("VAmp", str(self.scope.volt), "Focus", str(camera.data.focus))
+        t.add_row("VAvg", str(self.scope.vavg), "Tilt", str(camera.data.tilt))
+        t.add_row("", "", "Pan", str(camera.data.pan))
+        if len(self.cameras) > 1:
+            t.add_row("", "", "Camera", str(self.cameras.index(camera) + 1))
+        if self._recording and self._recording.recorder:
+            t.add_row("", "", "Dropped", str(self._recording.recorder.dropped))
         self.console.print(t)
 
     def start_textual_window(self):
-        """ Start the textual window and wait for it to acknowledge the connection"""
-        textual_ack = False
+        """ Start the textual window and wait for it to say it is listening"""
         if Kit.LAUNCHED:
             self.kit.launch_textual_window()
-        time.sleep(1)
-        for _ in range(10):
-            time.sleep(0.2)
-            try:
-                self.rpc.request("textual_ack")
-                textual_ack = True
-            except ConnectionRefusedError:
-                continue
+        # A textual window started by hand may already be listening
+        textual_ack = self.rpc.request("textual_ack") or self._textual_ready.wait(CameraWindow.READY_TIMEOUT)
+        self.startup.mark("textual ready")
 
         if not textual_ack and not Kit.DEBUG:
             logging.error("Textual Window did not start")
             self.close()
             return
 
-        # Update the window
+        # Update the window, the textual window only shows the camera selector for more than one camera
+        self.rpc.request("update_camera", "count", len(self.cameras))
         for key in self.camera.data.__dict__.keys():
             value = getattr(self.camera.data, key)
             self.rpc.request("update_camera", key, value)
+        self.startup.mark("camera data sent")
 
     def open(self):
         """ Open the window and start the rpc server"""
-        self.camera.open()
         self._rpc_thread.start()
+        for camera in self.cameras:
+            camera.open()
+        self.startup.mark("camera open")
+        self.background = CameraBackground(self.camera)
+        if Kit.BACKGROUND == "scope":
+            self.background = ScopeBackground(
+                self._scope_screen, width=self.camera.data.width, height=self.camera.data.height
+            )
+        elif len(self.cameras) > 1:
+            self.background = TiledBackground(self.cameras)
+        # Without the kitty background the frames only go to the stream, so no file is written
+        self.background.save = Kit.SHOW_CAMERA
+        self.background.open()
+        if self.stream:
+            self.stream.open()
+        width, height = int(self.camera.data.width), int(self.camera.data.height)
+        if isinstance(self.background, TiledBackground):
+            width, height = self.background.size
+        self.kit.resize(height=height, width=width + CameraWindow.CTRL_WIDTH)
+        self.startup.mark("background open")
         self.rpc.check_started()
+        self.startup.mark("rpc listening")
         self.start_textual_window()
-
+        self.startup.log()
 
     def close(self):
         """ Close the window and stop the rpc server"""
-        self.camera.close()
+        if self.stream:
+            self.stream.close()
+        if self.background:
+            self.background.close()
+        for camera in self.cameras:
+            camera.close()
         self.rpc.disconnect()
         try:
             self._quit_thread.join()
@@ -146,6 +254,7 @@ class CameraWindow:
         except RuntimeError as e:
             logging.error(f"CW: {e}")
 
+        tracer.export("camera_window_trace.json")
         if not Kit.DEBUG:
             Kit.close_window()
 
@@ -157,9 +266,8 @@ class CameraWindow:
                 if time.time() > last_update + 0.33:
                     last_update = time.time()
                     self.show_argumented()
-                if Kit.SHOW_CAMERA:
-                    self.camera.save()
-                    self.kit.set_background(img_path=Camera.OUTPUT)
+                if Kit.SHOW_CAMERA or (self.stream and self.stream.clients):
+                    self._show_frame()
                     self._errors  = 0       
                 else:
                     time.sleep(0.1)
@@ -175,6 +283,30 @@ class CameraWindow:
                 self.close()
                 raise e
 
+    @tracer.traced("frame")
+    def _show_frame(self):
+        """ Capture a frame, stream it and show it as the window background """
+        img_path = self.background.update()
+        if not img_path:
+            return
+        # Published first so a kitty update that fails or is turned off does not stop the stream
+        if self.stream and self.stream.clients and self.background.frame is not None:
+            self.stream.publish(self._overlay(self.background.frame))
+        if Kit.SHOW_CAMERA:
+            with tracer.span("frame.display"), metrics.timed("frame.display"):
+                self.kit.set_background(img_path=img_path)
+            metrics.count("frames.shown")
+
+    def _overlay(self, frame: np.ndarray) -> np.ndarray:
+        """ Draw the scope data on a copy of the frame for the stream viewers when argumented """
+        if not self._argumented:
+            return frame
+        frame = frame.copy()
+        rows = [f"Freq {self.scope.freq}", f"Duty {self.scope.duty}", f"VAmp {self.scope.volt}", f"VAvg {self.scope.vavg}"]
+        for row, text in enumerate(rows):
+            cv2.putText(frame, text, (10, 30 + row * 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+        return frame
+
     def __enter__(self):
         self.open()
         return self
@@ -184,6 +316,7 @@ class CameraWindow:
 
 
 if __name__ == "__main__":
+    Kit.parse_args(sys.argv)
     Kit.create_log(file="camera_window.log")
     with CameraWindow() as window:
         window.display()
@@ -0,0 +1,268 @@
+"""
+Acquisition without kitty or Textual. Every scope update is written as a JSON line
+to stdout or to a TCP socket, and the instruments are controlled by commands on stdin
+
+    set 10 50           frequency in KHz and duty together
+    freq 10 / duty 50
+    profile {"type": "ramp", "target": "freq", "start": 1, "stop": 100, "step": 1, "interval": 0.01}
+    stop_profile
+    channel 2 / offset 0.5 / volts 1 / time 0.0001
+    pause / resume      stop and restart the scope polling
+    quit
+
+The first PWM and scope get the commands, prefix a command with an instrument
+name such as "pi2 duty 30" for another one.
+"""
+
+import io
+import sys
+import json
+import time
+import queue
+import socket
+import logging
+import datetime
+import dataclasses
+from typing import Callable
+from threading import Thread, Event
+from concurrent.futures import Future
+
+from tgutui.kit import Kit
+from tgutui.timing import metrics
+from tgutui.registry import Registry, ScopeInstrument, PwmInstrument
+
+
+class Output:
+    """
+    JSON lines written by one thread through a large buffer, flushed when the
+    queue runs dry or every FLUSH_MS, so fast scopes never wait on the stream.
+    A stalled reader fills the bounded queue and further lines are dropped and
+    counted, and a stream that fails calls on_error.
+    """
+
+    def __init__(self, target: str, flush_ms: int, size: int, on_error: Callable[[], None] | None = None) -> None:
+        self._target = target
+        self._flush = flush_ms / 1000
+        self._queue: queue.Queue = queue.Queue(maxsize=size)
+        self._stream: io.BufferedIOBase = None
+        self._socket: socket.socket = None
+        self._thread: Thread = None
+        self._on_error = on_error
+        self.failed = False
+        self.written = 0
+        self.dropped = 0
+
+    def _open(self):
+        if not self._target:
+            self._stream = sys.stdout.buffer
+            return
+        host, port = self._target.rsplit(":", 1)
+        self._socket = socket.create_connection((host, int(port)))
+        self._stream = self._socket.makefile("wb", buffering=1 << 16)
+
+    def put(self, item: dict):
+        """ Queue a line without blocking, return False if it was dropped """
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            metrics.count("headless.dropped")
+            return False
+
+    def _run(self):
+        try:
+            self._write()
+        except (OSError, ValueError) as e:
+            logging.error(f"Headless: output failed {e}")
+            self.failed = True
+            if self._on_error:
+                self._on_error()
+
+    def _write(self):
+        flushed = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self._flush)
+            except queue.Empty:
+                item = ...
+            if item is None:
+                break
+            if item is not ...:
+                self._stream.write(json.dumps(item).encode() + b"\n")
+                self.written += 1
+            if item is ... or time.monotonic() - flushed >= self._flush:
+                self._stream.flush()
+                flushed = time.monotonic()
+        self._stream.flush()
+
+    def start(self):
+        self._open()
+        self._thread = Thread(target=self._run, name="output", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread and not self.failed:
+            # Wait for room for the stop, the writer is still draining the queue
+            try:
+                self._queue.put(None, timeout=self._flush + 5)
+            except queue.Full:
+                logging.error("Headless: output did not drain")
+        if self._thread:
+            self._thread.join(timeout=self._flush + 5)
+        self._thread = None
+        if self._socket:
+            try:
+                self._stream.close()
+            except OSError:
+                pass
+            self._socket.close()
+
+
+class Headless:
+    """ Poll the instruments and capture the camera with no windows, writing the data as JSON lines """
+
+    def __init__(self, registry: Registry, camera=None) -> None:
+        self.registry = registry
+        self.camera = camera
+        self._quit = Event()
+        self.output = Output(Kit.HEADLESS_OUTPUT, Kit.HEADLESS_FLUSH_MS, Kit.HEADLESS_QUEUE, self._quit.set)
+        for scope in registry.scopes:
+            scope.subscribers.append(self._scope_updated)
+
+    def _scope_updated(self, scope: ScopeInstrument):
+        """ Queue a snapshot, called on the scope thread """
+        self.output.put({
+            "scope": scope.name,
+            **dataclasses.asdict(scope.data),
+            "measurement": dataclasses.asdict(scope.measurement),
+        })
+
+    def _capture(self):
+        """ Read camera frames as fast as they come, recording them when VIDEO_DIR is set """
+        self.camera.open()
+        if Kit.VIDEO_DIR:
+            name = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+            self.camera.record(f"{Kit.VIDEO_DIR}/{name}.mp4")
+        frames, since = 0, time.monotonic()
+        while not self._quit.is_set():
+            if self.camera.read() is not None:
+                frames += 1
+            elapsed = time.monotonic() - since
+            if elapsed >= 1.0:
+                self.output.put({
+                    "camera": dataclasses.asdict(self.camera.data),
+                    "time": time.time(),
+                    "fps": round(frames / elapsed, 2),
+                })
+                frames, since = 0, time.monotonic()
+        self.camera.close()
+
+    def _find(self, instruments: list, name: str | None):
+        if name is None:
+            return instruments[0] if instruments else None
+        return next((instrument for instrument in instruments if instrument.name == name), None)
+
+    # The number of arguments of each command, profile takes the rest of the line as JSON
+    ARGS = {
+        "set": 2, "freq": 1, "duty": 1, "profile": 1, "stop_profile": 0, "channel": 1,
+        "offset": 1, "volts": 1, "time": 1, "pause": 0, "resume": 0, "quit": 0,
+    }
+
+    def _error(self, line: str, error: Exception):
+        logging.error(f"Headless: {line} {error}")
+        self.output.put({"error": str(error), "command": line, "time": time.time()})
+
+    def _report(self, line: str, future: Future | None):
+        """ Put the failure of a queued command on the output once it is done """
+        if not isinstance(future, Future):
+            return
+
+        def done(future: Future):
+            if future.exception():
+                self._error(line, future.exception())
+        future.add_done_callback(done)
+
+    def command(self, line: str):
+        """ Run one control command, instrument failures come back as error lines """
+        words = line.split(maxsplit=1)
+        if not words:
+            return
+        names = [instrument.name for instrument in self.registry.instruments]
+        target = None
+        if words[0] in names:
+            target = words[0]
+            words = words[1].split(maxsplit=1) if len(words) > 1 else []
+            if not words:
+                return
+        name, rest = words[0], words[1] if len(words) > 1 else ""
+        args = [rest] if name == "profile" and rest else rest.split()
+        if name not in Headless.ARGS:
+            raise ValueError(f"Unknown command {name}")
+        if len(args) != Headless.ARGS[name]:
+            raise ValueError(f"{name} takes {Headless.ARGS[name]} arguments, not {len(args)}")
+        pwm: PwmInstrument = self._find(self.registry.pwms, target)
+        scope: ScopeInstrument = self._find(self.registry.scopes, target)
+        if name in ("set", "freq", "duty", "profile", "stop_profile") and pwm is None:
+            raise ValueError(f"No PWM {target or ''}".strip())
+        if name in ("channel", "offset", "volts", "time", "pause", "resume") and scope is None:
+            raise ValueError(f"No scope {target or ''}".strip())
+        future = None
+        match name:
+            case "set":
+                future = pwm.set(float(args[0]), float(args[1]))
+            case "freq":
+                future = pwm.change_frequency(float(args[0]))
+            case "duty":
+                future = pwm.change_duty(float(args[0]))
+            case "profile":
+                future = pwm.run_profile(json.loads(args[0]))
+            case "stop_profile":
+                future = pwm.stop_profile()
+            case "channel":
+                future = scope.submit(scope.rigol.set_source, int(args[0]))
+            case "offset":
+                future = scope.submit(scope.rigol.set_offset, float(args[0]))
+            case "volts":
+                future = scope.submit(scope.rigol.set_volts, float(args[0]))
+            case "time":
+                future = scope.submit(scope.rigol.set_time, float(args[0]))
+            case "pause":
+                scope.pause()
+            case "resume":
+                scope.resume()
+            case "quit":
+                self._quit.set()
+        self._report(line, future)
+
+    def _control(self):
+        """ Read commands from stdin until it closes """
+        for line in sys.stdin:
+            try:
+                self.command(line.strip())
+            except Exception as e:
+                self._error(line.strip(), e)
+        logging.info("Headless: stdin closed")
+
+    def run(self):
+        """ Run until quit or interrupted """
+        self.output.start()
+        self.registry.start()
+        threads = [Thread(target=self._control, name="control", daemon=True)]
+        if self.camera:
+            threads.append(Thread(target=self._capture, name="capture", daemon=True))
+        for thread in threads:
+            thread.start()
+        try:
+            while not self._quit.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            self._quit.set()
+        finally:
+            self.registry.stop()
+            if len(threads) > 1:
+                threads[1].join()
+            self.output.stop()
+            logging.info(
+                f"Headless: {self.output.written} lines {self.output.dropped} dropped {metrics.snapshot()['counters']}"
+            )
@@ -1,12 +1,12 @@
 
 import os
-import sys
 from typing import Callable
 import shlex
 import logging
 import subprocess
 import shutil
 import tgutui
+from tgutui.log import queued
 
 class Kit:
     """ This class is a wrapper around the kitten command line tool """
@@ -17,6 +17,8 @@ class Kit:
     PIPWM_PORT: int = int(os.environ.get("PIPWM_PORT", 34962))
     RIGOL_IP: str = os.environ.get("RIGOL_IP", "127.0.0.1")
     CAMERA_DEVICE: int = int(os.environ.get("CAMERA_DEVICE", 0))
+    CAMERA_DEVICES: str = os.environ.get("CAMERA_DEVICES", "")
+    STREAM_PORT: int = int(os.environ.get("STREAM_PORT", 0))
     CAMERA_PORT: int = int(os.environ.get("CAMERA_PORT", 33761))
     TEXTUAL_PORT: int = int(os.environ.get("TEXTUAL_PORT", 33962))
     CAMERA_TITLE: str = os.environ.get("CAMERA_TITLE", "CAMERA_TITLE")
@@ -25,10 +27,45 @@ class Kit:
     TEXTUAL_CMD: str = os.environ.get("TEXTUAL_CMD", "python -m tgutui textual_window")
     DEBUG: bool = True if os.environ.get("DEBUG", "1") == "1" else False
     LOG_RPC: bool = True if os.environ.get("LOG_RPC", "1") == "1" else False
+    LOG_RATE: int = int(os.environ.get("LOG_RATE", 20))
+    LOG_QUEUE: int = int(os.environ.get("LOG_QUEUE", 10000))
     LAUNCHED: bool = False if os.environ.get("LAUNCHED", "0") == "0" else True
     USE_PIPWM: bool = False if os.environ.get("USE_PIPWM", "0") == "0" else True
     USE_RIGOL: bool = False if os.environ.get("USE_RIGOL", "0") == "0" else True
+    BACKGROUND: str = os.environ.get("BACKGROUND", "camera")
+    SCREEN_INTERVAL_MS: int = int(os.environ.get("SCREEN_INTERVAL_MS", 1000))
+    HOST_MEASURE: bool = False if os.environ.get("HOST_MEASURE", "0") == "0" else True
     SHOW_CAMERA: bool = False if os.environ.get("SHOW_CAMERA", "0") == "0" else True
+    INSTRUMENTS_FILE: str = os.environ.get("INSTRUMENTS_FILE", "instruments.json")
+    RECORD_DIR: str = os.environ.get("RECORD_DIR", "")
+    RECORD_ROWS: int = int(os.environ.get("RECORD_ROWS", 1000000))
+    RECORD_ROLL_S: int = int(os.environ.get("RECORD_ROLL_S", 3600))
+    VIDEO_DIR: str = os.environ.get("VIDEO_DIR", "")
+    VIDEO_QUEUE: int = int(os.environ.get("VIDEO_QUEUE", 30))
+    SWEEP_INTERVAL_MS: int = int(os.environ.get("SWEEP_INTERVAL_MS", 20))
+    SWEEP_FREQS: str = os.environ.get("SWEEP_FREQS", "1:100:10")
+    SWEEP_DUTIES: str = os.environ.get("SWEEP_DUTIES", "10:90:20")
+    SWEEP_FILE: str = os.environ.get("SWEEP_FILE", "sweep.csv")
+    SWEEP_WINDOW: int = int(os.environ.get("SWEEP_WINDOW", 5))
+    SWEEP_TOLERANCE_PCT: int = int(os.environ.get("SWEEP_TOLERANCE_PCT", 1))
+    CAPTURE_DIR: str = os.environ.get("CAPTURE_DIR", "")
+    REPLAY_DIR: str = os.environ.get("REPLAY_DIR", "")
+    REPLAY_VIDEO: str = os.environ.get("REPLAY_VIDEO", "")
+    REPLAY_SPEED: int = int(os.environ.get("REPLAY_SPEED", 1))
+    REPLAY_WALL: int = int(os.environ.get("REPLAY_WALL", 0))
+    SIM_CAMERA: bool = False if os.environ.get("SIM_CAMERA", "0") == "0" else True
+    SIM_SCOPE_PORT: int = int(os.environ.get("SIM_SCOPE_PORT", 5555))
+    SIM_LATENCY_MS: int = int(os.environ.get("SIM_LATENCY_MS", 0))
+    SIM_JITTER_MS: int = int(os.environ.get("SIM_JITTER_MS", 0))
+    HEADLESS_OUTPUT: str = os.environ.get("HEADLESS_OUTPUT", "")
+    HEADLESS_FLUSH_MS: int = int(os.environ.get("HEADLESS_FLUSH_MS", 100))
+    HEADLESS_QUEUE: int = int(os.environ.get("HEADLESS_QUEUE", 10000))
+    HEADLESS_INTERVAL_MS: int = int(os.environ.get("HEADLESS_INTERVAL_MS", 1))
+    HEADLESS_CAMERA: bool = False if os.environ.get("HEADLESS_CAMERA", "0") == "0" else True
+    TRACE: bool = False if os.environ.get("TRACE", "0") == "0" else True
+    BENCH_FILE: str = os.environ.get("BENCH_FILE", "bench.json")
+    BENCH_SECONDS: int = int(os.environ.get("BENCH_SECONDS", 3))
+    BENCH_TOLERANCE_PCT: int = int(os.environ.get("BENCH_TOLERANCE_PCT", 10))
     CONFIG_FILE: str = f"{tgutui.__path__[0]}/{os.environ.get('CONFIG_FILE', 'window.conf')}"
 
     def __init__(self) -> None:
@@ -49,13 +86,28 @@ class Kit:
         r = f"{r} LAUNCHED: {Kit.LAUNCHED}\n"
         r = f"{r} USE_RIGOL: {Kit.USE_RIGOL}\n"
         r = f"{r} USE_PIPWM: {Kit.USE_PIPWM}\n"
+        r = f"{r} HOST_MEASURE: {Kit.HOST_MEASURE}\n"
         r = f"{r} CAMERA: {Kit.CAMERA_DEVICE}\n"
+        r = f"{r} CAMERA_DEVICES: {Kit.CAMERA_DEVICES}\n"
+        r = f"{r} STREAM_PORT: {Kit.STREAM_PORT}\n"
         r = f"{r} KITTEN: {Kit._HAVE_KITTEN}\n"
         r = f"{r} SHOW_CAMERA: {Kit.SHOW_CAMERA}\n"
+        r = f"{r} BACKGROUND: {Kit.BACKGROUND}\n"
+        r = f"{r} SCREEN_INTERVAL_MS: {Kit.SCREEN_INTERVAL_MS}\n"
         r = f"{r} CAMERA_PORT: {Kit.CAMERA_PORT}\n"
         r = f"{r} TEXTUAL_PORT: {Kit.TEXTUAL_PORT}\n"
         r = f"{r} PIPWM_IP: {Kit.PIPWM_IP}\n"
         r = f"{r} PIPWM_PORT: {Kit.PIPWM_PORT}\n"
+        r = f"{r} INSTRUMENTS_FILE: {Kit.INSTRUMENTS_FILE}\n"
+        r = f"{r} RECORD_DIR: {Kit.RECORD_DIR}\n"
+        r = f"{r} VIDEO_DIR: {Kit.VIDEO_DIR}\n"
+        r = f"{r} CAPTURE_DIR: {Kit.CAPTURE_DIR}\n"
+        r = f"{r} REPLAY_DIR: {Kit.REPLAY_DIR}\n"
+        r = f"{r} REPLAY_VIDEO: {Kit.REPLAY_VIDEO}\n"
+        r = f"{r} REPLAY_SPEED: {Kit.REPLAY_SPEED}\n"
+        r = f"{r} REPLAY_WALL: {Kit.REPLAY_WALL}\n"
+        r = f"{r} SIM_CAMERA: {Kit.SIM_CAMERA}\n"
+        r = f"{r} TRACE: {Kit.TRACE}\n"
         return r
 
     @kitten
@@ -79,43 +131,47 @@ class Kit:
         """ Close the current window"""
         Kit.cmd("close-window --self --no-response")
 
+    @staticmethod
+    def parse_args(argv: list[str]):
+        """ Override the settings with NAME value pairs from the command line """
+        if Kit.LAUNCHED:
+            return
+        for index, arg in enumerate(argv):
+            try:
+                value = argv[index + 1]
+            except IndexError:
+                continue
+            attr = getattr(Kit, arg, None)
+            if attr is None:
+                continue
+            if isinstance(attr, bool):
+                if value in ["1", "true", "True", "TRUE"]:
+                    setattr(Kit, arg, True)
+                else:
+                    setattr(Kit, arg, False)
+            elif isinstance(attr, int):
+                try:
+                    setattr(Kit, arg, int(value))
+                except ValueError:
+                    setattr(Kit, arg, value)
+            else:
+                setattr(Kit, arg, value)
+
     @staticmethod
     def create_log(file: str, level: int = logging.INFO):
-        """ Create a log file """
+        """
+        Create a log file written on a background thread, each log call site
+        is limited to LOG_RATE records a second
+        """
         if not Kit.DEBUG:
             return
-        logging.basicConfig(
-            level=level,
-            filemode="w",
-            filename=file,
-            format='%(levelname)s[%(pathname)s:%(funcName)s:%(lineno)d] - %(message)s'
-        )
+        handler = logging.FileHandler(file, mode="w")
+        handler.setFormatter(logging.Formatter(
+            '%(levelname)s[%(pathname)s:%(funcName)s:%(lineno)d] - %(message)s'
+        ))
+        queued(handler, level, rate=Kit.LOG_RATE, size=Kit.LOG_QUEUE)
 
 
-if not Kit.LAUNCHED:
-    for index, arg in enumerate(sys.argv):
-        __ARGV = None
-        try:
-            __ARGV = sys.argv[index + 1]
-        except IndexError:
-            continue
-        attr = getattr(Kit, arg, None)
-        if attr is None:
-            continue
-        if isinstance(attr, bool):
-            if __ARGV in ["1", "true", "True", "TRUE"]:
-                setattr(Kit, arg, True)
-            else:
-                setattr(Kit, arg, False)
-        elif isinstance(attr, int):
-            try:
-                __ARGV = int(__ARGV)
-                setattr(Kit, arg, __ARGV)
-            except ValueError:
-                setattr(Kit, arg, __ARGV)
-        else:
-            setattr(Kit, arg, __ARGV)
-
 class CameraKit(Kit):
     """ This class is a wrapper around the camera window"""
 
@@ -0,0 +1,81 @@
+""" Logging that never blocks the thread that logs """
+
+import time
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+
+class RateLimit(logging.Filter):
+    """
+    Let each log call site through at most rate times a second.
+    The next record let through from a site says how many were suppressed.
+    """
+
+    def __init__(self, rate: int = 20) -> None:
+        super().__init__()
+        self._rate = rate
+        self._windows: dict[tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= 1.0:
+            suppressed = window[2] if window else 0
+            window = self._windows[key] = [now, 0, 0]
+            if suppressed:
+                record.msg = f"{record.msg} ({suppressed} similar suppressed)"
+        if window[1] >= self._rate:
+            window[2] += 1
+            return False
+        window[1] += 1
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """ Queue records for the writer thread, dropping and counting them when the queue is full """
+
+    def __init__(self, size: int) -> None:
+        super().__init__(queue.Queue(maxsize=size))
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Queue the record as it is, the writer formats it. The stock prepare formats on the
+        calling thread so that mutable args are captured, the log calls here use f-strings.
+        """
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def queued(handler: logging.Handler, level: int, rate: int, size: int) -> QueueListener:
+    """
+    Send the root logger to handler on a background thread.
+    The calling thread only filters and queues, the formatting and file I/O happen on the writer.
+    """
+    queue_handler = DroppingQueueHandler(size)
+    queue_handler.addFilter(RateLimit(rate))
+    listener = QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+    listener.start()
+
+    def stop():
+        listener.stop()
+        if queue_handler.dropped:
+            handler.handle(logging.makeLogRecord({
+                "msg": f"Logging dropped {queue_handler.dropped} records", "levelno": logging.WARNING,
+                "levelname": "WARNING",
+            }))
+        handler.close()
+
+    atexit.register(stop)
+    return listener
@@ -0,0 +1,145 @@
+""" Host side measurements computed from captured waveforms """
+
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class Waveform:
+    """ A captured waveform converted to volts """
+    channel: int
+    volts: np.ndarray
+    xinc: float
+    xorg: float = 0.0
+
+    @property
+    def times(self) -> np.ndarray:
+        """ The sample times in seconds """
+        return self.xorg + np.arange(self.volts.size) * self.xinc
+
+
+@dataclass
+class Measurements:
+    """ The numeric measurements of one channel, matching the :MEASure names """
+    freq: float = 0.0
+    duty: float = 0.0
+    vavg: float = 0.0
+    vamp: float = 0.0
+    rise: float = 0.0
+    vrms: float = 0.0
+
+
+def crossings(volts: np.ndarray, level: float, rising: bool = True) -> np.ndarray:
+    """ Return the interpolated sample positions where volts crosses level """
+    above = volts >= level
+    if rising:
+        idx = np.flatnonzero(~above[:-1] & above[1:])
+    else:
+        idx = np.flatnonzero(above[:-1] & ~above[1:])
+    v0 = volts[idx]
+    step = volts[idx + 1] - v0
+    # A step of zero can not cross, but guard the divide anyway
+    step[step == 0] = np.finfo(float).eps
+    return idx + (level - v0) / step
+
+
+def _states(volts: np.ndarray, low: float, high: float) -> np.ndarray:
+    """ Return the hysteresis state (-1 low, 1 high, 0 unknown) for every sample """
+    state = np.where(volts >= high, 1, np.where(volts <= low, -1, 0))
+    known = np.flatnonzero(state)
+    if known.size == 0:
+        return state
+    # Forward fill the last known state over the samples between the thresholds
+    fill = np.zeros(volts.size, dtype=np.intp)
+    fill[known] = known
+    fill = np.maximum.accumulate(fill)
+    state = state[fill]
+    state[:known[0]] = 0
+    return state
+
+
+def edges(volts: np.ndarray, low: float, mid: float, high: float, rising: bool = True) -> np.ndarray:
+    """
+    Return the interpolated mid level positions of the edges in volts.
+    An edge only counts once the signal has passed from one threshold to
+    the other, so noise around the mid level does not add extra edges.
+    """
+    state = _states(volts, low, high)
+    before, after = (-1, 1) if rising else (1, -1)
+    changes = np.flatnonzero((state[:-1] == before) & (state[1:] == after)) + 1
+    mids = crossings(volts, mid, rising)
+    if changes.size == 0 or mids.size == 0:
+        return np.empty(0)
+    # The last mid crossing before each threshold change is the real edge
+    pick = np.searchsorted(mids, changes, side="right") - 1
+    pick = pick[pick >= 0]
+    return np.unique(mids[pick])
+
+
+def levels(volts: np.ndarray) -> tuple[float, float]:
+    """ Return the base and top levels of a pulse like the scope's Vbase and Vtop """
+    vmin, vmax = float(volts.min()), float(volts.max())
+    middle = (vmin + vmax) / 2
+    lower = volts[volts < middle]
+    upper = volts[volts >= middle]
+    base = float(np.median(lower)) if lower.size else vmin
+    top = float(np.median(upper)) if upper.size else vmax
+    return base, top
+
+
+def measure(waveform: Waveform) -> Measurements:
+    """ Measure a single waveform """
+    volts = np.asarray(waveform.volts, dtype=float)
+    result = Measurements()
+    if volts.size < 2:
+        return result
+    result.vavg = float(volts.mean())
+    result.vrms = float(np.sqrt(np.mean(volts * volts)))
+    base, top = levels(volts)
+    result.vamp = top - base
+    if result.vamp <= 0:
+        return result
+
+    low = base + 0.1 * result.vamp
+    mid = base + 0.5 * result.vamp
+    high = base + 0.9 * result.vamp
+    rises = edges(volts, low, mid, high, rising=True)
+    falls = edges(volts, low, mid, high, rising=False)
+    # A record of less than two periods may only hold two falling edges
+    if rises.size >= 2:
+        period = float(np.mean(np.diff(rises))) * waveform.xinc
+    elif falls.size >= 2:
+        period = float(np.mean(np.diff(falls))) * waveform.xinc
+    else:
+        return result
+    result.freq = 1 / period
+
+    # Pair each rising edge with the next falling edge for the positive width,
+    # or each falling edge with the next rising edge for the negative width
+    nxt = np.searchsorted(falls, rises)
+    valid = nxt < falls.size
+    if np.any(valid):
+        width = float(np.mean(falls[nxt[valid]] - rises[valid])) * waveform.xinc
+        result.duty = width / period
+    else:
+        nxt = np.searchsorted(rises, falls)
+        valid = nxt < rises.size
+        if np.any(valid):
+            width = float(np.mean(rises[nxt[valid]] - falls[valid])) * waveform.xinc
+            result.duty = 1 - width / period
+
+    # Rise time runs from the last low crossing to the first high crossing
+    lows = crossings(volts, low, rising=True)
+    highs = crossings(volts, high, rising=True)
+    start = np.searchsorted(lows, rises, side="right") - 1
+    end = np.searchsorted(highs, rises)
+    valid = (start >= 0) & (end < highs.size)
+    if np.any(valid):
+        result.rise = float(np.mean(highs[end[valid]] - lows[start[valid]])) * waveform.xinc
+    return result
+
+
+def measure_all(waveforms: list[Waveform]) -> dict[int, Measurements]:
+    """ Measure all the waveforms, keyed by channel """
+    return {waveform.channel: measure(waveform) for waveform in waveforms}
@@ -0,0 +1,200 @@
+""" Append only recording of measurements to memory mapped column files """
+
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from threading import Thread
+from typing import Sequence
+
+import numpy as np
+
+DTYPE = np.dtype("<f8")
+META = "meta.json"
+
+
+def _write_meta(path: str, meta: dict):
+    """ Replace the segment meta data in one step so readers never see half a file """
+    tmp = os.path.join(path, f"{META}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(path, META))
+
+
+class Segment:
+    """ One directory of preallocated column files """
+
+    def __init__(self, path: str, columns: list[str], capacity: int, started: float) -> None:
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.rows = 0
+        self.capacity = capacity
+        self.started = started
+        self.columns = columns
+        self._maps = {
+            name: np.memmap(os.path.join(path, f"{name}.f8"), dtype=DTYPE, mode="w+", shape=(capacity,))
+            for name in columns
+        }
+        self._meta()
+
+    def _meta(self):
+        _write_meta(self.path, {"columns": self.columns, "rows": self.rows, "capacity": self.capacity})
+
+    @property
+    def full(self) -> bool:
+        """ Return True when no more rows fit """
+        return self.rows >= self.capacity
+
+    def write(self, block: np.ndarray) -> int:
+        """ Write as many rows of a (rows, columns) block as fit, return the rows written """
+        count = min(block.shape[0], self.capacity - self.rows)
+        for index, name in enumerate(self.columns):
+            self._maps[name][self.rows:self.rows + count] = block[:count, index]
+        self.rows += count
+        return count
+
+    def flush(self):
+        """ Flush the columns and publish the row count """
+        for column in self._maps.values():
+            column.flush()
+        self._meta()
+
+    def close(self):
+        """ Flush and release the column files """
+        self.flush()
+        self._maps = {}
+
+
+class Recorder:
+    """
+    Record rows of floats to memory mapped column files.
+    Rows are queued by append and written in batches on a background thread.
+    A new segment is started once a segment is full or older than roll seconds.
+    """
+
+    BATCH = 0.5
+
+    def __init__(self, path: str, columns: list[str], capacity: int = 1000000, roll: float = 3600) -> None:
+        self.path = path
+        self.columns = ["time"] + [c for c in columns if c != "time"]
+        self.capacity = capacity
+        self.roll = roll
+        self._queue: queue.Queue = queue.Queue()
+        self._segment: Segment = None
+        self._running = False
+        self._thread: Thread = None
+        self._stopped = threading.Event()
+
+    def append(self, values: Sequence[float], timestamp: float | None = None):
+        """ Queue a row, the values are in the order of the columns after time """
+        self._queue.put((time.time() if timestamp is None else timestamp, *values))
+
+    def _segment_for(self, timestamp: float) -> Segment:
+        """ Return the segment to write to, rolling over when needed """
+        if self._segment and (self._segment.full or timestamp - self._segment.started >= self.roll):
+            self._segment.close()
+            self._segment = None
+        if self._segment is None:
+            path = os.path.join(self.path, f"{int(timestamp * 1000)}")
+            self._segment = Segment(path, self.columns, self.capacity, timestamp)
+            logging.info(f"Recorder: new segment {path}")
+        return self._segment
+
+    def _drain(self) -> list[tuple]:
+        """ Take every queued row """
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                return rows
+
+    def _write(self, rows: list[tuple]):
+        """ Write a batch of rows across as many segments as it needs """
+        block = np.asarray(rows, dtype=DTYPE)
+        while block.shape[0]:
+            segment = self._segment_for(float(block[0, 0]))
+            written = segment.write(block)
+            block = block[written:]
+        self._segment.flush()
+
+    def _run(self):
+        while self._running:
+            self._stopped.wait(Recorder.BATCH)
+            rows = self._drain()
+            if not rows:
+                continue
+            try:
+                self._write(rows)
+            except Exception as e:
+                logging.error(f"Recorder: {e}")
+
+    def start(self):
+        """ Start the writer thread, again after a stop """
+        self._stopped.clear()
+        self._running = True
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Write anything still queued and close the segment """
+        self._running = False
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+        self._thread = None
+        rows = self._drain()
+        if rows:
+            self._write(rows)
+        if self._segment:
+            self._segment.close()
+        self._segment = None
+
+
+class RecordReader:
+    """ Read a recording as read only memory mapped views, nothing is copied """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    @property
+    def segments(self) -> list[str]:
+        """ The segment directories in time order """
+        if not os.path.isdir(self.path):
+            return []
+        names = [n for n in os.listdir(self.path) if os.path.exists(os.path.join(self.path, n, META))]
+        return [os.path.join(self.path, n) for n in sorted(names, key=int)]
+
+    @staticmethod
+    def segment(path: str) -> dict[str, np.ndarray]:
+        """ Return a view of every column of a segment, trimmed to the rows written """
+        with open(os.path.join(path, META)) as f:
+            meta = json.load(f)
+        rows = meta["rows"]
+        if rows == 0:
+            return {name: np.empty(0, dtype=DTYPE) for name in meta["columns"]}
+        return {
+            name: np.memmap(os.path.join(path, f"{name}.f8"), dtype=DTYPE, mode="r", shape=(rows,))
+            for name in meta["columns"]
+        }
+
+    def window(self, start: float, end: float) -> list[dict[str, np.ndarray]]:
+        """ Return views of the rows with start <= time < end, one per segment """
+        views = []
+        for path in self.segments:
+            columns = self.segment(path)
+            times = columns["time"]
+            if times.size == 0 or times[-1] < start or times[0] >= end:
+                continue
+            lo, hi = np.searchsorted(times, [start, end])
+            views.append({name: column[lo:hi] for name, column in columns.items()})
+        return views
+
+    def column(self, name: str) -> np.ndarray:
+        """ Return a whole column, a view for one segment and a copy when joining several """
+        views = [self.segment(path)[name] for path in self.segments]
+        if not views:
+            return np.empty(0, dtype=DTYPE)
+        return views[0] if len(views) == 1 else np.concatenate(views)
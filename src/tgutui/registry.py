@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+import dataclasses
+from threading import Thread
+from typing import Callable
+from concurrent.futures import Future
+
+from jsonrpclib import Server
+
+from tgutui.kit import Kit
+from tgutui.rigol import Rigol, ScopeData
+from tgutui.spectrum import Spectrum
+from tgutui.measure import Measurements
+from tgutui.recorder import Recorder
+from tgutui.timing import tracer, metrics
+
+
+class Instrument:
+    """
+    An instrument with its own I/O thread. Commands are queued and run in
+    order between polls, so a slow or disconnected instrument only ever
+    blocks its own thread.
+    """
+
+    RETRY = 2.0
+    # The histogram the commands are timed into
+    STAGE = "instrument.call"
+
+    def __init__(self, name: str, interval: float = 0.0) -> None:
+        self.name = name
+        self.interval = interval
+        self.connected: bool = False
+        self._running: bool = False
+        self._resume = threading.Event()
+        self._resume.set()
+        self._commands: queue.Queue = queue.Queue()
+        self._thread: Thread = None
+
+    def connect(self) -> None:
+        """ Connect to the instrument """
+
+    def disconnect(self) -> None:
+        """ Disconnect from the instrument """
+
+    def poll(self) -> None:
+        """ Poll the instrument, called every interval seconds """
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """ Queue a call to run on the instrument thread """
+        future = Future()
+        # The trace id of the caller follows the command to the instrument thread
+        self._commands.put((future, fn, args, tracer.current()))
+        return future
+
+    def pause(self) -> None:
+        """ Stop polling, queued commands still run """
+        self._resume.clear()
+
+    def resume(self) -> None:
+        """ Resume polling """
+        self._resume.set()
+
+    def _call(self, future: Future, fn: Callable, args: tuple, trace: str | None) -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            with tracer.trace(trace), tracer.span(f"instrument.{fn.__name__}"), metrics.timed(self.STAGE):
+                future.set_result(fn(*args))
+        except Exception as e:
+            logging.error(f"{self.name}: {fn.__name__} {e}")
+            future.set_exception(e)
+
+    def _run(self) -> None:
+        next_poll = time.time()
+        while self._running:
+            if not self.connected:
+                try:
+                    self.connect()
+                    self.connected = True
+                except Exception as e:
+                    logging.error(f"{self.name}: {e}")
+                    time.sleep(Instrument.RETRY)
+                    continue
+            timeout = max(next_poll - time.time(), 0) if self.interval else None
+            try:
+                future, fn, args, trace = self._commands.get(timeout=timeout)
+            except queue.Empty:
+                next_poll = time.time() + self.interval
+                if not self._resume.is_set():
+                    continue
+                try:
+                    self.poll()
+                except Exception as e:
+                    logging.error(f"{self.name}: {e}")
+                    self._reset()
+                continue
+            if fn is None:
+                break
+            self._call(future, fn, args, trace)
+
+    def _reset(self) -> None:
+        """ Close the failed connection so the next loop opens a new one """
+        self.connected = False
+        try:
+            self.disconnect()
+        except Exception as e:
+            logging.error(f"{self.name}: disconnect {e}")
+
+    def start(self) -> None:
+        """ Start the instrument thread """
+        self._running = True
+        self._thread = Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """ Signal the instrument thread to stop """
+        self._running = False
+        self._resume.set()
+        self._commands.put((None, None, None, None))
+
+    def join(self) -> None:
+        """ Wait for the instrument thread and disconnect """
+        if self._thread:
+            self._thread.join(timeout=Instrument.RETRY)
+        self._thread = None
+        self.disconnect()
+
+
+class ScopeInstrument(Instrument):
+    """ A Rigol scope polled on its own thread """
+
+    COLUMNS = [field.name for field in dataclasses.fields(Measurements)]
+    STAGE = "scope.call"
+
+    def __init__(self, name: str, ip: str, interval: float = 0.25, rigol: Rigol | None = None) -> None:
+        super().__init__(name, interval)
+        self.rigol = rigol if rigol else Rigol(ip=ip)
+        self.data: ScopeData = ScopeData()
+        # When the poll behind data began, data.time is stamped after the measurement
+        self.started: float = 0.0
+        self.measurement: Measurements = Measurements()
+        self.spectrum: Spectrum | None = None
+        self.updated = threading.Condition()
+        # Called on the scope thread with the instrument after every update
+        self.subscribers: list[Callable[["ScopeInstrument"], None]] = []
+        self.recorder: Recorder | None = None
+        if Kit.RECORD_DIR:
+            self.recorder = Recorder(
+                os.path.join(Kit.RECORD_DIR, name),
+                ScopeInstrument.COLUMNS,
+                capacity=Kit.RECORD_ROWS,
+                roll=Kit.RECORD_ROLL_S,
+            )
+
+    def connect(self) -> None:
+        self.rigol.connect()
+        # Rigol returns without connecting when USE_RIGOL is off or it has no IP
+        if not self.rigol.is_connected:
+            raise RuntimeError("Scope not connected, check USE_RIGOL and RIGOL_IP")
+
+    def disconnect(self) -> None:
+        self.rigol.disconnect()
+
+    def start(self) -> None:
+        if self.recorder:
+            self.recorder.start()
+        super().start()
+
+    def join(self) -> None:
+        super().join()
+        if self.recorder:
+            self.recorder.stop()
+
+    def poll(self) -> None:
+        """ Update the scope and publish a snapshot for the UI to read """
+        if not self.rigol.is_connected:
+            return
+        started = time.time()
+        with tracer.span("rigol.update"), metrics.timed("rigol.update"):
+            self.rigol.update()
+        self.measurement = self.rigol.measurement
+        self.data = dataclasses.replace(self.rigol.data)
+        self.started = started
+        self.spectrum = self.rigol.spectrum
+        with self.updated:
+            self.updated.notify_all()
+        for subscriber in self.subscribers:
+            subscriber(self)
+        if self.recorder:
+            m = dataclasses.astuple(self.rigol.measurement)
+            self.recorder.append(m, timestamp=self.data.time)
+
+
+class PwmInstrument(Instrument):
+    """ A Pi PWM server called on its own thread """
+
+    STAGE = "pi.call"
+
+    def __init__(self, name: str, ip: str, port: int, interval: float = 0.5) -> None:
+        super().__init__(name, interval)
+        self.address = f"http://{ip}:{port}"
+        self.pi: Server = None
+        self.profile: dict = {"running": False}
+        self.state: dict = {}
+
+    def connect(self) -> None:
+        """ Connect and read back the Pi's settings so the UI can resync """
+        self.pi = Server(self.address)
+        self.state = self.pi.get_state()
+        self.profile = {"running": self.state.get("profile", False)}
+
+    def poll(self) -> None:
+        """ Read back the profile progress while one is running """
+        if self.profile.get("running"):
+            self.profile = self.pi.profile_status()
+
+    def _run_profile(self, profile: dict) -> dict:
+        self.profile = self.pi.run_profile(profile)
+        return self.profile
+
+    def _stop_profile(self) -> dict:
+        self.profile = self.pi.stop_profile()
+        return self.profile
+
+    def run_profile(self, profile: dict) -> Future:
+        """ Send a whole ramp, step list or sequence for the Pi to run on its own clock """
+        return self.submit(self._run_profile, profile)
+
+    def stop_profile(self) -> Future:
+        """ Stop the running profile """
+        return self.submit(self._stop_profile)
+
+    def _call_pi(self, method: str, *args):
+        """ Call the Pi, looked up on the instrument thread once connect has made it """
+        return getattr(self.pi, method)(*args)
+
+    def change_frequency(self, freq: int) -> Future:
+        """ Change the PWM frequency in KHz """
+        return self.submit(self._call_pi, "change_frequency", freq)
+
+    def change_duty(self, duty: int) -> Future:
+        """ Change the PWM duty cycle """
+        return self.submit(self._call_pi, "change_duty", duty)
+
+    def _set(self, freq: float, duty: float) -> dict:
+        self.state = self.pi.set(freq, duty)
+        return self.state
+
+    def set(self, freq: float, duty: float) -> Future:
+        """ Change the frequency in KHz and the duty cycle together in one call """
+        return self.submit(self._set, freq, duty)
+
+
+class Registry:
+    """
+    The instruments of a station, created from a JSON file such as
+
+        {
+            "scopes": [{"name": "scope1", "ip": "192.168.1.10", "interval": 0.25}],
+            "pwms": [{"name": "pi1", "ip": "192.168.1.20", "port": 34962}]
+        }
+
+    Without a file the single RIGOL_IP and PIPWM_IP instruments are used.
+    """
+
+    def __init__(self) -> None:
+        self.scopes: list[ScopeInstrument] = []
+        self.pwms: list[PwmInstrument] = []
+
+    @property
+    def instruments(self) -> list[Instrument]:
+        """ All the instruments """
+        return self.scopes + self.pwms
+
+    @staticmethod
+    def load(file: str | None = None) -> "Registry":
+        """ Create the registry from a file, or from the Kit settings """
+        registry = Registry()
+        if file and os.path.exists(file):
+            with open(file) as f:
+                config = json.load(f)
+            for scope in config.get("scopes", []):
+                registry.scopes.append(ScopeInstrument(**scope))
+            for pwm in config.get("pwms", []):
+                registry.pwms.append(PwmInstrument(**pwm))
+            logging.info(f"Registry: loaded {file}")
+            return registry
+
+        if Kit.USE_RIGOL:
+            registry.scopes.append(ScopeInstrument(name="scope", ip=Kit.RIGOL_IP))
+        if Kit.USE_PIPWM:
+            registry.pwms.append(PwmInstrument(name="pwm", ip=Kit.PIPWM_IP, port=Kit.PIPWM_PORT))
+        return registry
+
+    def start(self) -> None:
+        """ Start polling every instrument """
+        for instrument in self.instruments:
+            instrument.start()
+
+    def stop(self) -> None:
+        """ Stop every instrument """
+        for instrument in self.instruments:
+            instrument.stop()
+        for instrument in self.instruments:
+            instrument.join()
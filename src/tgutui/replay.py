@@ -0,0 +1,305 @@
+""" Replay a recorded session in place of the scope, camera and Pi """
+
+import os
+import time
+import logging
+import datetime
+
+import cv2
+import numpy as np
+
+from tgutui.kit import Kit
+from tgutui.camera import Camera
+from tgutui.rigol import Rigol
+from tgutui.measure import Measurements
+from tgutui.recorder import RecordReader
+from tgutui.video import VideoRecorder
+from tgutui.registry import Registry, ScopeInstrument, PwmInstrument
+
+
+class Clock:
+    """
+    Map recorded time onto wall time.
+    A speed of 1 is real time, N is N times faster and 0 is as fast as possible.
+    The recorded start is due at wall, REPLAY_WALL when set so that both windows
+    share it, or else when the clock is made.
+    """
+
+    def __init__(self, start: float, speed: int = 1, wall: float | None = None) -> None:
+        self.start = start
+        self.speed = speed
+        if wall is None:
+            wall = Kit.REPLAY_WALL / 1000 if Kit.REPLAY_WALL else time.time()
+        self.wall = wall
+
+    def now(self) -> float:
+        """ Return the recorded time that is due now """
+        return self.start + (time.time() - self.wall) * self.speed
+
+    def wait(self, timestamp: float) -> None:
+        """ Sleep until a recorded time is due """
+        if not self.speed:
+            return
+        delay = self.wall + (timestamp - self.start) / self.speed - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _segment_start(path: str) -> float:
+    """ Return the start time of a recorder segment from its name """
+    return int(os.path.basename(path)) / 1000
+
+
+def recorded_start() -> float:
+    """
+    Return the earliest recorded time of the scope recordings and the video,
+    both windows anchor their clocks to it so they replay in step
+    """
+    starts = []
+    if Kit.REPLAY_DIR and os.path.isdir(Kit.REPLAY_DIR):
+        for name in os.listdir(Kit.REPLAY_DIR):
+            segments = RecordReader(os.path.join(Kit.REPLAY_DIR, name)).segments
+            if segments:
+                starts.append(_segment_start(segments[0]))
+    if Kit.REPLAY_VIDEO:
+        index = VideoRecorder.read_index(Kit.REPLAY_VIDEO)
+        if index.size:
+            starts.append(float(index[0]))
+    return min(starts) if starts else time.time()
+
+
+class Throughput:
+    """ Count replayed items, as fast as possible replay makes this a benchmark """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.count = 0
+        self.began: float | None = None
+
+    def tick(self):
+        if self.began is None:
+            self.began = time.perf_counter()
+        self.count += 1
+
+    def log(self):
+        if self.began is None:
+            return
+        elapsed = time.perf_counter() - self.began
+        rate = self.count / elapsed if elapsed else 0
+        logging.info(f"Replay {self.name}: {self.count} in {elapsed:.2f}s {rate:.1f}/s")
+
+
+class ReplayRigol(Rigol):
+    """ A Rigol that plays back a recorder directory, seeking by time """
+
+    ANSWERS = {
+        ":MEASure:SOURce?": "CHAN1",
+        ":CHANnel1:OFFSet?": "0",
+        ":CHANnel1:SCALe?": "1",
+        ":TIMebase:SCALe?": "0.0001",
+    }
+
+    def __init__(self, path: str, clock: Clock) -> None:
+        super().__init__()
+        self._clock = clock
+        self._segments = RecordReader(path).segments
+        self._starts = np.array([_segment_start(p) for p in self._segments])
+        self._segment = -1
+        self._columns: dict[str, np.ndarray] = {}
+        self._row = -1
+        self._recorded = 0.0
+        self.throughput = Throughput(os.path.basename(path))
+
+    def connect(self) -> None:
+        self._connected = True
+
+    def disconnect(self) -> None:
+        if self._connected:
+            self.throughput.log()
+        self._connected = False
+
+    def write(self, command: str) -> None:
+        """ Settings are ignored on replay """
+
+    def query(self, command: str) -> str:
+        """ Answer the setting queries with fixed values """
+        return ReplayRigol.ANSWERS.get(command, "0")
+
+    def capture(self, channel: int) -> None:
+        """ Waveforms are not recorded """
+        return None
+
+    def capture_deep(self, *args, **kwargs) -> int:
+        """ Waveforms are not recorded """
+        return 0
+
+    def screen(self) -> None:
+        """ The screen is not recorded """
+        return None
+
+    def _load(self, index: int) -> None:
+        """ Map the columns of one segment """
+        self._segment = index
+        self._columns = RecordReader.segment(self._segments[index])
+        self._row = -1
+
+    def seek(self, timestamp: float) -> None:
+        """ Move to the last row recorded at or before timestamp """
+        if not self._segments:
+            return
+        index = max(int(np.searchsorted(self._starts, timestamp, side="right")) - 1, 0)
+        if index != self._segment:
+            self._load(index)
+        row = int(np.searchsorted(self._columns["time"], timestamp, side="right")) - 1
+        self._row = max(row, 0)
+
+    def _advance(self) -> bool:
+        """ Move to the next row, return False at the end of the recording """
+        if self._segment < 0 and self._segments:
+            self._load(0)
+        while self._segment >= 0:
+            if self._row + 1 < self._columns["time"].size:
+                self._row += 1
+                return True
+            if self._segment + 1 >= len(self._segments):
+                return False
+            self._load(self._segment + 1)
+        return False
+
+    def _measure(self) -> Measurements:
+        """ Return the recorded measurements that are due """
+        if self._clock.speed:
+            self.seek(self._clock.now())
+        elif not self._advance():
+            return self._measurement
+        times = self._columns.get("time")
+        if times is None or self._row >= times.size:
+            return self._measurement
+        self.throughput.tick()
+        self._recorded = float(times[self._row])
+        values = {name: float(column[self._row]) for name, column in self._columns.items() if name != "time"}
+        return Measurements(**values)
+
+    def update(self) -> None:
+        """ Set the scope data with the recorded time """
+        super().update()
+        self._data.time = self._recorded
+        self._data.date = datetime.datetime.fromtimestamp(self._recorded).strftime("%d-%m-%Y %H:%M:%S")
+
+
+class ReplayCamera(Camera):
+    """ A Camera that plays back a recorded video, using its timestamp index to pace and seek """
+
+    def __init__(self, path: str, clock: Clock) -> None:
+        self._path = path
+        self._clock = clock
+        self._index = np.empty(0)
+        self.throughput = Throughput(os.path.basename(path))
+        super().__init__()
+        # The next frame of the video, Camera keeps its last frame in _frame
+        self._position = 0
+        self._index = VideoRecorder.read_index(path)
+        if self._index.size == 0:
+            self._open_index()
+
+    def _open_index(self):
+        """ Make up an index from the frame rate when the video has none """
+        self._open_capture()
+        self.fetch_all()
+        count = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = self._fps if self._fps else 30
+        self._index = self._clock.start + np.arange(count) / fps
+
+    def _open_capture(self):
+        """ Open the video """
+        self._cap.open(self._path)
+        if not self._cap.isOpened():
+            raise RuntimeError(f"Unable to open video {self._path}")
+
+    def close(self):
+        """ Close the video """
+        if self._cap.isOpened():
+            self.throughput.log()
+        super().close()
+
+    def _seek(self, frame: int):
+        """ Jump to a frame """
+        self._cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
+        self._position = frame
+
+    def _grab(self) -> tuple[np.ndarray, float] | None:
+        """ Read the frame that is due, skipping ahead when replay falls behind """
+        if self._position >= self._index.size:
+            time.sleep(0.1)
+            return None
+        if self._clock.speed:
+            due = int(np.searchsorted(self._index, self._clock.now(), side="right")) - 1
+            if due > self._position:
+                self._seek(min(due, self._index.size - 1))
+            self._clock.wait(float(self._index[self._position]))
+        ret, frame = self._cap.read()
+        if not ret:
+            self._position = self._index.size
+            return None
+        self._position += 1
+        self.throughput.tick()
+        return frame, float(self._index[self._position - 1])
+
+
+class ReplayPwm:
+    """ Stands in for the Pi PWM server, the calls are only logged """
+
+    def __init__(self) -> None:
+        self._state = {"freq": 1, "duty": 0, "running": True, "profile": False}
+
+    def change_duty(self, duty: int):
+        logging.debug(f"Replay PWM duty {duty}")
+        self._state["duty"] = duty
+
+    def change_frequency(self, freq: int):
+        logging.debug(f"Replay PWM frequency {freq}")
+        self._state["freq"] = freq
+
+    def set(self, freq: float, duty: float) -> dict:
+        self.change_frequency(freq)
+        self.change_duty(duty)
+        return self.get_state()
+
+    def get_state(self) -> dict:
+        return dict(self._state)
+
+    def run_profile(self, profile: dict) -> dict:
+        logging.debug(f"Replay PWM profile {profile}")
+        return self.profile_status()
+
+    def stop_profile(self) -> dict:
+        return self.profile_status()
+
+    def profile_status(self) -> dict:
+        return {"running": False}
+
+
+class ReplayPwmInstrument(PwmInstrument):
+    """ A PWM instrument backed by ReplayPwm """
+
+    def __init__(self, name: str) -> None:
+        super().__init__(name, ip="", port=0)
+
+    def connect(self) -> None:
+        self.pi = ReplayPwm()
+        self.state = self.pi.get_state()
+
+
+def replay_registry(path: str, speed: int) -> Registry:
+    """ Create a registry with a ReplayRigol for each recorded scope """
+    clock = Clock(recorded_start(), speed)
+    # The scopes still poll, as fast as possible replay polls as fast as it can
+    interval = 0.25 / speed if speed else 0.001
+    registry = Registry()
+    for name in sorted(os.listdir(path)):
+        scope = os.path.join(path, name)
+        if RecordReader(scope).segments:
+            rigol = ReplayRigol(scope, clock)
+            registry.scopes.append(ScopeInstrument(name, ip="", interval=interval, rigol=rigol))
+    registry.pwms.append(ReplayPwmInstrument("pwm"))
+    return registry
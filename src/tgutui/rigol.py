@@ -1,10 +1,25 @@
+import os
+import json
+import time
 import logging
 import datetime
+import functools
+import threading
 from dataclasses import dataclass
 from typing import Callable
 
-import pyvisa
+import numpy as np
 from tgutui.kit import Kit
+from tgutui.measure import Waveform, Measurements, measure_all
+from tgutui.spectrum import Spectrum, analyse
+from tgutui.timing import tracer
+
+
+@functools.lru_cache(maxsize=1)
+def resource_manager():
+    """ Import pyvisa and create its resource manager on the first connect only """
+    import pyvisa
+    return pyvisa.ResourceManager()
 
 
 @dataclass
@@ -15,17 +30,36 @@ class ScopeData:
     volt: str = ""
     duty: str = ""
     vavg: str = ""
+    rise: str = ""
+    vrms: str = ""
+    peak: str = ""
+    thd: str = ""
+    time: float = 0.0
     def __repr__(self) -> str:
-        return "{self.date}, {self.freq}, {self.volt}, {self.duty}, {self.vavg}"
+        r = f"{self.date}, {self.freq}, {self.volt}, {self.duty}, {self.vavg}"
+        return f"{r}, {self.rise}, {self.vrms}, {self.peak}, {self.thd}"
 
 class Rigol:
     """ Rigol class to communicate with a 1054Z via SCPI """
-    def __init__(self) -> None:
-        self._ip: str | None = Kit.RIGOL_IP if Kit.RIGOL_IP != "127.0.0.1" else None
-        self._instrument: pyvisa.ResourceManager = None
+
+    CHANNELS = 4
+    # The most BYTE points the 1054Z returns for one :WAV:DATA? in RAW mode
+    CHUNK = 250000
+
+    def __init__(self, ip: str | None = None) -> None:
+        ip = ip if ip else Kit.RIGOL_IP
+        self._ip: str | None = ip if ip != "127.0.0.1" else None
+        self._instrument = None
         self._connected: bool = False
+        self._lock = threading.RLock()
         self._data = ScopeData()
         self._channel = 1
+        self._channels: list[int] = [1]
+        self._measurements: dict[int, Measurements] = {}
+        self._measurement = Measurements()
+        self._waveforms: dict[int, Waveform] = {}
+        self._spectrum: Spectrum | None = None
+        self.window: str | None = None
 
     def connect(self) -> None:
         """ Connect to the scope """
@@ -34,8 +68,10 @@ class Rigol:
         if not self._ip:
             logging.error("Rigol: No IP address provided.")
             return None
-        self._instrument = pyvisa.ResourceManager().open_resource(
-            resource_name=f"TCPIP::{self._ip}::inst0::INSTR",
+        # A full VISA resource such as TCPIP::127.0.0.1::5555::SOCKET is used as is
+        resource = self._ip if "::" in self._ip else f"TCPIP::{self._ip}::inst0::INSTR"
+        self._instrument = resource_manager().open_resource(
+            resource_name=resource,
             write_termination='\n',
             read_termination='\n',
         )
@@ -43,34 +79,59 @@ class Rigol:
             self.disconnect()
             raise RuntimeError("No IDN")
         self._connected = True
+        self.fetch_channels()
 
     @property
     def data(self) -> ScopeData:
         """ The the scope data """
         return self._data
 
+    @property
+    def is_connected(self) -> bool:
+        """ Return the connected status of the scope """
+        return self._connected
+
+    @property
+    def measurement(self) -> Measurements:
+        """ The last numeric measurements of the active channel """
+        return self._measurement
+
+    @property
+    def measurements(self) -> dict[int, Measurements]:
+        """ The host measurements of every displayed channel """
+        return self._measurements
+
+    @property
+    def spectrum(self) -> Spectrum | None:
+        """ The spectrum of the active channel, when a window is selected """
+        return self._spectrum
+
     def connected(fn: Callable):
         def decorate(self, *args, **kwargs):
             if self._connected:
-                return fn(self, *args, **kwargs)
+                with self._lock:
+                    return fn(self, *args, **kwargs)
             return "0"
         return decorate
 
     def disconnect(self) -> None:
         """ Disconnect from the scope """
-        if self._connected and self._instrument:
+        if self._instrument:
             self._instrument.close()
+        self._instrument = None
         self._connected = False
 
     @connected
     def write(self, command: str) -> None:
         """ Write to the scope """
-        self._instrument.write(command)
+        with tracer.span("rigol.write"):
+            self._instrument.write(command)
 
     @connected
     def query(self, command: str) -> str:
         """ query the scope """
-        return self._instrument.query(command)
+        with tracer.span("rigol.query"):
+            return self._instrument.query(command)
 
     def get_source(self):
         """ Return which channel is active """
@@ -88,10 +149,115 @@ class Rigol:
         """ Return the scope time scale """
         return float(self.query(":TIMebase:SCALe?"))
 
+    def fetch_channels(self) -> list[int]:
+        """ Fetch which channels are displayed """
+        channels = [
+            channel for channel in range(1, Rigol.CHANNELS + 1)
+            if self.query(f":CHANnel{channel}:DISPlay?").strip() == "1"
+        ]
+        self._channels = channels if channels else [self._channel]
+        return self._channels
+
+    def capture(self, channel: int) -> Waveform | None:
+        """ Capture the displayed waveform of a channel in volts """
+        if not self._connected:
+            return None
+        with self._lock:
+            self.write(f":WAVeform:SOURce CHANnel{channel}")
+            self.write(":WAVeform:MODE NORMal")
+            self.write(":WAVeform:FORMat BYTE")
+            pre = self.query(":WAVeform:PREamble?").split(",")
+            raw = self._instrument.query_binary_values(
+                ":WAVeform:DATA?", datatype="B", container=np.array
+            )
+        xinc, xorg = float(pre[4]), float(pre[5])
+        yinc, yorg, yref = float(pre[7]), float(pre[8]), float(pre[9])
+        volts = (raw.astype(float) - yorg - yref) * yinc
+        return Waveform(channel=channel, volts=volts, xinc=xinc, xorg=xorg)
+
+    def capture_deep(
+        self,
+        channel: int,
+        path: str,
+        progress: Callable[[int, int], None] | None = None,
+        cancel: threading.Event | None = None,
+    ) -> int:
+        """
+        Download the whole sample memory of a channel in RAW mode.
+        Each chunk is written straight into a memory mapped file of raw bytes, so
+        memory use does not grow with the capture. The preamble is saved next to
+        it as json for read_deep. The scope is stopped while the memory is read,
+        and the lock keeps every other query out until it is done.
+        Return the number of points written.
+        """
+        if not self._connected:
+            return 0
+        written = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            self.write(":STOP")
+            try:
+                self.write(f":WAVeform:SOURce CHANnel{channel}")
+                self.write(":WAVeform:MODE RAW")
+                self.write(":WAVeform:FORMat BYTE")
+                pre = self.query(":WAVeform:PREamble?").split(",")
+                points = int(pre[2])
+                out = np.memmap(path, dtype=np.uint8, mode="w+", shape=(points,))
+                for start in range(1, points + 1, Rigol.CHUNK):
+                    if cancel and cancel.is_set():
+                        logging.info(f"Rigol: deep capture cancelled at {written}")
+                        break
+                    stop = min(start + Rigol.CHUNK - 1, points)
+                    self.write(f":WAVeform:STARt {start}")
+                    self.write(f":WAVeform:STOP {stop}")
+                    block = self._instrument.query_binary_values(
+                        ":WAVeform:DATA?", datatype="B", container=np.array
+                    )
+                    out[start - 1:start - 1 + block.size] = block
+                    out.flush()
+                    written = start - 1 + block.size
+                    if progress:
+                        progress(written, points)
+                del out
+            finally:
+                self.write(":WAVeform:MODE NORMal")
+                self.write(":RUN")
+        with open(f"{path}.json", "w") as f:
+            json.dump({
+                "channel": channel,
+                "points": written,
+                "xinc": float(pre[4]),
+                "xorg": float(pre[5]),
+                "yinc": float(pre[7]),
+                "yorg": float(pre[8]),
+                "yref": float(pre[9]),
+            }, f)
+        return written
+
+    @staticmethod
+    def read_deep(path: str) -> tuple[np.ndarray, dict]:
+        """ Return a deep capture as a read only memory mapped view of raw bytes and its preamble """
+        with open(f"{path}.json") as f:
+            pre = json.load(f)
+        if not pre["points"] or not os.path.getsize(path):
+            return np.empty(0, dtype=np.uint8), pre
+        return np.memmap(path, dtype=np.uint8, mode="r", shape=(pre["points"],)), pre
+
+    def screen(self) -> bytes | None:
+        """ Fetch the scope's display as a PNG bitmap """
+        if not self._connected:
+            return None
+        with self._lock:
+            return self._instrument.query_binary_values(
+                ":DISPlay:DATA? ON,OFF,PNG", datatype="B", container=bytes
+            )
+
     def set_source(self, channel: int = 1):
         """ Set the active channel """
         self._channel = channel
         self.write(f":MEASure:SOURce {self._channel}")
+        if Kit.HOST_MEASURE:
+            self.fetch_channels()
 
     def set_offset(self, value: float) -> None:
         """ Set the offset """
@@ -105,22 +271,67 @@ class Rigol:
         """ Set the time scale """
         self.write(f":TIMebase:SCALe {value}")
 
-    def update(self) -> list[str]:
+    def _host_measure(self) -> Measurements:
+        """ Measure every displayed channel from one waveform transfer each """
+        waveforms = [self.capture(channel) for channel in self._channels]
+        self._waveforms = {w.channel: w for w in waveforms if w is not None}
+        self._measurements = measure_all(list(self._waveforms.values()))
+        m = self._measurements.get(self._channel, Measurements())
+        if m.vamp and not m.freq:
+            # Less than a full period was captured, keep the scope's own frequency and duty
+            logging.info(f"Rigol: no full period on channel {self._channel}, using the scope's measurement")
+            m.freq = self._scope_value(":MEASure:FREQuency?")
+            m.duty = self._scope_value(":MEASure:PDUTy?")
+        return m
+
+    def _scope_value(self, cmd: str) -> float:
+        """ Query one scope measurement """
+        x = self.query(cmd)
+        try:
+            x = float(x) if x else 0.0
+        except ValueError as e:
+            logging.error(f"{cmd}:{x} {e}")
+            x = 0.01
+        return x
+
+    def _scope_measure(self) -> Measurements:
+        """ Ask the scope to measure the active channel """
+        return Measurements(
+            freq=self._scope_value(':MEASure:FREQuency?'),
+            duty=self._scope_value(':MEASure:PDUTy?'),
+            vavg=self._scope_value(':MEASure:VAVG?'),
+            vamp=self._scope_value(':MEASure:VAMP?'),
+        )
+
+    def _spectrum_measure(self) -> None:
+        """ Analyse the active channel, reusing the host capture when there is one """
+        waveform = self._waveforms.get(self._channel) if Kit.HOST_MEASURE else None
+        if waveform is None:
+            waveform = self.capture(self._channel)
+        if waveform is None:
+            self._spectrum = None
+            return
+        self._spectrum = analyse(waveform, self.window)
+        self._data.peak = f"{round(self._spectrum.peak / 1000, 2)}"
+        self._data.thd = f"{round(self._spectrum.thd * 100, 2)}%"
+
+    def _measure(self) -> Measurements:
+        """ Measure the active channel on the host or on the scope """
+        return self._host_measure() if Kit.HOST_MEASURE else self._scope_measure()
+
+    def update(self) -> None:
         """ Set the scope data """
-        def result(cmd):
-            x = self.query(cmd)
-            try:
-                x = float(x) if x else 0.0
-            except ValueError as e:
-                logging.error(f"{cmd}:{x} {e}")
-                x = 0.01
-            return x
-        freq = result(':MEASure:FREQuency?')
-        duty = result(':MEASure:PDUTy?')
-        vavg = result(':MEASure:VAVG?')
-        volt = result(':MEASure:VAMP?')
+        m = self._measure()
+        freq, duty, vavg, volt = m.freq, m.duty, m.vavg, m.vamp
+        self._measurement = m
+        self._data.time = time.time()
         self._data.date = datetime.datetime.now().strftime("%d-%m-%Y %H:%M:%S")
         self._data.freq = f"{round(freq / 1000, 2)}" if freq <= 9999 else self._data.freq
         self._data.duty = f"{round(duty * 100, 2)}%" if duty <= 9999 else self._data.duty
         self._data.vavg = f"{round(vavg, 2)}" if vavg <= 9999 else self._data.vavg
         self._data.volt = f"{round(volt, 2)}" if volt <= 9999 else self._data.volt
+        if Kit.HOST_MEASURE:
+            self._data.rise = f"{round(m.rise * 1000000, 2)}"
+            self._data.vrms = f"{round(m.vrms, 2)}"
+        if self.window:
+            self._spectrum_measure()
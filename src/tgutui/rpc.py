@@ -1,9 +1,18 @@
-import time
 import logging
+import functools
 from typing import Callable
-from jsonrpclib.SimpleJSONRPCServer import SimpleJSONRPCServer
+from threading import Event
+from jsonrpclib.SimpleJSONRPCServer import SimpleJSONRPCServer, SimpleJSONRPCRequestHandler
 from jsonrpclib import Server
 from tgutui.kit import Kit
+from tgutui.timing import tracer, metrics
+
+class LoggedRequestHandler(SimpleJSONRPCRequestHandler):
+    """ Send the request log lines to logging rather than writing them to stderr """
+
+    def log_message(self, format: str, *args):
+        logging.info(f"RPC {self.address_string()} {format % args}")
+
 
 class Rpc:
     """
@@ -20,17 +29,45 @@ class Rpc:
         self._server: SimpleJSONRPCServer = None
         self._registers: list[(Callable, str)] = []
         self.running: bool = False
+        self.ready: Event = Event()
+        self._error: Exception | None = None
+        self._serving: bool = False
 
     def request(self, method: str, *args) -> Server | None:
-        """ Make a request to a window with args """
+        """ Make a request to a window with args, passing on the trace id when tracing """
         address = f"http://{Rpc.HOST}:{self._client_port}"
         request = Server(address)
+        trace = tracer.current() if tracer.enabled else None
         try:
-            return getattr(request, method)(*args)
+            with tracer.span("rpc.request"), metrics.timed("rpc.request"):
+                if trace:
+                    return request.traced(trace, method, *args)
+                return getattr(request, method)(*args)
         except ConnectionRefusedError:
             logging.debug(f"Connection refused:{address}, {method}")
         return None
 
+    def traced(self, trace: str, name: str, *args):
+        """ Call a registered method under the caller's trace id """
+        for method, registered in self._registers:
+            if registered == name:
+                with tracer.trace(trace), tracer.span(f"rpc.{name}"):
+                    return method(*args)
+        raise ValueError(f"No method {name}")
+
+    @staticmethod
+    def _served(method: Callable) -> Callable:
+        """ Count and time the calls a remote window makes """
+        @functools.wraps(method)
+        def serve(*args):
+            with metrics.timed("rpc.serve"):
+                return method(*args)
+        return serve
+
+    def get_metrics(self) -> dict:
+        """ Return the performance counters of this process """
+        return metrics.snapshot()
+
     def register(self, method: Callable, name: str) -> None:
         """ Register a method for a remote window to call """
         self._registers.append((method, name))
@@ -38,33 +75,51 @@ class Rpc:
     def disconnect(self):
         """ Disconnect the RPC """
         self.running = False
-        if self._server:
+        self.ready.clear()
+        # shutdown waits for serve_forever, a server that only listened is just closed
+        if self._server and self._serving:
             self._server.shutdown()
+        elif self._server:
+            self._server.server_close()
         self._server = None
 
-    def connect(self):
-        """ Connect the RPC """
+    def listen(self):
+        """ Bind the RPC server, requests queue on the socket until serve is called """
         try:
             self._server = SimpleJSONRPCServer(
                 (Rpc.HOST, self._server_port),
+                requestHandler=LoggedRequestHandler,
                 logRequests=Kit.LOG_RPC,
             )
         except Exception as e:
             logging.error(f"{e}")
+            self._error = e
+            self.ready.set()
             raise e
         for method, name in self._registers:
-            self._server.register_function(method, name)
+            self._server.register_function(Rpc._served(method), name)
+        self._server.register_function(Rpc._served(self.traced), "traced")
+        self._server.register_function(self.get_metrics, "get_metrics")
         self.running = True
-        logging.info(f"RPC serving on port {self._server_port}")
-        self._server.serve_forever()
-
-    def check_started(self):
-        """ Wait for the Rpc service to start """
-        for _ in range(10):
-            time.sleep(0.1)
-            if self._server:
-                break
-        if not self._server:
+        self.ready.set()
+        logging.info(f"RPC listening on port {self._server_port}")
+
+    def serve(self):
+        """ Serve requests until disconnected """
+        self._serving = True
+        try:
+            self._server.serve_forever()
+        finally:
+            self._serving = False
+
+    def connect(self):
+        """ Connect the RPC """
+        self.listen()
+        self.serve()
+
+    def check_started(self, timeout: float = 1.0):
+        """ Wait for the Rpc service to listen """
+        if not self.ready.wait(timeout) or self._error:
             self.disconnect()
             msg = "Service did not start"
             logging.error(msg)
@@ -0,0 +1,394 @@
+"""
+Hardware free stand-ins that speak the same protocols as the bench:
+a PiPwm JSON-RPC server, a socket SCPI 1054Z whose channel 1 follows the
+simulated PWM, and a synthetic VideoCapture. Every call can be given a
+latency and jitter so timing problems can be reproduced without hardware.
+
+    python -m tgutui sim
+
+then run with RIGOL_IP=TCPIP::127.0.0.1::5555::SOCKET PIPWM_IP=127.0.0.1
+"""
+
+import re
+import time
+import random
+import logging
+import threading
+import socketserver
+from threading import Thread
+
+import numpy as np
+from jsonrpclib.SimpleJSONRPCServer import SimpleJSONRPCServer
+
+
+class Delay:
+    """ A latency with uniform jitter, both in seconds """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0) -> None:
+        self.latency = latency
+        self.jitter = jitter
+
+    def __call__(self):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class SimServer(socketserver.ThreadingTCPServer):
+    """ A threaded TCP server that can rebind its port straight after a restart """
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class SimSignal:
+    """
+    The PWM output shared by the simulated Pi and the simulated scope.
+    A sine shape ignores the duty cycle and swings between 0 and high.
+    """
+
+    def __init__(
+        self, freq: float = 1000.0, duty: float = 10.0, high: float = 3.3, noise: float = 0.02, shape: str = "square"
+    ) -> None:
+        self._lock = threading.Lock()
+        self.shape = shape
+        self.freq = freq
+        self.duty = duty
+        self.high = high
+        self.noise = noise
+        self.rise = 50e-9
+
+    def set(self, freq: float, duty: float):
+        """ Set the frequency in Hertz and the duty cycle in percent """
+        with self._lock:
+            self.freq = freq
+            self.duty = duty
+
+    def get(self) -> tuple[float, float]:
+        with self._lock:
+            return self.freq, self.duty
+
+    def waveform(self, points: int, xinc: float, start: int = 0) -> np.ndarray:
+        """ Return points samples of the output in volts """
+        freq, duty = self.get()
+        t = (start + np.arange(points)) * xinc
+        phase = (t * freq) % 1.0
+        if self.shape == "sine":
+            volts = self.high / 2 * (1 + np.sin(2 * np.pi * phase))
+        else:
+            volts = np.where(phase < duty / 100, self.high, 0.0)
+        return volts + np.random.normal(0, self.noise, points)
+
+
+class SimPwm:
+    """ A JSON-RPC server with the PiPwm methods driving a SimSignal """
+
+    def __init__(self, signal: SimSignal, host: str = "127.0.0.1", port: int = 34962, delay: Delay | None = None) -> None:
+        self.signal = signal
+        self.address = (host, port)
+        self.delay = delay if delay else Delay()
+        self._server: SimpleJSONRPCServer = None
+        self._thread: Thread = None
+
+    def _delayed(self, fn):
+        def call(*args):
+            self.delay()
+            return fn(*args)
+        call.__name__ = fn.__name__
+        return call
+
+    def set(self, freq: float, duty: float) -> dict:
+        self.signal.set(freq * 1000, duty)
+        return self.get_state()
+
+    def get_state(self) -> dict:
+        freq, duty = self.signal.get()
+        return {"freq": freq / 1000, "duty": duty, "running": True, "profile": False}
+
+    def change_duty(self, duty: int):
+        self.set(self.signal.get()[0] / 1000, duty)
+
+    def change_frequency(self, freq: int):
+        self.set(freq, self.signal.get()[1])
+
+    def run_profile(self, profile: dict) -> dict:
+        logging.warning("SimPwm: profiles are not simulated")
+        return self.profile_status()
+
+    def stop_profile(self) -> dict:
+        return self.profile_status()
+
+    def profile_status(self) -> dict:
+        return {"running": False}
+
+    def start(self):
+        self._server = SimpleJSONRPCServer(self.address, logRequests=False)
+        for method in [
+            self.set, self.get_state, self.change_duty, self.change_frequency,
+            self.run_profile, self.stop_profile, self.profile_status,
+        ]:
+            self._server.register_function(self._delayed(method), method.__name__)
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info(f"SimPwm serving on {self.address}")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        if self._thread:
+            self._thread.join()
+        self._server = None
+        self._thread = None
+
+
+class SimScope:
+    """
+    A raw socket SCPI server answering the commands Rigol sends to a 1054Z.
+    Channel 1 measures the SimSignal, the other channels are off.
+    """
+
+    IDN = "RIGOL TECHNOLOGIES,DS1054Z,SIM00000000,00.04.04"
+    POINTS = 1200
+    DEPTH = 24000
+
+    def __init__(self, signal: SimSignal, host: str = "127.0.0.1", port: int = 5555, delay: Delay | None = None) -> None:
+        self.signal = signal
+        self.address = (host, port)
+        self.delay = delay if delay else Delay()
+        self.source = 1
+        self.timebase = 0.0001
+        self.offsets = {channel: 0.0 for channel in range(1, 5)}
+        self.scales = {channel: 1.0 for channel in range(1, 5)}
+        self.mode = "NORM"
+        self.start_point = 1
+        self.stop_point = SimScope.POINTS
+        self._server: SimServer = None
+        self._thread: Thread = None
+
+    @staticmethod
+    def _short(header: str) -> str:
+        """ Reduce a SCPI header to its short form, :MEASure:FREQuency? becomes :MEAS:FREQ? """
+        return re.sub(r"[a-z]", "", header).upper()
+
+    def _xinc(self) -> float:
+        points = SimScope.POINTS if self.mode == "NORM" else SimScope.DEPTH
+        return self.timebase * 12 / points
+
+    def _yinc(self) -> float:
+        return self.scales[self.source] / 25
+
+    def _preamble(self) -> str:
+        points = SimScope.POINTS if self.mode == "NORM" else SimScope.DEPTH
+        return f"0,0,{points},1,{self._xinc()},{-self.timebase * 6},0,{self._yinc()},0,127"
+
+    def _data(self) -> bytes:
+        """ Return the waveform as a TMC block of bytes """
+        if self.mode == "NORM":
+            start, count = 0, SimScope.POINTS
+        else:
+            start = self.start_point - 1
+            count = max(min(self.stop_point, SimScope.DEPTH) - start, 0)
+        volts = self.signal.waveform(count, self._xinc(), start)
+        raw = np.clip(np.round(volts / self._yinc() + 127), 0, 255).astype(np.uint8)
+        return SimScope.block(raw.tobytes())
+
+    def _screen(self) -> bytes:
+        """ Return a PNG drawing of channel 1 as a TMC block """
+        import cv2
+        image = np.zeros((480, 800, 3), dtype=np.uint8)
+        volts = self.signal.waveform(800, self.timebase * 12 / 800)
+        ys = (240 - volts / self.scales[1] * 40).astype(np.int32)
+        image[np.clip(ys, 0, 479), np.arange(800)] = (0, 255, 255)
+        ok, png = cv2.imencode(".png", image)
+        return SimScope.block(png.tobytes() if ok else b"")
+
+    @staticmethod
+    def block(data: bytes) -> bytes:
+        """ Wrap data in an IEEE 488.2 definite length block """
+        size = str(len(data))
+        return f"#{len(size)}{size}".encode() + data + b"\n"
+
+    def _measure(self, short: str) -> str:
+        freq, duty = self.signal.get()
+        noise = 1 + random.gauss(0, 0.001)
+        high = self.signal.high
+        if self.signal.shape == "sine":
+            match short:
+                case ":MEAS:PDUT?":
+                    return f"{0.5 * noise:e}"
+                case ":MEAS:VAVG?":
+                    return f"{high / 2 * noise:e}"
+                case ":MEAS:VRMS?":
+                    return f"{high * np.sqrt(3 / 8) * noise:e}"
+                case ":MEAS:RTIM?":
+                    return f"{np.arcsin(0.8) / (np.pi * freq):e}"
+        match short:
+            case ":MEAS:FREQ?":
+                return f"{freq * noise:e}"
+            case ":MEAS:PDUT?":
+                return f"{duty / 100 * noise:e}"
+            case ":MEAS:VAVG?":
+                return f"{high * duty / 100 * noise:e}"
+            case ":MEAS:VAMP?":
+                return f"{high * noise:e}"
+            case ":MEAS:VRMS?":
+                return f"{high * np.sqrt(duty / 100) * noise:e}"
+            case ":MEAS:RTIM?":
+                return f"{self.signal.rise:e}"
+        return "9.9E37"
+
+    def handle(self, line: str) -> bytes | None:
+        """ Handle one command, return the reply of a query """
+        header, _, arg = line.strip().partition(" ")
+        short = SimScope._short(header)
+        channel = re.search(r"CHAN(\d)", short)
+        channel = int(channel.group(1)) if channel else self.source
+        if short == "*IDN?":
+            return f"{SimScope.IDN}\n".encode()
+        if short.startswith(":MEAS:SOUR"):
+            if short.endswith("?"):
+                return f"CHAN{self.source}\n".encode()
+            self.source = int(re.sub(r"\D", "", arg) or 1)
+            return None
+        if short.startswith(":MEAS:"):
+            return f"{self._measure(short)}\n".encode()
+        if short.endswith(":DISP?"):
+            return f"{1 if channel == 1 else 0}\n".encode()
+        if short.endswith(":OFFS?"):
+            return f"{self.offsets[channel]}\n".encode()
+        if short.endswith(":OFFS"):
+            self.offsets[channel] = float(arg)
+        if short == ":TIM:SCAL?":
+            return f"{self.timebase}\n".encode()
+        if short.endswith(":SCAL?"):
+            return f"{self.scales[channel]}\n".encode()
+        if short == ":TIM:SCAL":
+            self.timebase = float(arg)
+        elif short.endswith(":SCAL"):
+            self.scales[channel] = float(arg.rstrip("Vv"))
+        if short == ":WAV:SOUR":
+            self.source = int(re.sub(r"\D", "", arg) or 1)
+        if short == ":WAV:MODE":
+            self.mode = SimScope._short(arg)[:4]
+            self.start_point, self.stop_point = 1, SimScope.POINTS
+        if short == ":WAV:STAR":
+            self.start_point = int(arg)
+        if short == ":WAV:STOP":
+            self.stop_point = int(arg)
+        if short == ":WAV:PRE?":
+            return f"{self._preamble()}\n".encode()
+        if short == ":WAV:DATA?":
+            return self._data()
+        if short == ":DISP:DATA?":
+            return self._screen()
+        if short.endswith("?"):
+            return b"0\n"
+        return None
+
+    def start(self):
+        scope = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    scope.delay()
+                    reply = scope.handle(line.decode(errors="ignore"))
+                    if reply is not None:
+                        self.wfile.write(reply)
+                        self.wfile.flush()
+
+        self._server = SimServer(self.address, Handler)
+        # A port of 0 is given a free one
+        self.address = self._server.server_address
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info(f"SimScope serving on {self.address}")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        if self._thread:
+            self._thread.join()
+        self._server = None
+        self._thread = None
+
+
+class SimCapture:
+    """
+    A synthetic stand-in for cv2.VideoCapture. It paces read() to the frame rate,
+    draws a moving bar so frames differ, and keeps any property that is set.
+    """
+
+    def __init__(self, width: int = 640, height: int = 480, fps: float = 30, delay: Delay | None = None) -> None:
+        import cv2
+        self._cv2 = cv2
+        self._opened = False
+        self._frame = 0
+        self._next = 0.0
+        self.delay = delay if delay else Delay()
+        self._props = {
+            cv2.CAP_PROP_FRAME_WIDTH: float(width),
+            cv2.CAP_PROP_FRAME_HEIGHT: float(height),
+            cv2.CAP_PROP_FPS: float(fps),
+            cv2.CAP_PROP_PAN: 0.0,
+            cv2.CAP_PROP_TILT: 0.0,
+            cv2.CAP_PROP_ZOOM: 100.0,
+            cv2.CAP_PROP_FOCUS: 0.0,
+            cv2.CAP_PROP_AUTOFOCUS: 1.0,
+        }
+
+    def open(self, *args, **kwargs) -> bool:
+        self._opened = True
+        self._next = time.perf_counter()
+        return True
+
+    def isOpened(self) -> bool:
+        return self._opened
+
+    def release(self):
+        self._opened = False
+
+    def get(self, prop: int) -> float:
+        return self._props.get(prop, 0.0)
+
+    def set(self, prop: int, value: float) -> bool:
+        self.delay()
+        self._props[prop] = float(value)
+        return True
+
+    def read(self) -> tuple[bool, np.ndarray | None]:
+        if not self._opened:
+            return False, None
+        cv2 = self._cv2
+        width = int(self._props[cv2.CAP_PROP_FRAME_WIDTH])
+        height = int(self._props[cv2.CAP_PROP_FRAME_HEIGHT])
+        fps = self._props[cv2.CAP_PROP_FPS] or 30
+        wait = self._next - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        self._next = max(self._next + 1 / fps, time.perf_counter())
+        self.delay()
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        x = self._frame % width
+        frame[:, x:x + 8] = (0, 200, 0)
+        frame[:, :, 2] = int(self._props[cv2.CAP_PROP_FOCUS]) % 256
+        self._frame += 1
+        return True, frame
+
+
+def serve(pwm_port: int, scope_port: int, latency: float = 0.0, jitter: float = 0.0):
+    """ Run a simulated Pi and scope sharing one signal until interrupted """
+    signal = SimSignal()
+    pwm = SimPwm(signal, port=pwm_port, delay=Delay(latency, jitter))
+    scope = SimScope(signal, port=scope_port, delay=Delay(latency, jitter))
+    pwm.start()
+    scope.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pwm.stop()
+        scope.stop()
@@ -0,0 +1,88 @@
+""" Spectrum analysis of captured waveforms """
+
+from functools import lru_cache
+from dataclasses import dataclass
+
+import numpy as np
+
+from tgutui.measure import Waveform
+
+WINDOWS = ["hann", "hamming", "blackman", "flattop", "rect"]
+FLOOR_DB = -100.0
+
+
+@dataclass
+class Spectrum:
+    """ The single sided spectrum of a waveform """
+    freqs: np.ndarray
+    db: np.ndarray
+    peak: float = 0.0
+    thd: float = 0.0
+
+
+@lru_cache(maxsize=32)
+def window(name: str, size: int) -> tuple[np.ndarray, float]:
+    """ Return a read only window array and its coherent gain, cached per record length """
+    match name:
+        case "hann":
+            w = np.hanning(size)
+        case "hamming":
+            w = np.hamming(size)
+        case "blackman":
+            w = np.blackman(size)
+        case "flattop":
+            n = np.arange(size) * 2 * np.pi / max(size - 1, 1)
+            a = [0.21557895, 0.41663158, 0.277263158, 0.083578947, 0.006947368]
+            w = sum(((-1) ** k) * a[k] * np.cos(k * n) for k in range(len(a)))
+        case _:
+            w = np.ones(size)
+    w.setflags(write=False)
+    return w, float(w.sum())
+
+
+@lru_cache(maxsize=32)
+def frequencies(size: int, xinc: float) -> np.ndarray:
+    """ Return the read only frequency axis of a real FFT, cached per record length """
+    freqs = np.fft.rfftfreq(size, xinc)
+    freqs.setflags(write=False)
+    return freqs
+
+
+def _harmonic(magnitude: np.ndarray, index: int, span: int = 2) -> float:
+    """ Return the largest magnitude within span bins of index """
+    lo = max(index - span, 0)
+    return float(magnitude[lo:index + span + 1].max()) if lo < magnitude.size else 0.0
+
+
+def analyse(waveform: Waveform, name: str = "hann", harmonics: int = 5) -> Spectrum:
+    """ Window and transform a waveform, then find its peak frequency and THD """
+    volts = np.asarray(waveform.volts, dtype=float)
+    size = volts.size
+    w, gain = window(name, size)
+    freqs = frequencies(size, waveform.xinc)
+    magnitude = np.abs(np.fft.rfft((volts - volts.mean()) * w)) * (2 / gain)
+    with np.errstate(divide="ignore"):
+        db = np.maximum(20 * np.log10(magnitude), FLOOR_DB)
+    result = Spectrum(freqs=freqs, db=db)
+    if size < 4:
+        return result
+
+    index = int(np.argmax(magnitude[1:])) + 1
+    result.peak = float(freqs[index])
+    fundamental = float(magnitude[index])
+    if fundamental <= 0:
+        return result
+    orders = np.arange(2, harmonics + 1) * index
+    power = sum(_harmonic(magnitude, order) ** 2 for order in orders if order < magnitude.size)
+    result.thd = float(np.sqrt(power)) / fundamental
+    return result
+
+
+def bins(db: np.ndarray, width: int) -> np.ndarray:
+    """ Reduce a spectrum to width columns, keeping the peak of each column """
+    if width <= 0 or db.size == 0:
+        return np.empty(0)
+    if db.size <= width:
+        return db
+    edges = np.linspace(0, db.size, width + 1).astype(np.intp)[:-1]
+    return np.maximum.reduceat(db, edges)
@@ -0,0 +1,167 @@
+"""
+A local MJPEG over HTTP stream of the camera window's view for extra viewers
+
+    http://localhost:STREAM_PORT/               a page showing the stream
+    http://localhost:STREAM_PORT/stream.mjpg    the stream itself, for a browser, ffplay or mpv
+
+Each frame is encoded once however many viewers there are, and nothing is encoded
+while nobody watches. Every viewer is sent the newest frame when it is ready for one,
+so a slow viewer skips frames rather than holding up the window or the other viewers.
+"""
+
+import logging
+import threading
+from threading import Thread
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from tgutui.timing import metrics
+
+_PAGE = b"""<!DOCTYPE html>
+<html><head><title>TGUTUI</title></head>
+<body style="margin:0;background:#000"><img src="/stream.mjpg" style="max-width:100%"></body></html>
+"""
+
+
+class StreamHandler(BaseHTTPRequestHandler):
+    """ Serve the page and the stream, the stream to one viewer per thread """
+
+    server: "StreamServer"
+
+    def log_message(self, format: str, *args):
+        logging.info(f"Stream {self.address_string()} {format % args}")
+
+    def do_GET(self):
+        match self.path:
+            case "/" | "/index.html":
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(len(_PAGE)))
+                self.end_headers()
+                self.wfile.write(_PAGE)
+            case "/stream.mjpg":
+                self._stream()
+            case _:
+                self.send_error(404)
+
+    def _stream(self):
+        stream = self.server.stream
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={FrameStream.BOUNDARY}")
+        self.send_header("Cache-Control", "no-cache, private")
+        self.send_header("Pragma", "no-cache")
+        self.end_headers()
+        stream.joined()
+        try:
+            count = 0
+            while stream.running:
+                count, jpeg = stream.next(count)
+                if jpeg is None:
+                    continue
+                self.wfile.write(
+                    f"--{FrameStream.BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                    f"Content-Length: {len(jpeg)}\r\n\r\n".encode()
+                )
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+                metrics.count("stream.sent")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            stream.left()
+
+
+class StreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], stream: "FrameStream") -> None:
+        self.stream = stream
+        super().__init__(address, StreamHandler)
+
+
+class FrameStream:
+    """ The newest encoded frame, shared by every viewer of the HTTP stream """
+
+    HOST = "localhost"
+    BOUNDARY = "frame"
+    QUALITY = 80
+    WAIT = 1.0
+
+    def __init__(self, port: int, host: str = HOST) -> None:
+        self._address = (host, port)
+        self._frames = threading.Condition()
+        self._jpeg: bytes = b""
+        self._count = 0
+        self._clients = 0
+        self.running = False
+        self._server: StreamServer = None
+        self._thread: Thread = None
+
+    @property
+    def clients(self) -> int:
+        """ Return the number of viewers """
+        return self._clients
+
+    @property
+    def address(self) -> tuple[str, int]:
+        """ Return the host and port the stream is served on """
+        return self._server.server_address if self._server else self._address
+
+    def joined(self):
+        with self._frames:
+            self._clients += 1
+        logging.info(f"Stream: {self._clients} viewers")
+
+    def left(self):
+        with self._frames:
+            self._clients -= 1
+        logging.info(f"Stream: {self._clients} viewers")
+
+    def publish(self, frame: np.ndarray) -> bool:
+        """ Encode a frame once for every viewer, return False if nobody is watching """
+        if not self._clients:
+            return False
+        with metrics.timed("stream.encode"):
+            ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, FrameStream.QUALITY])
+        if not ok:
+            logging.warning("Stream: unable to encode frame")
+            return False
+        with self._frames:
+            self._jpeg = jpeg.tobytes()
+            self._count += 1
+            self._frames.notify_all()
+        return True
+
+    def next(self, last: int, timeout: float = WAIT) -> tuple[int, bytes | None]:
+        """ Wait for a frame newer than last, return its number and bytes, or None if none came """
+        with self._frames:
+            self._frames.wait_for(lambda: self._count != last or not self.running, timeout)
+            if self._count == last or not self.running:
+                return last, None
+            if last and self._count - last > 1:
+                metrics.count("stream.dropped", self._count - last - 1)
+            return self._count, self._jpeg
+
+    def open(self):
+        """ Start serving the stream """
+        self._server = StreamServer(self._address, self)
+        self.running = True
+        self._thread = Thread(target=self._server.serve_forever, name="stream", daemon=True)
+        self._thread.start()
+        host, port = self.address[:2]
+        logging.info(f"Stream on http://{host}:{port}/")
+
+    def close(self):
+        """ Stop the viewers and the server """
+        with self._frames:
+            self.running = False
+            self._frames.notify_all()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        if self._thread:
+            self._thread.join()
+        self._server = None
+        self._thread = None
@@ -0,0 +1,161 @@
+""" Characterise a PWM output on the scope over a grid of setpoints """
+
+import csv
+import math
+import time
+import logging
+import dataclasses
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from tgutui.measure import Measurements
+from tgutui.registry import ScopeInstrument, PwmInstrument
+
+METRICS = [field.name for field in dataclasses.fields(Measurements)]
+
+
+def grid(spec: str) -> list[float]:
+    """ Return the values of a "start:stop:step" range including stop, or a comma separated list """
+    if ":" not in spec:
+        return [float(value) for value in spec.split(",") if value]
+    start, stop, step = (float(value) for value in spec.split(":"))
+    if step == 0 or (stop - start) * step < 0:
+        raise ValueError(f"The step of {spec} must be non zero and go from start towards stop")
+    # Floored so the last value never goes past stop, the epsilon keeps an exact stop
+    count = math.floor((stop - start) / step + 1e-9) + 1
+    return [round(start + index * step, 9) for index in range(count)]
+
+
+class Settle:
+    """
+    A rolling window of readings that is settled once the relative standard
+    deviation of every watched metric is under the threshold
+    """
+
+    def __init__(self, size: int, threshold: float, watch: tuple[str, ...] = ("freq", "duty")) -> None:
+        self.threshold = threshold
+        self.watch = watch
+        self._rows: deque = deque(maxlen=size)
+
+    def clear(self):
+        self._rows.clear()
+
+    def add(self, measurement: Measurements):
+        self._rows.append(dataclasses.astuple(measurement))
+
+    @property
+    def samples(self) -> int:
+        return len(self._rows)
+
+    def stats(self) -> tuple[np.ndarray, np.ndarray]:
+        """ Return the mean and standard deviation of every metric """
+        rows = np.asarray(self._rows, dtype=float)
+        return rows.mean(axis=0), rows.std(axis=0)
+
+    @property
+    def settled(self) -> bool:
+        if len(self._rows) < self._rows.maxlen:
+            return False
+        mean, std = self.stats()
+        for name in self.watch:
+            index = METRICS.index(name)
+            scale = max(abs(mean[index]), 1e-9)
+            if std[index] / scale > self.threshold:
+                return False
+        return True
+
+
+class Sweep:
+    """
+    Step a PWM instrument through every frequency and duty setpoint and read the
+    scope at each one. A point is done once its readings settle, judged by a rolling
+    variance rather than a fixed sleep. The next setpoint is sent before the current
+    point's row is written, so the Pi round trip overlaps the file write, and only
+    readings whose measurement began after it was applied count towards the next point.
+    A Pi that does not apply a setpoint within the timeout stops the sweep.
+    """
+
+    def __init__(
+        self,
+        pwm: PwmInstrument,
+        scope: ScopeInstrument,
+        freqs: list[float],
+        duties: list[float],
+        path: str,
+        window: int = 5,
+        threshold: float = 0.01,
+        timeout: float = 10.0,
+    ) -> None:
+        self.pwm = pwm
+        self.scope = scope
+        self.points = [(freq, duty) for freq in freqs for duty in duties]
+        self.path = path
+        self.timeout = timeout
+        self._settle = Settle(window, threshold)
+        self._last: tuple[float, float] | None = None
+        self.cancelled = False
+
+    def _apply(self, freq: float, duty: float) -> Future:
+        """ Send the setpoint if it changes, frequency and duty change together """
+        if (freq, duty) == self._last:
+            future = Future()
+            future.set_result(None)
+            return future
+        self._last = (freq, duty)
+        return self.pwm.set(freq, duty)
+
+    def _read(self, applied: Future) -> tuple[bool, int, float]:
+        """ Collect readings until they settle or time out """
+        try:
+            applied.result(timeout=self.timeout)
+        except Exception as e:
+            logging.error(f"Sweep: the setpoint was not applied, stopping {type(e).__name__} {e}")
+            self.cancelled = True
+            return False, 0, 0.0
+        since = time.time()
+        self._settle.clear()
+        last = self.scope.started
+        while time.time() - since < self.timeout and not self.cancelled:
+            with self.scope.updated:
+                self.scope.updated.wait(timeout=1.0)
+            # A poll that began before the setpoint was applied may have measured the old output
+            started = self.scope.started
+            if started == last or started < since:
+                continue
+            last = started
+            self._settle.add(self.scope.measurement)
+            if self._settle.settled:
+                return True, self._settle.samples, time.time() - since
+        return False, self._settle.samples, time.time() - since
+
+    def run(self) -> int:
+        """ Run the sweep and write a row per point, return the number of points written """
+        began = time.time()
+        done = 0
+        header = ["freq_set", "duty_set", "settled", "samples", "seconds"]
+        header += METRICS + [f"{name}_std" for name in METRICS]
+        with open(self.path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            applied = self._apply(*self.points[0]) if self.points else None
+            for index, (freq, duty) in enumerate(self.points):
+                if self.cancelled:
+                    break
+                settled, samples, seconds = self._read(applied)
+                mean, std = self._settle.stats() if samples else (np.zeros(len(METRICS)),) * 2
+                # Send the next setpoint before this row is written, settling can not overlap
+                # as the readings of this point must be taken before the output changes
+                if index + 1 < len(self.points) and not self.cancelled:
+                    applied = self._apply(*self.points[index + 1])
+                writer.writerow([freq, duty, settled, samples, round(seconds, 3), *mean, *std])
+                f.flush()
+                done += 1
+                if not settled:
+                    logging.warning(f"Sweep: {freq} KHz {duty}% did not settle")
+        if self.cancelled:
+            logging.warning(f"Sweep: cancelled after {done} of {len(self.points)} points to {self.path}")
+        else:
+            logging.info(f"Sweep: {done} points in {time.time() - began:.1f}s to {self.path}")
+        return done
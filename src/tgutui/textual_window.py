@@ -1,18 +1,29 @@
+import os
+import sys
+import base64
 import logging
+import datetime
+import threading
 import traceback
-from jsonrpclib import Server
+import numpy as np
+from concurrent.futures import Future
+from rich.text import Text
 from textual.app import App
 
 from textual.timer import Timer
 from textual_slider import Slider
 from textual import on, work, events
 from textual.containers import Horizontal, Vertical
-from textual.widgets import Label, Button, Switch
+from textual.widgets import Label, Button, Switch, Static, ProgressBar
 from textual.app import ComposeResult
+from textual.widget import Widget
 
 from tgutui.kit import Kit, TextualKit
-from tgutui.rigol import Rigol
 from tgutui.rpc import Rpc
+from tgutui.timing import Startup, tracer, metrics
+from tgutui.rigol import Rigol
+from tgutui.registry import Registry, ScopeInstrument, PwmInstrument
+from tgutui.spectrum import WINDOWS, FLOOR_DB, Spectrum, bins
 
 
 class ScrollSlider(Slider):
@@ -25,6 +36,458 @@ class ScrollSlider(Slider):
         self.value = self.value + self.step
         event.stop()
 
+class SpectrumBar(Static):
+    """ A log magnitude bar graph of a spectrum, binned to the widget width """
+
+    BLOCKS = " ▁▂▃▄▅▆▇█"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._db: np.ndarray = np.empty(0)
+
+    def set_spectrum(self, spectrum: Spectrum | None) -> None:
+        """ Set the spectrum to draw """
+        self._db = spectrum.db if spectrum else np.empty(0)
+        self.refresh()
+
+    def render(self) -> Text:
+        """ Render the bars, one column per bin and eight levels per row """
+        width, height = self.size.width, self.size.height
+        db = bins(self._db, width)
+        if db.size == 0 or height <= 0:
+            return Text("")
+        levels = len(SpectrumBar.BLOCKS) - 1
+        scale = np.clip((db - FLOOR_DB) / -FLOOR_DB, 0, 1) * height * levels
+        rows = []
+        for row in range(height - 1, -1, -1):
+            cells = np.clip(scale - row * levels, 0, levels).astype(int)
+            rows.append("".join(SpectrumBar.BLOCKS[c] for c in cells))
+        return Text("\n".join(rows))
+
+class Changes:
+    """
+    Values waiting to be shown, one per widget with the last write winning.
+    apply only touches the widgets whose value differs from what they show,
+    all in one batched screen update. Values set here came from a remote or
+    polled source, so sliders and switches set them without posting Changed,
+    which would otherwise echo straight back out as a request.
+    """
+
+    def __init__(self) -> None:
+        self._pending: dict[int, tuple[Widget, object]] = {}
+
+    def set(self, widget: Widget, value: object) -> None:
+        """ Queue a value for a Label, Slider or Switch """
+        self._pending[id(widget)] = (widget, value)
+
+    @staticmethod
+    def _shown(widget: Widget) -> object:
+        return str(widget.renderable) if isinstance(widget, Static) else widget.value
+
+    def apply(self, app: App) -> int:
+        """ Show the values that changed, return how many widgets were updated """
+        pending, self._pending = self._pending, {}
+        changed = [(widget, value) for widget, value in pending.values() if self._shown(widget) != value]
+        if not changed:
+            return 0
+        with app.batch_update():
+            for widget, value in changed:
+                if isinstance(widget, Static):
+                    widget.update(value)
+                    continue
+                with widget.prevent(Slider.Changed, Switch.Changed):
+                    widget.value = value
+        return len(changed)
+
+
+class PwmPanel(Vertical):
+    """ The controls of one Pi PWM endpoint """
+
+    def __init__(self, instrument: PwmInstrument, header: str, changes: Changes, classes: str = "header") -> None:
+        super().__init__(classes="panel")
+        self.instrument = instrument
+        self.changes = changes
+        self._header = Label(header, classes=classes)
+        name = instrument.name
+        self.pwm_freq_slider = ScrollSlider(id=f"{name}_pwm_freq_slider", min=1, max=100, step=1, value=1)
+        self.pwm_duty_slider = ScrollSlider(id=f"{name}_pwm_duty_slider", min=0, max=90, step=10, value=0)
+        self.pwm_freq = Label(str(self.pwm_freq_slider.value), classes="data")
+        self.pwm_duty = Label(str(self.pwm_duty_slider.value), classes="data")
+        self.sweep_switch = Switch(id=f"{name}_sweep_switch", value=False)
+        self.sweep_status = Label("", classes="data")
+        self._state: dict = {}
+
+    def update_data(self):
+        """ Resync the sliders when the Pi's state is read back and show the progress of a sweep """
+        state = self.instrument.state
+        if state is not self._state:
+            self._state = state
+            if "freq" in state and not self.instrument.profile.get("running"):
+                self.changes.set(self.pwm_freq_slider, state["freq"])
+                self.changes.set(self.pwm_freq, str(state["freq"]))
+                self.changes.set(self.pwm_duty_slider, state["duty"])
+                self.changes.set(self.pwm_duty, str(state["duty"]))
+        profile = self.instrument.profile
+        if "index" in profile:
+            self.changes.set(self.sweep_status, f"{profile['index']}/{profile['total']}")
+        if not profile.get("running"):
+            self.changes.set(self.sweep_switch, False)
+
+    @on(Switch.Changed)
+    def _switch(self, event: Switch.Changed):
+        """ Run the frequency slider's whole range as one ramp on the Pi """
+        match event.switch.id:
+            case self.sweep_switch.id:
+                if event.switch.value and not self.instrument.profile.get("running"):
+                    self.instrument.profile = {"running": True}
+                    self.instrument.run_profile({
+                        "type": "ramp",
+                        "target": "freq",
+                        "start": self.pwm_freq_slider.min,
+                        "stop": self.pwm_freq_slider.max,
+                        "step": self.pwm_freq_slider.step,
+                        "interval": Kit.SWEEP_INTERVAL_MS / 1000,
+                    })
+                elif not event.switch.value and self.instrument.profile.get("running"):
+                    self.instrument.stop_profile()
+        event.stop()
+
+    @on(ScrollSlider.Changed)
+    @tracer.traced("ui.slider")
+    def _slider(self, event: ScrollSlider.Changed):
+        """ Handle the PWM slider events """
+        value = event.slider.value
+        match event.slider.id:
+            case self.pwm_duty_slider.id:
+                self.instrument.change_duty(value)
+                self.pwm_duty.update(str(value))
+            case self.pwm_freq_slider.id:
+                self.instrument.change_frequency(value)
+                self.pwm_freq.update(str(value))
+        event.stop()
+
+    def compose(self) -> ComposeResult:
+        """ Compose the panel """
+        yield self._header
+        with Horizontal():
+            yield Label("Duty")
+            yield self.pwm_duty
+            yield self.pwm_duty_slider
+        with Horizontal():
+            yield Label("KHz")
+            yield self.pwm_freq
+            yield self.pwm_freq_slider
+        with Horizontal():
+            yield Label("Sweep")
+            yield self.sweep_status
+            yield self.sweep_switch
+
+
+class ScopePanel(Vertical):
+    """ The measurements and controls of one scope """
+
+    VOLTS_MAP = [0.2,0.5, 1, 2, 5]
+    TIMES_MAP = [
+        0.000005,
+        0.00005,
+        0.0001,
+        0.0002,
+        0.0005,
+        0.001
+    ]
+
+    def __init__(self, instrument: ScopeInstrument, header: str, changes: Changes, classes: str = "header") -> None:
+        super().__init__(classes="panel")
+        self.instrument = instrument
+        self.changes = changes
+        self._header = Label(header, classes=classes)
+        name = instrument.name
+        self.scope_hertz = Label("", classes="data")
+        self.scope_vamp = Label("", classes="data")
+        self.scope_vavg = Label("", classes="data")
+        self.scope_duty = Label("", classes="data")
+        self.scope_peak = Label("", classes="data")
+        self.scope_thd = Label("", classes="data")
+        self.spectrum_bar = SpectrumBar()
+        self._spectrum: Spectrum | None = None
+        self.spectrum_switch = Switch(id=f"{name}_spectrum_switch", value=False)
+        self.window_slider = ScrollSlider(id=f"{name}_window_slider", min=0, max=len(WINDOWS) - 1, step=1, value=0)
+        self.spectrum_window = Label(WINDOWS[self.window_slider.value], classes="data")
+
+        self.channel_slider = ScrollSlider(id=f"{name}_channel_slider", min=1, max=2, step=1, value=1)
+        self.offset_slider = ScrollSlider(id=f"{name}_offset_slider", min=-2.0, max=2.0, step=0.1, value=0.0)
+        self.volts_slider = ScrollSlider(id=f"{name}_volts_slider", min=0, max=4, step=1, value=0)
+        self.time_slider = ScrollSlider(id=f"{name}_time_slider", min=0, max=6, step=1, value=0)
+        self.scope_channel = Label(str(self.channel_slider.value), classes="data")
+        self.scope_offset = Label(str(self.offset_slider.value), classes="data")
+        self.scope_volts = Label(str(ScopePanel.VOLTS_MAP[self.volts_slider.value]), classes="data")
+        self.scope_time = Label(str(ScopePanel.TIMES_MAP[self.time_slider.value] * 10000), classes="data")
+        self.deep_switch = Switch(id=f"{name}_deep_switch", value=False)
+        self.deep_progress = ProgressBar(total=None, show_eta=False)
+        self._deep_cancel = threading.Event()
+
+    @property
+    def rigol(self) -> Rigol:
+        """ The panel's scope """
+        return self.instrument.rigol
+
+    def update_data(self):
+        """ Update the labels from the latest snapshot the scope thread published """
+        data = self.instrument.data
+        self.changes.set(self.scope_hertz, data.freq)
+        self.changes.set(self.scope_vamp, data.volt)
+        self.changes.set(self.scope_vavg, data.vavg)
+        self.changes.set(self.scope_duty, data.duty)
+        if self.rigol.window:
+            self.changes.set(self.scope_peak, data.peak)
+            self.changes.set(self.scope_thd, data.thd)
+            if self.instrument.spectrum is not self._spectrum:
+                self._spectrum = self.instrument.spectrum
+                self.spectrum_bar.set_spectrum(self._spectrum)
+
+    @on(Switch.Changed)
+    def _switch(self, event: Switch.Changed):
+        """ Handle the spectrum switch """
+        value = event.switch.value
+        match event.switch.id:
+            case self.spectrum_switch.id:
+                self.rigol.window = WINDOWS[self.window_slider.value] if value else None
+                self.spectrum_bar.display = value
+            case self.deep_switch.id:
+                if value:
+                    self._start_deep()
+                else:
+                    self._deep_cancel.set()
+        event.stop()
+
+    def _start_deep(self):
+        """
+        Queue a deep memory capture of the active channel. Live polling is paused
+        until the capture is done or cancelled.
+        """
+        self._deep_cancel.clear()
+        self.instrument.pause()
+        self.deep_progress.update(total=None, progress=0)
+        name = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        channel = int(self.channel_slider.value)
+        path = os.path.join(Kit.CAPTURE_DIR, f"{self.instrument.name}_ch{channel}_{name}.u8")
+        future = self.instrument.submit(
+            self.rigol.capture_deep, channel, path, self._deep_progress, self._deep_cancel
+        )
+        future.add_done_callback(self._deep_done)
+
+    def _deep_progress(self, written: int, points: int):
+        """ Show the capture progress, called on the scope thread """
+        self.app.call_from_thread(self.deep_progress.update, total=points, progress=written)
+
+    def _deep_done(self, future: Future):
+        """ Resume polling and reset the capture switch once the capture has finished """
+        self.instrument.resume()
+        if future.exception():
+            logging.error(f"Deep capture: {future.exception()}")
+        self.app.call_from_thread(setattr, self.deep_switch, "value", False)
+
+    @on(ScrollSlider.Changed)
+    @tracer.traced("ui.slider")
+    def _slider(self, event: ScrollSlider.Changed):
+        """ Handle the scope slider events, the scope is only written on its own thread """
+        value = event.slider.value
+        match event.slider.id:
+            case self.channel_slider.id:
+                self.scope_channel.update(str(value))
+                future = self.instrument.submit(self._fetch_source, value)
+                future.add_done_callback(self._source_fetched)
+            case self.offset_slider.id:
+                value = round(value, 2)
+                self.instrument.submit(self.rigol.set_offset, value)
+                self.scope_offset.update(str(value))
+            case self.volts_slider.id:
+                value = ScopePanel.VOLTS_MAP[value]
+                self.instrument.submit(self.rigol.set_volts, value)
+                self.scope_volts.update(str(value))
+            case self.time_slider.id:
+                value = ScopePanel.TIMES_MAP[value]
+                self.instrument.submit(self.rigol.set_time, value)
+                self.scope_time.update(str(value * 1000000))
+            case self.window_slider.id:
+                self.spectrum_window.update(WINDOWS[value])
+                if self.spectrum_switch.value:
+                    self.rigol.window = WINDOWS[value]
+        event.stop()
+
+    def _fetch_source(self, channel: int) -> tuple[float, float, float] | None:
+        """ Select a channel and read back its settings, run on the scope thread """
+        self.rigol.set_source(channel)
+        if not self.rigol.is_connected:
+            return None
+        return self.rigol.get_offset(), self.rigol.get_volts(), self.rigol.get_time()
+
+    def _source_fetched(self, future: Future):
+        """ Hand the channel settings back to the UI thread """
+        if future.exception() or future.result() is None:
+            return
+        self.app.call_from_thread(self._source_selected, *future.result())
+
+    def _source_selected(self, offset: float, volts: float, times: float):
+        """
+        Updates the offset, volts, and time sliders based on the current settings of the Rigol device.
+        The values came from the scope so they are not written back to it.
+        """
+        self.changes.set(self.offset_slider, offset)
+        self.changes.set(self.scope_offset, str(round(offset, 2)))
+        self.changes.set(self.volts_slider, ScopePanel.VOLTS_MAP.index(volts))
+        self.changes.set(self.scope_volts, str(volts))
+        self.changes.set(self.time_slider, ScopePanel.TIMES_MAP.index(times))
+        self.changes.set(self.scope_time, str(times * 1000000))
+        self.changes.apply(self.app)
+
+    def _source_read(self, future: Future):
+        """ Hand the active channel back to the UI thread """
+        if future.exception() or not future.result():
+            return
+        self.app.call_from_thread(self._source_changed, future.result())
+
+    def _source_changed(self, channel: int):
+        """ Show the active channel and read back its settings """
+        self.changes.set(self.channel_slider, channel)
+        self.changes.set(self.scope_channel, str(channel))
+        self.changes.apply(self.app)
+        future = self.instrument.submit(self._fetch_source, channel)
+        future.add_done_callback(self._source_fetched)
+
+    def on_mount(self):
+        """ Read the active channel once the scope thread has connected """
+        self.instrument.submit(self.rigol.get_source).add_done_callback(self._source_read)
+
+    def compose(self) -> ComposeResult:
+        """ Compose the panel """
+        yield self._header
+        with Horizontal(classes="right_top height_one"):
+            yield Label("KHz")
+            yield Label("Duty")
+            yield Label("VAmp")
+            yield Label("VAvg")
+        with Horizontal(classes="right_top height_one mag_bot_one"):
+            yield self.scope_hertz
+            yield self.scope_duty
+            yield self.scope_vamp
+            yield self.scope_vavg
+        with Horizontal():
+            yield Label("Channel")
+            yield self.scope_channel
+            yield self.channel_slider
+        with Horizontal():
+            yield Label("Offset")
+            yield self.scope_offset
+            yield self.offset_slider
+        with Horizontal():
+            yield Label("Volts")
+            yield self.scope_volts
+            yield self.volts_slider
+        with Horizontal():
+            yield Label("Time us")
+            yield self.scope_time
+            yield self.time_slider
+        with Horizontal():
+            yield Label("Deep Capture", classes="long_label")
+            yield self.deep_switch
+            yield self.deep_progress
+        with Horizontal():
+            yield Label("Spectrum", classes="long_label")
+            yield self.spectrum_switch
+        with Horizontal():
+            yield Label("Window")
+            yield self.spectrum_window
+            yield self.window_slider
+        with Horizontal(classes="right_top height_one"):
+            yield Label("Peak KHz")
+            yield Label("THD")
+        with Horizontal(classes="right_top height_one"):
+            yield self.scope_peak
+            yield self.scope_thd
+        yield self.spectrum_bar
+
+
+class MetricsPanel(Vertical):
+    """ Live performance counters of this window and of the camera window """
+
+    INTERVAL = 1.0
+
+    def __init__(self, rpc: Rpc, classes: str = "header") -> None:
+        super().__init__(classes="panel")
+        self.rpc = rpc
+        self._header = Label("Metrics", classes=classes)
+        self.table = Static("", classes="metrics")
+        self._last: dict[str, dict] = {}
+        self._timer: Timer = None
+        self.display = False
+
+    def show(self, state: bool):
+        """ Show the panel and poll the counters while it is shown """
+        self.display = state
+        if self._timer:
+            self._timer.stop()
+            self._timer = None
+        if state:
+            self._fetch()
+            self._timer = self.set_interval(MetricsPanel.INTERVAL, self._fetch)
+
+    @work(exclusive=True, thread=True)
+    def _fetch(self):
+        """ Read both windows' counters off the UI thread """
+        try:
+            camera = self.rpc.request("get_metrics")
+        except Exception as e:
+            logging.debug(f"Metrics: {e}")
+            camera = None
+        self.app.call_from_thread(self._update, {"textual": metrics.snapshot(), "camera": camera})
+
+    def _rate(self, source: str, snapshot: dict, name: str) -> float:
+        """ Return the per second rate of a counter or histogram count since the last snapshot """
+        def total(s: dict) -> int:
+            if name in s["counters"]:
+                return s["counters"][name]
+            return s["histograms"].get(name, {}).get("count", 0)
+        last = self._last.get(source)
+        if not last or snapshot["time"] <= last["time"]:
+            return 0.0
+        return (total(snapshot) - total(last)) / (snapshot["time"] - last["time"])
+
+    @staticmethod
+    def _latency(snapshot: dict | None, name: str) -> str:
+        histogram = snapshot["histograms"].get(name) if snapshot else None
+        if not histogram:
+            return "-"
+        return f"avg {histogram['mean_ms']:.2f} p50 {histogram['p50_ms']:.2f} p99 {histogram['p99_ms']:.2f}ms"
+
+    def _update(self, snapshots: dict[str, dict | None]):
+        textual, camera = snapshots["textual"], snapshots["camera"]
+        rows = []
+        if camera:
+            counters = camera["counters"]
+            rows.append(
+                f"Frames   {counters.get('frames.captured', 0)} captured {counters.get('frames.shown', 0)} shown "
+                f"{counters.get('frames.skipped', 0)} skipped {self._rate('camera', camera, 'frames.shown'):.1f}/s"
+            )
+            rows.append(f"Encode   {self._latency(camera, 'frame.encode')}")
+            rows.append(f"Display  {self._latency(camera, 'frame.display')}")
+            rows.append(f"Cam RPC  {self._rate('camera', camera, 'rpc.request'):.1f}/s {self._latency(camera, 'rpc.request')}")
+        else:
+            rows.append("Camera   not answering")
+        rows.append(f"RPC      {self._rate('textual', textual, 'rpc.request'):.1f}/s {self._latency(textual, 'rpc.request')}")
+        rows.append(f"Scope    {self._rate('textual', textual, 'rigol.update'):.1f}Hz {self._latency(textual, 'rigol.update')}")
+        rows.append(f"Pi       {self._latency(textual, 'pi.call')}")
+        self.table.update("\n".join(rows))
+        for source, snapshot in snapshots.items():
+            if snapshot:
+                self._last[source] = snapshot
+
+    def compose(self) -> ComposeResult:
+        """ Compose the panel """
+        yield self._header
+        yield self.table
+
+
 class TextualWindow(App):
     """ This class contains all the Textual widgets to control the camera, scope and Pi PWM """
 
@@ -46,6 +509,9 @@ class TextualWindow(App):
         border-bottom: tall $accent;
         background: $primary-background;
     }
+    .panel {
+        height: auto;
+    }
     .header {
         width: 100%;
         color: #f8ac6b;
@@ -77,6 +543,22 @@ class TextualWindow(App):
             text-style: dim;
             color: $success-lighten-1;
         }
+        & ProgressBar {
+            height: 1;
+            padding-left: 1;
+        }
+        & SpectrumBar {
+            height: 4;
+            width: 100%;
+            color: $success-lighten-1;
+            display: none;
+        }
+        & .metrics {
+            width: 100%;
+            height: auto;
+            text-style: dim;
+            color: $success-lighten-1;
+        }
         & .height_one {
             height: 1;
         }
@@ -110,49 +592,52 @@ class TextualWindow(App):
         }
     }
     """
+    SCREEN_TIMEOUT = 5.0
 
     def __init__(self) -> None:
         super().__init__()
+        self.startup = Startup("Textual window")
         self.kit = TextualKit()
         self.kit.load_config()
         self.kit.adjust_font()
         if Kit.LAUNCHED:
             self.kit.resize()
 
-        self.rigol = Rigol()
+        if Kit.REPLAY_DIR:
+            from tgutui.replay import replay_registry
+            self.registry = replay_registry(Kit.REPLAY_DIR, Kit.REPLAY_SPEED)
+        else:
+            self.registry = Registry.load(Kit.INSTRUMENTS_FILE)
         self.rpc = Rpc(server=Kit.CAMERA_PORT, client=Kit.TEXTUAL_PORT)
         self.rpc.register(self.update_camera_data, "update_camera")
         self.rpc.register(self.textual_ack, "textual_ack")
-        self.pi = Server(f"http://{Kit.PIPWM_IP}:{Kit.PIPWM_PORT}")
-        self._volts_map = [0.2,0.5, 1, 2, 5]
-        self._times_map = [
-            0.000005,
-            0.00005,
-            0.0001,
-            0.0002,
-            0.0005,
-            0.001
+        self.rpc.register(self.scope_screen, "scope_screen")
+        self.startup.mark("registry")
+
+        # Each instrument gets its own panel, the first panel has no top border
+        self.changes = Changes()
+        self._sent: dict[str, str] = {}
+        panels = len(self.registry.pwms) + len(self.registry.scopes)
+        classes = ["header"] + ["header border-top"] * panels
+        self.pwm_panels = [
+            PwmPanel(pwm, self._header("PWM", pwm.name, self.registry.pwms), self.changes, classes.pop(0))
+            for pwm in self.registry.pwms
+        ]
+        self.scope_panels = [
+            ScopePanel(
+                scope, self._header("Oscilloscope", scope.name, self.registry.scopes), self.changes, classes.pop(0)
+            )
+            for scope in self.registry.scopes
         ]
+        self._camera_classes = classes.pop(0)
 
         self.rigol_timer: Timer = None
-        self.scope_hertz = Label("", classes="data")
-        self.scope_vamp = Label("", classes="data")
-        self.scope_vavg = Label("", classes="data")
-        self.scope_duty = Label("", classes="data")
-
-        self.pwm_freq_slider = ScrollSlider(id="pwm_freq_slider",min=1, max=100, step=1, value=1)
-        self.pwm_duty_slider = ScrollSlider(id="pwm_duty_slider",min=0, max=90, step=10, value=0)
-        self.channel_slider = ScrollSlider(id="channel_slider", min=1, max=2, step=1, value=1)
-        self.offset_slider = ScrollSlider(id="offset_slider", min=-2.0, max=2.0, step=0.1, value=0.0)
-        self.volts_slider = ScrollSlider(id="volts_slider", min=0, max=4, step=1, value=0)
-        self.time_slider = ScrollSlider(id="time_slider", min=0, max=6, step=1, value=0)
-        self.pwm_freq = Label(str(self.pwm_freq_slider.value), classes="data")
-        self.pwm_duty = Label(str(self.pwm_duty_slider.value), classes="data")
-        self.scope_channel = Label(str(self.channel_slider.value), classes="data")
-        self.scope_offset = Label(str(self.offset_slider.value), classes="data")
-        self.scope_volts = Label(str(self._volts_map[self.volts_slider.value]), classes="data")
-        self.scope_time = Label(str(self._times_map[self.time_slider.value] * 10000), classes="data")
 
+        self.camera_index = 0
+        self.camera_slider = ScrollSlider(id="camera_slider", min=0, max=1, step=1, value=0)
+        self.camera_number = Label("1", classes="data")
+        self.camera_row = Horizontal()
+        self.camera_row.display = False
         self.focus_switch = Switch(id="focus_switch")
         self.zoom_slider = ScrollSlider(id="zoom_slider",min=100, max=400, step=10, value=100,)
         self.focus_slider = ScrollSlider(id="focus_slider", min=0, max=255, step=5, value=0)
@@ -163,51 +648,87 @@ class TextualWindow(App):
         self.camera_pan = Label(str(self.pan_slider.value), classes="data")
         self.camera_tilt = Label(str(self.tilt_slider.value), classes="data")
         self.argumented_switch = Switch(id="argumented_switch", value=False)
+        self.record_switch = Switch(id="record_switch", value=False)
+        self.metrics_switch = Switch(id="metrics_switch", value=False)
+        self.metrics_panel = MetricsPanel(self.rpc, "header border-top")
+        self.startup.mark("init")
+
+    @staticmethod
+    def _header(title: str, name: str, instruments: list) -> str:
+        """ Only name the instrument in the header when there is more than one """
+        return title if len(instruments) == 1 else f"{title} {name}"
 
     def textual_ack(self):
         """ Acknowledge the connection to the camera window"""
         return True
 
+    def scope_screen(self) -> str:
+        """
+        Return the first scope's display as base64 PNG, fetched on its instrument thread
+        so it queues with the measurements on the one connection. This is called by the Camera Window
+        """
+        if not self.scope_panels:
+            return ""
+        scope = self.scope_panels[0].instrument
+        bitmap = scope.submit(scope.rigol.screen).result(timeout=TextualWindow.SCREEN_TIMEOUT)
+        return base64.b64encode(bitmap).decode() if bitmap else ""
+
     def update_camera_data(self, key: str, value: str | int):
-        """Update the camera data based on the given property and value """
+        """Update the camera data based on the given property and value. This is called by the Camera Window """
+        self.call_from_thread(self._camera_changed, key, value)
+
+    def _camera_changed(self, key: str, value: str | int):
+        """ Show the camera's value without sending it back to the camera """
         match key:
+            case "count":
+                self.camera_slider.max = max(value - 1, 1)
+                self.camera_row.display = value > 1
             case "auto_focus":
-                self.focus_switch.value = value
+                self.changes.set(self.focus_switch, bool(value))
+                self.focus_slider.disabled = bool(value)
             case "focus":
-                self.focus_slider.value = value
-                self.camera_focus.update(str(value))
+                self.changes.set(self.focus_slider, value)
+                self.changes.set(self.camera_focus, str(value))
             case "zoom":
-                self.zoom_slider.value = value
-                self.camera_zoom.update(str(value))
+                self.changes.set(self.zoom_slider, value)
+                self.changes.set(self.camera_zoom, str(value))
+                self.pan_slider.disabled = value <= 100
+                self.tilt_slider.disabled = value <= 100
             case "pan":
-                self.pan_slider.value = value
-                self.camera_pan.update(str(value))
+                self.changes.set(self.pan_slider, value)
+                self.changes.set(self.camera_pan, str(value))
             case "tilt":
-                self.tilt_slider.value = value
-                self.camera_tilt.update(str(value))
+                self.changes.set(self.tilt_slider, value)
+                self.changes.set(self.camera_tilt, str(value))
+        self.changes.apply(self)
 
     def update_rigol_data(self):
-        """Update the Rigol data and update the corresponding scope values.
+        """Update every scope panel from the data its scope thread last published.
 
-        This method updates the Rigol data by calling the `update` method of the `rigol` object.
-        It then updates the scope values (`freq`, `volt`, `vavg`, `duty`) by calling the `update` method
-        of the corresponding `scope_hertz`, `scope_vamp`, `scope_vavg`, and `scope_duty` objects.
-
-        If the `argumented_switch` value is True, it also sends the updated scope data to the RPC server
-        by making requests using the `rpc` object.
+        The scopes are polled on their own threads, so this never waits on the network.
+        If the `argumented_switch` value is True, the first scope's data is also sent
+        to the camera window by making requests using the `rpc` object.
         """
-        self.rigol.update()
-        self.scope_hertz.update(self.rigol.data.freq)
-        self.scope_vamp.update(self.rigol.data.volt)
-        self.scope_vavg.update(self.rigol.data.vavg)
-        self.scope_duty.update(self.rigol.data.duty)
-        # Much better to pass these as one dict/json
-        if self.argumented_switch.value:
-            self.rpc.request("set_scope_data", "date", self.rigol.data.date)
-            self.rpc.request("set_scope_data", "freq", self.rigol.data.freq)
-            self.rpc.request("set_scope_data", "vavg", self.rigol.data.vavg)
-            self.rpc.request("set_scope_data", "duty", self.rigol.data.duty)
-            self.rpc.request("set_scope_data", "volt", self.rigol.data.volt)
+        for panel in self.pwm_panels:
+            panel.update_data()
+        for panel in self.scope_panels:
+            panel.update_data()
+        self.changes.apply(self)
+        if not self.scope_panels:
+            return
+        data = self.scope_panels[0].instrument.data
+        if not self.argumented_switch.value:
+            self._sent.clear()
+            return
+        # Much better to pass these as one dict/json, only the fields that changed are sent
+        fields = ["date", "freq", "vavg", "duty", "volt"]
+        if self.scope_panels[0].rigol.window:
+            fields += ["peak", "thd"]
+        for field in fields:
+            value = getattr(data, field)
+            if self._sent.get(field) != value:
+                self.rpc.request("set_scope_data", field, value)
+                self._sent[field] = value
 
     @on(Switch.Changed)
     def _switch(self, event: Switch.Changed):
@@ -217,56 +738,50 @@ class TextualWindow(App):
             case self.focus_switch.id:
                 self.focus_slider.disabled = value
                 value = 1 if value else 0
-                self.rpc.request("update_camera", "auto_focus", value)
+                self.rpc.request("update_camera", "auto_focus", value, self.camera_index)
             case self.argumented_switch.id:
                 self.rpc.request("update_argumented", value)
+            case self.record_switch.id:
+                self.rpc.request("record_video", value)
+            case self.metrics_switch.id:
+                self.metrics_panel.show(value)
 
     @on(ScrollSlider.Changed)
+    @tracer.traced("ui.slider")
     def _slider(self, event: ScrollSlider.Changed):
         """ Handle slider events and update corresponding values. """
         value = event.slider.value
         match event.slider.id:
-            case self.channel_slider.id:
-                self.rigol.set_source(value)
-                self.scope_channel.update(str(value))
-                self._source_selected()
-            case self.offset_slider.id:
-                value = round(value, 2)
-                self.rigol.set_offset(value)
-                self.scope_offset.update(str(value))
-            case self.volts_slider.id:
-                value = self._volts_map[value]
-                self.rigol.set_volts(value)
-                self.scope_volts.update(str(value))
-            case self.time_slider.id:
-                value = self._times_map[value]
-                self.rigol.set_time(value)
-                self.scope_time.update(str(value * 1000000))
+            case self.camera_slider.id:
+                self.camera_index = value
+                self.camera_number.update(str(value + 1))
+                self._select_camera(value)
             case self.pan_slider.id:
-                self.rpc.request("update_camera", "pan", value)
+                self.rpc.request("update_camera", "pan", value, self.camera_index)
                 self.camera_pan.update(str(value))
             case self.zoom_slider.id:
                 disable = True if value <= 100 else False
-                self.rpc.request("update_camera", "zoom", value)
+                self.rpc.request("update_camera", "zoom", value, self.camera_index)
                 self.camera_zoom.update(str(value))
                 self.pan_slider.disabled = disable
                 self.tilt_slider.disabled = disable
             case self.focus_slider.id:
-                self.rpc.request("update_camera", "focus", value)
+                self.rpc.request("update_camera", "focus", value, self.camera_index)
                 self.camera_focus.update(str(value))
             case self.tilt_slider.id:
-                self.rpc.request("update_camera", "tilt", value)
+                self.rpc.request("update_camera", "tilt", value, self.camera_index)
                 self.camera_tilt.update(str(value))
-            case self.pwm_duty_slider.id:
-                if Kit.USE_PIPWM:
-                    self.pi.change_duty(value)
-                    self.pwm_duty.update(str(value))
-            case self.pwm_freq_slider.id:
-                if Kit.USE_PIPWM:
-                    self.pi.change_frequency(value)
-                    self.pwm_freq.update(str(value))
 
 
+    @work(exclusive=True, thread=True)
+    def _select_camera(self, index: int):
+        """ Show the settings of the selected camera """
+        data = self.rpc.request("select_camera", index)
+        if not data:
+            return
+        for key, value in data.items():
+            self.call_from_thread(self._camera_changed, key, value)
+
     @on(Button.Pressed)
     def _button(self, event: Button.Pressed):
         """ Handle button events. """
@@ -275,37 +790,29 @@ class TextualWindow(App):
                 self.rpc.request("close_window")
                 self.stop()
 
-    def _source_selected(self):
-        """
-        Updates the offset, volts, and time sliders based on the current settings of the Rigol device.
-        """
-        if not Kit.USE_RIGOL:
-            return
-        self.offset_slider.value = self.rigol.get_offset()
-        volts = self._volts_map.index(self.rigol.get_volts())
-        times = self._times_map.index(self.rigol.get_time())
-        self.volts_slider.value = volts
-        self.time_slider.value = times
-
     def on_mount(self):
         """
         This method is called when the component is mounted.
-        It checks if the RPC is started, sets up a timer to update Rigol data,
-        and initializes the channel slider value.
+        It checks if the RPC is started and sets up a timer to update the scope panels.
         """
         self.rpc.check_started()
         self.rigol_timer = self.set_interval(0.25, self.update_rigol_data)
-        self.channel_slider.value = self.rigol.get_source()
         
     @work(exclusive=True, thread=True)
     def start_worker(self):
         """
-        Starts the worker by connecting to the Rigol and RPC devices.
+        Starts the worker by starting the instrument threads and the RPC server.
+        The camera window is told as soon as the RPC server is listening.
         If an exception occurs during the connection process, it is logged and the worker is stopped.
         """
         try:
-            self.rigol.connect()
-            self.rpc.connect()
+            self.rpc.listen()
+            self.startup.mark("rpc listening")
+            self.rpc.request("textual_ready")
+            self.startup.mark("camera notified")
+            self.registry.start()
+            self.startup.log()
+            self.rpc.serve()
         except Exception:
             logging.error(f"{traceback.format_exc()}")
             self.stop()
@@ -315,53 +822,27 @@ class TextualWindow(App):
         if self.rigol_timer:
             self.rigol_timer.stop()
         self.rpc.disconnect()
-        self.rigol.disconnect()
+        self.registry.stop()
+        tracer.export("textual_window_trace.json")
         App.exit(self)
 
     def compose(self) -> ComposeResult:
         """ Compose the window """
         self.start_worker()
         with Vertical(classes="main"):
-            yield Label("PWM", classes="header")
-            with Horizontal():
-                yield Label("Duty")
-                yield self.pwm_duty
-                yield self.pwm_duty_slider
-            with Horizontal():
-                yield Label("KHz")
-                yield self.pwm_freq
-                yield self.pwm_freq_slider
-            yield Label("Oscilloscope", classes="header border-top")
-            with Horizontal(classes="right_top height_one"):
-                yield Label("KHz")
-                yield Label("Duty")
-                yield Label("VAmp")
-                yield Label("VAvg")
-            with Horizontal(classes="right_top height_one mag_bot_one"):
-                yield self.scope_hertz
-                yield self.scope_duty
-                yield self.scope_vamp
-                yield self.scope_vavg
-            with Horizontal():
-                yield Label("Channel")
-                yield self.scope_channel
-                yield self.channel_slider
-            with Horizontal():
-                yield Label("Offset")
-                yield self.scope_offset
-                yield self.offset_slider
-            with Horizontal():
-                yield Label("Volts")
-                yield self.scope_volts
-                yield self.volts_slider
-            with Horizontal():
-                yield Label("Time us")
-                yield self.scope_time
-                yield self.time_slider
-            yield Label("Camera", classes="header border-top")
+            yield from self.pwm_panels
+            yield from self.scope_panels
+            yield Label("Camera", classes=self._camera_classes)
             with Horizontal():
                 yield Label("Argumented", classes="long_label")
                 yield self.argumented_switch
+            with Horizontal():
+                yield Label("Record", classes="long_label")
+                yield self.record_switch
+            with self.camera_row:
+                yield Label("Camera")
+                yield self.camera_number
+                yield self.camera_slider
             with Horizontal():
                 yield Label("Auto Focus", classes="long_label")
                 yield self.focus_switch
@@ -381,10 +862,15 @@ class TextualWindow(App):
                 yield Label("Tilt")
                 yield self.camera_tilt
                 yield self.tilt_slider
+            with Horizontal():
+                yield Label("Metrics", classes="long_label")
+                yield self.metrics_switch
+            yield self.metrics_panel
             yield Button("Close", id="quit_btn")
 
 
 if __name__ == "__main__":
+    Kit.parse_args(sys.argv)
     Kit.create_log(file="textual_window.log")
     window = TextualWindow()
     try:
@@ -0,0 +1,241 @@
+""" Timing of the startup steps and tracing of the actions of a window """
+
+import os
+import json
+import time
+import logging
+import functools
+import itertools
+import weakref
+import threading
+import contextlib
+from typing import Callable
+
+from tgutui.kit import Kit
+
+
+class Startup:
+    """ Mark each startup step and log how long every step took """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._began = time.perf_counter()
+        self._marks: list[tuple[str, float]] = []
+
+    def mark(self, step: str):
+        """ Mark the end of a step """
+        self._marks.append((step, time.perf_counter()))
+
+    def log(self):
+        """ Log the time of every step and the total """
+        last = self._began
+        steps = []
+        for step, at in self._marks:
+            steps.append(f"{step} {(at - last) * 1000:.0f}ms")
+            last = at
+        logging.info(f"{self.name} startup {(last - self._began) * 1000:.0f}ms: {', '.join(steps)}")
+
+
+class Histogram:
+    """ Latencies counted in power of two buckets of microseconds """
+
+    BUCKETS = 32
+
+    def __init__(self) -> None:
+        self.counts = [0] * Histogram.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        micros = int(seconds * 1000000)
+        self.counts[min(micros.bit_length(), Histogram.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: "Histogram"):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, fraction: float) -> float:
+        """ Return the upper bound in milliseconds of the bucket holding the percentile """
+        target = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return (1 << bucket) / 1000
+        return 0.0
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max * 1000, 3),
+            "buckets_us": {str(1 << bucket): count for bucket, count in enumerate(self.counts) if count},
+        }
+
+
+class Metrics:
+    """
+    Counters and latency histograms kept per thread and only merged when read,
+    so the hot paths that count never take a lock or contend for a cache line.
+    The counts of a thread that has finished are folded into a retired total,
+    so short lived worker threads do not pile up.
+    """
+
+    def __init__(self) -> None:
+        self.began = time.time()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads: list[tuple[weakref.ref, dict[str, int], dict[str, Histogram]]] = []
+        self._retired: tuple[dict[str, int], dict[str, Histogram]] = ({}, {})
+
+    def _thread(self) -> tuple[dict[str, int], dict[str, Histogram]]:
+        own = getattr(self._local, "own", None)
+        if own is None:
+            own = self._local.own = ({}, {})
+            with self._lock:
+                self._prune()
+                self._threads.append((weakref.ref(threading.current_thread()), *own))
+        return own
+
+    @staticmethod
+    def _fold(into: tuple[dict[str, int], dict[str, Histogram]], counters: dict[str, int], histograms: dict[str, Histogram]):
+        for name, value in list(counters.items()):
+            into[0][name] = into[0].get(name, 0) + value
+        for name, histogram in list(histograms.items()):
+            into[1].setdefault(name, Histogram()).merge(histogram)
+
+    def _prune(self):
+        """ Fold the threads that have finished into the retired total, called with the lock held """
+        alive = []
+        for ref, counters, histograms in self._threads:
+            thread = ref()
+            if thread is not None and thread.is_alive():
+                alive.append((ref, counters, histograms))
+            else:
+                Metrics._fold(self._retired, counters, histograms)
+        self._threads = alive
+
+    def count(self, name: str, n: int = 1):
+        """ Add n to a counter """
+        counters = self._thread()[0]
+        counters[name] = counters.get(name, 0) + n
+
+    def observe(self, name: str, seconds: float):
+        """ Add a latency to a histogram """
+        histograms = self._thread()[1]
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+        histogram.add(seconds)
+
+    @contextlib.contextmanager
+    def timed(self, name: str):
+        """ Observe the time of a block """
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - began)
+
+    def _merged(self) -> tuple[dict[str, int], dict[str, Histogram]]:
+        merged: tuple[dict[str, int], dict[str, Histogram]] = ({}, {})
+        with self._lock:
+            self._prune()
+            Metrics._fold(merged, *self._retired)
+            threads = list(self._threads)
+        for _, counters, histograms in threads:
+            Metrics._fold(merged, counters, histograms)
+        return merged
+
+    def histograms(self) -> dict[str, dict]:
+        """ Return the summary of every histogram across all threads """
+        histograms = self._merged()[1]
+        return {name: histograms[name].summary() for name in sorted(histograms)}
+
+    def snapshot(self) -> dict:
+        """ Return the counters and histogram summaries with the time they were taken """
+        counters, histograms = self._merged()
+        return {
+            "time": time.time(),
+            "uptime": time.time() - self.began,
+            "counters": dict(sorted(counters.items())),
+            "histograms": {name: histograms[name].summary() for name in sorted(histograms)},
+        }
+
+
+class Tracer:
+    """
+    Spans that follow one action, such as a slider change or a frame, through
+    every stage it passes. The trace id lives on the thread, Instrument.submit
+    carries it to the instrument thread and Rpc.request carries it to the other
+    window. Every span adds its time to a histogram of its stage.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self._local = threading.local()
+        self._stages = Metrics()
+        self._ids = itertools.count(1)
+        self._prefix = f"{os.getpid():x}"
+
+    def current(self) -> str | None:
+        """ Return the trace id of this thread """
+        return getattr(self._local, "trace", None)
+
+    @contextlib.contextmanager
+    def trace(self, trace: str | None = None):
+        """ Run under a trace id, a new one unless given """
+        previous = self.current()
+        self._local.trace = trace if trace else f"{self._prefix}-{next(self._ids):x}"
+        try:
+            yield self._local.trace
+        finally:
+            self._local.trace = previous
+
+    @contextlib.contextmanager
+    def span(self, stage: str):
+        """ Time a stage of the current trace """
+        if not self.enabled:
+            yield
+            return
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - began
+            self._stages.observe(stage, elapsed)
+            logging.debug(f"trace {self.current()} {stage} {elapsed * 1000:.3f}ms")
+
+    def traced(self, stage: str) -> Callable:
+        """ Decorate a function to start a new trace with a span around it """
+        def decorator(fn: Callable):
+            @functools.wraps(fn)
+            def decorate(*args, **kwargs):
+                with self.trace(), self.span(stage):
+                    return fn(*args, **kwargs)
+            return decorate
+        return decorator
+
+    def histograms(self) -> dict[str, dict]:
+        """ Return the summary of every stage across all threads """
+        return self._stages.histograms()
+
+    def export(self, path: str):
+        """ Write the histograms to a JSON file """
+        if not self.enabled:
+            return
+        with open(path, "w") as f:
+            json.dump(self.histograms(), f, indent=2)
+        logging.info(f"Trace histograms written to {path}")
+
+
+tracer = Tracer(Kit.TRACE)
+metrics = Metrics()
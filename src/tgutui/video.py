@@ -0,0 +1,104 @@
+""" Video recording of camera frames with a timestamp per frame """
+
+import os
+import time
+import queue
+import logging
+from threading import Thread
+
+import cv2
+import numpy as np
+
+INDEX = ".ts"
+
+
+class VideoRecorder:
+    """
+    Write frames with cv2.VideoWriter on its own thread.
+    Frames are offered through a bounded queue, when the encoder falls behind
+    new frames are dropped and counted rather than blocking the capture loop.
+    The time.time() of every written frame is appended to a float64 index file
+    next to the video, the same clock as ScopeData.time.
+    """
+
+    FOURCC = "mp4v"
+
+    def __init__(self, path: str, fps: float = 30, queue_size: int = 30) -> None:
+        self.path = path
+        self.fps = fps if fps and fps > 0 else 30
+        self.written: int = 0
+        self.dropped: int = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._writer: cv2.VideoWriter = None
+        self._index = None
+        self._failed: bool = False
+        self._thread: Thread = None
+
+    @staticmethod
+    def index_path(path: str) -> str:
+        """ Return the path of the timestamp index of a video """
+        return f"{os.path.splitext(path)[0]}{INDEX}"
+
+    @staticmethod
+    def read_index(path: str) -> np.ndarray:
+        """ Return the frame timestamps of a video as a read only memory mapped view """
+        index = VideoRecorder.index_path(path)
+        if not os.path.exists(index) or os.path.getsize(index) == 0:
+            return np.empty(0)
+        return np.memmap(index, dtype="<f8", mode="r")
+
+    def offer(self, frame: np.ndarray, timestamp: float | None = None) -> bool:
+        """ Queue a frame without blocking, return False if it was dropped """
+        try:
+            self._queue.put_nowait((time.time() if timestamp is None else timestamp, frame))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _open(self, frame: np.ndarray):
+        """ Open the writer with the size of the first frame """
+        height, width = frame.shape[:2]
+        fourcc = cv2.VideoWriter_fourcc(*VideoRecorder.FOURCC)
+        self._writer = cv2.VideoWriter(self.path, fourcc, self.fps, (width, height))
+        if not self._writer.isOpened():
+            raise RuntimeError(f"Unable to open video writer {self.path}")
+        self._index = open(VideoRecorder.index_path(self.path), "wb")
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            timestamp, frame = item
+            if self._failed:
+                continue
+            try:
+                if self._writer is None:
+                    self._open(frame)
+                self._writer.write(frame)
+                self._index.write(np.float64(timestamp).astype("<f8").tobytes())
+                self.written += 1
+            except Exception as e:
+                logging.error(f"Video: {e}")
+                self._failed = True
+
+    def start(self):
+        """ Start the writer thread """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Write the queued frames and close the video """
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
+        if self._writer:
+            self._writer.release()
+        if self._index:
+            self._index.close()
+        self._writer = None
+        self._index = None
+        logging.info(f"Video: {self.path} written {self.written} dropped {self.dropped}")
@@ -0,0 +1,62 @@
+""" The host measurements on generated waveforms with known values """
+
+import numpy as np
+import pytest
+
+from tgutui.measure import Waveform, measure
+from tgutui.rigol import Rigol
+
+HIGH = 3.3
+
+
+def _waveform(freq: float, duty: float, periods: float, points: int = 1200, shape: str = "square") -> Waveform:
+    """ Sample a few periods of a square or sine wave swinging between 0 and HIGH """
+    xinc = periods / freq / points
+    phase = (np.arange(points) * xinc * freq) % 1.0
+    if shape == "sine":
+        volts = HIGH / 2 * (1 + np.sin(2 * np.pi * phase))
+    else:
+        volts = np.where(phase < duty, HIGH, 0.0)
+    return Waveform(channel=1, volts=volts, xinc=xinc)
+
+
+@pytest.mark.parametrize("freq, duty", [(1000.0, 0.25), (5000.0, 0.5), (20000.0, 0.8)])
+def test_square(freq: float, duty: float):
+    result = measure(_waveform(freq, duty, periods=5))
+    assert result.freq == pytest.approx(freq, rel=0.01)
+    assert result.duty == pytest.approx(duty, rel=0.02)
+    assert result.vavg == pytest.approx(duty * HIGH, rel=0.03)
+    assert result.vamp == pytest.approx(HIGH, rel=0.01)
+
+
+@pytest.mark.parametrize("freq", [1000.0, 5000.0, 20000.0])
+def test_sine(freq: float):
+    result = measure(_waveform(freq, 0.5, periods=5, shape="sine"))
+    assert result.freq == pytest.approx(freq, rel=0.01)
+    assert result.duty == pytest.approx(0.5, rel=0.02)
+    assert result.vavg == pytest.approx(HIGH / 2, rel=0.03)
+
+
+def test_short_record_uses_falling_edges():
+    """ 1.2 periods hold one rising edge but two falling ones """
+    result = measure(_waveform(1000.0, 0.1, periods=1.2))
+    assert result.freq == pytest.approx(1000.0, rel=0.01)
+    assert result.duty == pytest.approx(0.1, rel=0.02)
+
+
+def test_flat_signal():
+    result = measure(Waveform(channel=1, volts=np.full(100, 1.5), xinc=1e-6))
+    assert result.freq == 0.0
+    assert result.vavg == pytest.approx(1.5)
+
+
+def test_no_full_period_keeps_scope_value(monkeypatch):
+    """ Less than a period captured, the scope's own frequency and duty are kept """
+    rigol = Rigol(ip="TCPIP::127.0.0.1::5555::SOCKET")
+    scope = {":MEASure:FREQuency?": "5.0e2", ":MEASure:PDUTy?": "1.0e-1"}
+    monkeypatch.setattr(rigol, "capture", lambda channel: _waveform(500.0, 0.1, periods=0.6))
+    monkeypatch.setattr(rigol, "query", lambda cmd: scope[cmd])
+    assert measure(rigol.capture(1)).freq == 0.0
+    result = rigol._host_measure()
+    assert result.freq == pytest.approx(500.0)
+    assert result.duty == pytest.approx(0.1)
@@ -0,0 +1,54 @@
+""" Replaying a recorded video through the Camera interface """
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+from tgutui.replay import Clock, ReplayCamera
+from tgutui.video import VideoRecorder
+
+FRAMES = 10
+START = 1000.0
+
+
+@pytest.fixture
+def video(tmp_path) -> str:
+    path = str(tmp_path / "replay.mp4")
+    recorder = VideoRecorder(path, fps=30)
+    recorder.start()
+    for count in range(FRAMES):
+        frame = np.full((48, 64, 3), count * 20, dtype=np.uint8)
+        # Offered one at a time so none is dropped from the bounded queue
+        while not recorder.offer(frame, START + count / 30):
+            time.sleep(0.01)
+    recorder.stop()
+    assert recorder.written == FRAMES
+    return path
+
+
+def _replay(path: str) -> tuple[ReplayCamera, list[np.ndarray]]:
+    """ Replay in real time, the camera only keeps its newest frame, and read until the video runs out """
+    camera = ReplayCamera(path, Clock(START, speed=1, wall=time.time() + 0.2))
+    frames = []
+    with camera:
+        while (frame := camera.read(timeout=1.0)) is not None:
+            frames.append(frame.copy())
+    return camera, frames
+
+
+def test_replay_all_frames(video: str):
+    camera, frames = _replay(video)
+    assert len(frames) == FRAMES
+    assert frames[0].shape == (48, 64, 3)
+    assert camera.data.width == 64
+    # The frames come back in the order they were written
+    means = [frame.mean() for frame in frames]
+    assert means == sorted(means)
+
+
+def test_replay_without_index(video: str):
+    os.remove(VideoRecorder.index_path(video))
+    _, frames = _replay(video)
+    assert len(frames) == FRAMES
@@ -0,0 +1,58 @@
+""" The host measurements against the simulated scope's own :MEASure values """
+
+import pytest
+
+from tgutui.kit import Kit
+from tgutui.measure import measure
+from tgutui.rigol import Rigol
+from tgutui.sim import SimScope, SimSignal
+
+
+@pytest.fixture
+def signal() -> SimSignal:
+    return SimSignal(freq=1000.0, duty=25.0)
+
+
+@pytest.fixture
+def rigol(signal: SimSignal, monkeypatch):
+    monkeypatch.setattr(Kit, "USE_RIGOL", True)
+    scope = SimScope(signal, port=0)
+    scope.start()
+    rigol = Rigol(ip=f"TCPIP::127.0.0.1::{scope.address[1]}::SOCKET")
+    rigol.connect()
+    yield rigol
+    rigol.disconnect()
+    scope.stop()
+
+
+def _compare(rigol: Rigol, fields: list[str], periods: int = 5):
+    """ Capture a few periods on channel 1 and compare the host and scope measurements """
+    freq = rigol._scope_value(":MEASure:FREQuency?")
+    rigol.set_time(periods / freq / 12)
+    host = measure(rigol.capture(1))
+    scope = rigol._scope_measure()
+    for field in fields:
+        assert getattr(host, field) == pytest.approx(getattr(scope, field), rel=0.03), field
+
+
+@pytest.mark.parametrize("freq, duty", [(1000.0, 25.0), (5000.0, 50.0), (20000.0, 80.0)])
+def test_square(rigol: Rigol, signal: SimSignal, freq: float, duty: float):
+    signal.set(freq, duty)
+    _compare(rigol, ["freq", "duty", "vavg", "vamp"])
+
+
+@pytest.mark.parametrize("freq", [1000.0, 5000.0, 20000.0])
+def test_sine(rigol: Rigol, signal: SimSignal, freq: float):
+    signal.shape = "sine"
+    signal.set(freq, 50.0)
+    # The base and top of a sine are not its peaks, so only the timing and mean are compared
+    _compare(rigol, ["freq", "duty", "vavg"])
+
+
+def test_no_full_period_keeps_scope_value(rigol: Rigol, signal: SimSignal, monkeypatch):
+    monkeypatch.setattr(Kit, "HOST_MEASURE", True)
+    signal.set(500.0, 10.0)
+    assert measure(rigol.capture(1)).freq == 0.0
+    rigol.update()
+    assert float(rigol.data.freq) == pytest.approx(0.5, rel=0.03)
+    assert rigol.measurement.duty == pytest.approx(0.1, rel=0.03)
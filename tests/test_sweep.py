@@ -0,0 +1,26 @@
+""" The sweep's setpoint grid """
+
+import pytest
+
+from tgutui.sweep import grid
+
+
+def test_grid_list():
+    assert grid("10,50,90") == [10.0, 50.0, 90.0]
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("1:100:10", [1, 11, 21, 31, 41, 51, 61, 71, 81, 91]),
+    ("0:100:25", [0, 25, 50, 75, 100]),
+    ("0:0.3:0.1", [0, 0.1, 0.2, 0.3]),
+    ("10:1:-3", [10, 7, 4, 1]),
+    ("5:5:1", [5]),
+])
+def test_grid_range_stops_at_stop(spec: str, expected: list[float]):
+    assert grid(spec) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("spec", ["1:10:0", "10:1:1", "1:10:-1"])
+def test_grid_bad_step(spec: str):
+    with pytest.raises(ValueError):
+        grid(spec)